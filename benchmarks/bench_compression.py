@@ -0,0 +1,114 @@
+# Copyright (C) 2024  The publishing-tools Project by the Science HPC Center at UCPH
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import argparse
+import os
+import sys
+import time
+
+from publish.compression import (
+    CompressionTypes,
+    compression_available,
+    i_compress,
+    COMPRESSION_BLOCK_SIZE,
+)
+
+SCRIPT_NAME = __file__
+# The chunk size in which podman streams an image archive
+STREAM_CHUNK_SIZE = 2 * 1024 * 1024
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        prog=SCRIPT_NAME,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--size",
+        "-s",
+        type=int,
+        default=256,
+        help="Size in MiB of the generated content to compress.",
+    )
+    parser.add_argument(
+        "--compression",
+        "-c",
+        nargs="+",
+        default=[CompressionTypes.GZIP.value, CompressionTypes.XZ.value],
+        choices=[compression.value for compression in CompressionTypes],
+        help="The compressions to benchmark.",
+    )
+    parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="The number of threads that the blocks are compressed by, which is compared against a single thread.",
+    )
+    parser.add_argument(
+        "--block-size",
+        "-b",
+        type=int,
+        default=COMPRESSION_BLOCK_SIZE // (1024 * 1024),
+        help="Size in MiB of the blocks that are compressed independently.",
+    )
+    return parser.parse_args(args=args)
+
+
+def generate_content(size_mib):
+    # Half random and half repeated content, such that it compresses like a typical layer
+    repeated_chunk = b"publishing-tools" * (512 * 1024 // 16)
+    return [os.urandom(512 * 1024) + repeated_chunk for _ in range(size_mib)]
+
+
+def stream(content):
+    data = b"".join(content)
+    for offset in range(0, len(data), STREAM_CHUNK_SIZE):
+        yield data[offset : offset + STREAM_CHUNK_SIZE]
+
+
+def main(args):
+    parsed_args = parse_args(args)
+    content = generate_content(parsed_args.size)
+    size_gb = parsed_args.size * 1024 * 1024 / 1e9
+    block_size = parsed_args.block_size * 1024 * 1024
+
+    print(f"Compressing {parsed_args.size} MiB in {parsed_args.block_size} MiB blocks")
+    for compression in parsed_args.compression:
+        if not compression_available(compression):
+            print(f"{compression:>6}: not available")
+            continue
+        for workers in sorted({1, parsed_args.workers}):
+            start = time.perf_counter()
+            compressed_size = sum(
+                len(block)
+                for block in i_compress(
+                    stream(content),
+                    compression,
+                    block_size=block_size,
+                    workers=workers,
+                )
+            )
+            elapsed = time.perf_counter() - start
+            ratio = compressed_size / (parsed_args.size * 1024 * 1024)
+            print(
+                f"{compression:>6} ({workers:>3} workers): {elapsed:8.3f}s {size_gb / elapsed:8.3f} GB/s ratio {ratio:.3f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
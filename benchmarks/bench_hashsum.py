@@ -0,0 +1,119 @@
+# Copyright (C) 2024  The publishing-tools Project by the Science HPC Center at UCPH
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import time
+
+from publish.utils.io import hashsum
+
+SCRIPT_NAME = __file__
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        prog=SCRIPT_NAME,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--size",
+        "-s",
+        type=int,
+        default=1024,
+        help="Size in MiB of the generated file to hash.",
+    )
+    parser.add_argument(
+        "--algorithm",
+        "-a",
+        default="sha256",
+        help="The hashlib algorithm to benchmark.",
+    )
+    parser.add_argument(
+        "--repeat",
+        "-r",
+        type=int,
+        default=3,
+        help="How many times each engine is run. The best run is reported.",
+    )
+    parser.add_argument(
+        "--directory",
+        "-d",
+        default=None,
+        help="Directory in which the benchmark file is generated.",
+    )
+    return parser.parse_args(args=args)
+
+
+def legacy_hashsum(path, algorithm="sha256", buffer_size=65536):
+    # The read loop that hashsum used before the readinto engine
+    hash_algorithm = hashlib.new(algorithm)
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(buffer_size), b""):
+            hash_algorithm.update(chunk)
+    return hash_algorithm.hexdigest()
+
+
+def generate_file(directory, size_mib):
+    fd, path = tempfile.mkstemp(prefix="bench_hashsum_", dir=directory)
+    chunk = os.urandom(1024 * 1024)
+    with os.fdopen(fd, "wb") as fh:
+        for _ in range(size_mib):
+            fh.write(chunk)
+    return path
+
+
+def best_run(func, repeat):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def main(args):
+    parsed_args = parse_args(args)
+    path = generate_file(parsed_args.directory, parsed_args.size)
+    size_gb = parsed_args.size * 1024 * 1024 / 1e9
+    algorithm = parsed_args.algorithm
+
+    engines = {
+        "read (64KiB)": lambda: legacy_hashsum(path, algorithm=algorithm),
+        "readinto": lambda: hashsum(path, algorithm=algorithm),
+        "mmap": lambda: hashsum(path, algorithm=algorithm, use_mmap=True),
+    }
+    try:
+        digests = set()
+        print(f"Hashing {parsed_args.size} MiB with {algorithm}")
+        for name, engine in engines.items():
+            elapsed, digest = best_run(engine, parsed_args.repeat)
+            digests.add(digest)
+            print(f"{name:>14}: {elapsed:8.3f}s {size_gb / elapsed:8.3f} GB/s")
+        if len(digests) != 1:
+            print("The engines produced different digests")
+            return 1
+    finally:
+        os.remove(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
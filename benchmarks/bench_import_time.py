@@ -0,0 +1,131 @@
+# Copyright (C) 2024  The publishing-tools Project by the Science HPC Center at UCPH
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+SCRIPT_NAME = __file__
+
+# The modules that are imported when each of the tools are started
+ENTRY_POINT_MODULES = [
+    "publish.cli.publish",
+    "publish.cli.sign",
+    "publish.cli.verify",
+    "publish.cli.checksum",
+]
+
+# Modules that are only needed for container images or YAML files,
+# and therefore must not be imported when the tools are started
+LAZY_MODULES = ["asyncio", "podman", "requests", "sqlite3", "urllib3", "yaml"]
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        prog=SCRIPT_NAME,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--modules",
+        "-m",
+        nargs="+",
+        default=ENTRY_POINT_MODULES,
+        help="The modules whose import time is measured.",
+    )
+    parser.add_argument(
+        "--repeat",
+        "-r",
+        type=int,
+        default=5,
+        help="How many times each module is imported in a fresh interpreter.",
+    )
+    parser.add_argument(
+        "--max-ms",
+        type=float,
+        default=None,
+        help="Fail if the median import time of a module exceeds this many milliseconds.",
+    )
+    parser.add_argument(
+        "--top",
+        "-t",
+        type=int,
+        default=5,
+        help="How many of the slowest imports of each module are listed.",
+    )
+    return parser.parse_args(args=args)
+
+
+def import_time(module):
+    """
+    Import `module` in a fresh interpreter with `-X importtime`.
+    Returns the cumulative import times in microseconds of every imported module
+    and the names of the modules that were loaded.
+    """
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            f"import sys, {module}; print(' '.join(sys.modules))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # import time: <self us> | <cumulative us> | <indented module name>
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if name.strip() == "site":
+            # Discard the modules that are imported by the interpreter start up
+            times = {}
+            continue
+        times[name.strip()] = int(cumulative)
+    return times, set(result.stdout.split())
+
+
+def main(args):
+    parsed_args = parse_args(args)
+    return_code = 0
+    for module in parsed_args.modules:
+        runs, loaded_modules = [], set()
+        for _ in range(parsed_args.repeat):
+            times, loaded_modules = import_time(module)
+            runs.append(times)
+        median_ms = statistics.median(times[module] for times in runs) / 1000
+        print(f"{module:>24}: {median_ms:8.1f} ms")
+
+        slowest = sorted(runs[-1].items(), key=lambda item: item[1], reverse=True)
+        slowest = [(name, cumulative) for name, cumulative in slowest if name != module]
+        for name, cumulative in slowest[: parsed_args.top]:
+            print(f"{'':>26}{name}: {cumulative / 1000:.1f} ms")
+
+        lazy_loaded = [name for name in LAZY_MODULES if name in loaded_modules]
+        if lazy_loaded:
+            print(f"{module} imports: {', '.join(lazy_loaded)} at start up")
+            return_code = 1
+        if parsed_args.max_ms is not None and median_ms > parsed_args.max_ms:
+            print(f"{module} exceeds the maximum of {parsed_args.max_ms} ms")
+            return_code = 1
+    return return_code
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
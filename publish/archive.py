@@ -0,0 +1,276 @@
+# Copyright (C) 2024  The publishing-tools Project by the Science HPC Center at UCPH
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import copy
+import hashlib
+import io
+import json
+import os
+import re
+import tarfile
+from publish.utils.io import IterableReader, temporary_path
+from publish.common import StrEnum
+
+DOCKER_ARCHIVE_MANIFEST = "manifest.json"
+# Layers in a docker-archive that are named by the sha256 digest of their content
+DOCKER_ARCHIVE_LAYER_NAME = re.compile(r"^([0-9a-f]{64})\.tar$")
+# The manifest of a delta archive, which describes how the full archive is recombined
+DELTA_MANIFEST = "delta.json"
+DELTA_MANIFEST_VERSION = 1
+ARCHIVE_BUFFER_SIZE = 1024 * 1024
+
+
+class DeltaSources(StrEnum):
+    # The member is stored in the delta archive
+    DELTA = "delta"
+    # The member is taken from the baseline archive
+    BASELINE = "baseline"
+
+
+class DigestReader:
+    """
+    A binary reader that calculates the sha256 digest of the content that is read through it.
+    """
+
+    def __init__(self, fh):
+        self.fh = fh
+        self.hasher = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.fh.read(size)
+        self.hasher.update(data)
+        return data
+
+    def digest(self):
+        return f"sha256:{self.hasher.hexdigest()}"
+
+
+class HashedWriter:
+    """
+    A binary writer that updates the `hashers` with the content that is written through it.
+    """
+
+    def __init__(self, fh, hashers=None):
+        self.fh = fh
+        self.hashers = hashers or {}
+
+    def write(self, data):
+        for hasher in self.hashers.values():
+            hasher.update(data)
+        return self.fh.write(data)
+
+
+def layer_digest(member_name):
+    """
+    Return the digest of a docker-archive layer that is named by its digest, otherwise None.
+    """
+    match = DOCKER_ARCHIVE_LAYER_NAME.match(os.path.basename(member_name))
+    if not match:
+        return None
+    return f"sha256:{match[1]}"
+
+
+def read_archive_layers(archive_path):
+    """
+    Read the layers of the images in the docker-archive at `archive_path` from its manifest.json.
+    Returns the manifest.json content and a dictionary that maps the digest of each layer
+    to its name in the archive, or None if the archive can't be read.
+    Layers that are not named by their digest are hashed to find their digest.
+    """
+    try:
+        with tarfile.open(archive_path, "r:") as archive:
+            manifest_content = archive.extractfile(DOCKER_ARCHIVE_MANIFEST).read()
+            layers = {}
+            for image in json.loads(manifest_content):
+                for layer in image.get("Layers", []):
+                    digest = layer_digest(layer)
+                    if not digest:
+                        reader = DigestReader(archive.extractfile(layer))
+                        while reader.read(ARCHIVE_BUFFER_SIZE):
+                            pass
+                        digest = reader.digest()
+                    layers[digest] = layer
+    except (OSError, tarfile.TarError, KeyError, ValueError, AttributeError) as err:
+        print("Failed to read the archive layers: {} - {}".format(archive_path, err))
+        return None
+    return manifest_content, layers
+
+
+def write_delta_archive(
+    i_archive, destination, baseline_path, hashers=None, verbose=False
+):
+    """
+    Write the streamed docker-archive `i_archive` to `destination` as a delta archive,
+    which only holds the members that are not in the baseline docker-archive at `baseline_path`.
+    The layers in the baseline are found by the digests in its manifest.json.
+    The delta archive ends with a delta.json manifest, which lists every member of the full archive
+    and where it is stored, such that `recombine_delta_archive` can recreate the full archive.
+    If `hashers` are provided, they are updated with the delta archive as it is written.
+
+    Returns the statistics of the delta, or False on failure.
+    """
+    baseline = read_archive_layers(baseline_path)
+    if not baseline:
+        return False
+    baseline_manifest, baseline_layers = baseline
+
+    stats = {
+        "members": 0,
+        "delta_members": 0,
+        "delta_bytes": 0,
+        "baseline_members": 0,
+        "baseline_bytes": 0,
+    }
+    members = []
+    reader = io.BufferedReader(IterableReader(i_archive), ARCHIVE_BUFFER_SIZE)
+    # The archive is written to a temporary file next to the destination,
+    # which only replaces the destination once the archive is complete
+    tmp_destination = temporary_path(destination)
+    try:
+        with open(tmp_destination, "wb") as fh, tarfile.open(
+            fileobj=HashedWriter(fh, hashers), mode="w|"
+        ) as delta, tarfile.open(fileobj=reader, mode="r|") as archive:
+            for member in archive:
+                stats["members"] += 1
+                digest = layer_digest(member.name) if member.isfile() else None
+                if digest and digest in baseline_layers:
+                    members.append(
+                        {
+                            "name": member.name,
+                            "source": DeltaSources.BASELINE,
+                            "baseline_name": baseline_layers[digest],
+                            "digest": digest,
+                            "size": member.size,
+                        }
+                    )
+                    stats["baseline_members"] += 1
+                    stats["baseline_bytes"] += member.size
+                    continue
+
+                members.append({"name": member.name, "source": DeltaSources.DELTA})
+                if member.isfile():
+                    delta.addfile(member, archive.extractfile(member))
+                else:
+                    delta.addfile(member)
+                stats["delta_members"] += 1
+                stats["delta_bytes"] += member.size
+
+            delta_manifest = json.dumps(
+                {
+                    "version": DELTA_MANIFEST_VERSION,
+                    "baseline": os.path.basename(baseline_path),
+                    "baseline_manifest_digest": "sha256:{}".format(
+                        hashlib.sha256(baseline_manifest).hexdigest()
+                    ),
+                    "members": members,
+                },
+                indent=2,
+            ).encode()
+            delta_manifest_member = tarfile.TarInfo(DELTA_MANIFEST)
+            delta_manifest_member.size = len(delta_manifest)
+            delta.addfile(delta_manifest_member, io.BytesIO(delta_manifest))
+        os.replace(tmp_destination, destination)
+    except (OSError, tarfile.TarError) as err:
+        print("Failed to write the delta archive: {} - {}".format(destination, err))
+        if os.path.exists(tmp_destination):
+            os.remove(tmp_destination)
+        return False
+
+    if verbose:
+        print(
+            f"Wrote {stats['delta_members']} of {stats['members']} members ({stats['delta_bytes']} bytes) to: {destination}, reusing {stats['baseline_members']} layers ({stats['baseline_bytes']} bytes) from: {baseline_path}"
+        )
+    return stats
+
+
+def write_recombined_members(delta, baseline_archive, baseline_manifest, archive):
+    delta_manifest = json.loads(delta.extractfile(DELTA_MANIFEST).read())
+    baseline_manifest_digest = "sha256:{}".format(
+        hashlib.sha256(baseline_manifest).hexdigest()
+    )
+    if delta_manifest["baseline_manifest_digest"] != baseline_manifest_digest:
+        print(
+            "Failed to recombine the delta archive: {} - it was not created from the baseline: {}".format(
+                delta.name, baseline_archive.name
+            )
+        )
+        return False
+
+    for entry in delta_manifest["members"]:
+        if entry["source"] == DeltaSources.DELTA:
+            member = delta.getmember(entry["name"])
+            if member.isfile():
+                archive.addfile(member, delta.extractfile(member))
+            else:
+                archive.addfile(member)
+            continue
+
+        member = copy.copy(baseline_archive.getmember(entry["baseline_name"]))
+        reader = DigestReader(baseline_archive.extractfile(member))
+        member.name = entry["name"]
+        archive.addfile(member, reader)
+        if reader.digest() != entry["digest"]:
+            print(
+                "Failed to recombine the delta archive: {} - the baseline layer: {} does not match its digest: {}".format(
+                    delta.name, entry["baseline_name"], entry["digest"]
+                )
+            )
+            return False
+    return True
+
+
+def recombine_delta_archive(
+    delta_path, baseline_path, destination, hashers=None, verbose=False
+):
+    """
+    Recombine the delta archive at `delta_path`, see `write_delta_archive`,
+    with the baseline archive at `baseline_path` into a full docker-archive at `destination`,
+    which can be loaded like the archive that the delta was created from.
+    The layers that are taken from the baseline are verified against their digest.
+    If `hashers` are provided, they are updated with the full archive as it is written.
+    """
+    baseline = read_archive_layers(baseline_path)
+    if not baseline:
+        return False
+    baseline_manifest, _ = baseline
+
+    recombined = False
+    tmp_destination = temporary_path(destination)
+    try:
+        with tarfile.open(delta_path, "r:") as delta, tarfile.open(
+            baseline_path, "r:"
+        ) as baseline_archive, open(tmp_destination, "wb") as fh, tarfile.open(
+            fileobj=HashedWriter(fh, hashers), mode="w|"
+        ) as archive:
+            recombined = write_recombined_members(
+                delta, baseline_archive, baseline_manifest, archive
+            )
+        if recombined:
+            os.replace(tmp_destination, destination)
+    except (OSError, tarfile.TarError, KeyError, ValueError) as err:
+        print("Failed to recombine the delta archive: {} - {}".format(delta_path, err))
+        recombined = False
+    if not recombined:
+        # A partially recombined archive must not be mistaken for a loadable one
+        if os.path.exists(tmp_destination):
+            os.remove(tmp_destination)
+        return False
+
+    if verbose:
+        print(
+            f"Recombined the delta archive: {delta_path} with the baseline: {baseline_path} into: {destination}"
+        )
+    return True
@@ -0,0 +1,465 @@
+# Copyright (C) 2024  The publishing-tools Project by the Science HPC Center at UCPH
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import os
+import json
+import time
+import threading
+from publish.utils.io import makedirs, exists
+
+CACHE_DIR_NAME = "publishing-tools"
+CHECKSUM_CACHE_FILE = "checksums.sqlite"
+CHECKSUM_CACHE_MAX_ENTRIES = 100000
+# Setting this environment variable to a non-empty value enables the checksum cache
+# for every checksum calculation that does not explicitly select a cache.
+CHECKSUM_CACHE_ENV = "PUBLISH_CHECKSUM_CACHE"
+VERIFICATION_CACHE_FILE = "verifications.sqlite"
+VERIFICATION_CACHE_MAX_ENTRIES = 10000
+# Seconds that a successful verification is trusted before the signature is verified again
+VERIFICATION_CACHE_TTL = 24 * 60 * 60
+# Setting this environment variable to a non-empty value enables the verification cache
+# for every verification that does not explicitly select a cache.
+VERIFICATION_CACHE_ENV = "PUBLISH_VERIFICATION_CACHE"
+ARCHIVE_CACHE_FILE = "archives.sqlite"
+ARCHIVE_CACHE_MAX_ENTRIES = 1000
+# Setting this environment variable to a non-empty value enables the archive cache
+# for every container image archive publication that does not explicitly select a cache.
+ARCHIVE_CACHE_ENV = "PUBLISH_ARCHIVE_CACHE"
+
+# The shared default cache of each cache type, see `_get_cache`
+_default_caches = {}
+_default_caches_lock = threading.Lock()
+
+
+def get_cache_dir():
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if not cache_home:
+        cache_home = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, CACHE_DIR_NAME)
+
+
+def file_identity(file_stat):
+    return (
+        file_stat.st_dev,
+        file_stat.st_ino,
+        file_stat.st_size,
+        file_stat.st_mtime_ns,
+    )
+
+
+class SQLiteCache:
+    """
+    A persistent SQLite cache of a single `table`, in which each row is identified by the
+    `key_columns` and the `columns` are the column definitions of the whole row.
+    The cache is bounded to `max_entries` rows, where the least recently used ones are evicted.
+    """
+
+    name = None
+    table = None
+    columns = ()
+    key_columns = ()
+    filename = None
+
+    def __init__(self, path=None, max_entries=None):
+        if not path:
+            path = os.path.join(get_cache_dir(), self.filename)
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = None
+
+    def connect(self):
+        if self.connection:
+            return self.connection
+        cache_dir = os.path.dirname(self.path)
+        if cache_dir and not exists(cache_dir) and not makedirs(cache_dir):
+            return None
+        # sqlite3 is only imported when a cache is used to keep the start up time of the tools low
+        import sqlite3
+
+        try:
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS {} ({}, last_used REAL NOT NULL, PRIMARY KEY ({}))".format(
+                    self.table, ", ".join(self.columns), ", ".join(self.key_columns)
+                )
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS {0}_last_used ON {0} (last_used)".format(
+                    self.table
+                )
+            )
+            connection.commit()
+        except sqlite3.Error as err:
+            print(
+                "Failed to open the {} cache: {} - {}".format(self.name, self.path, err)
+            )
+            return None
+        self.connection = connection
+        return self.connection
+
+    def query(self, function, action="read", default=None):
+        """
+        Call `function` with the connection of the cache and commit what it changed.
+        Returns the result of `function`, or `default` if the cache can't be used.
+        """
+        import sqlite3
+
+        with self.lock:
+            connection = self.connect()
+            if not connection:
+                return default
+            try:
+                result = function(connection)
+                connection.commit()
+            except sqlite3.Error as err:
+                print(
+                    "Failed to {} the {} cache: {} - {}".format(
+                        action, self.name, self.path, err
+                    )
+                )
+                return default
+        return result
+
+    def key_condition(self):
+        return " AND ".join(f"{column} = ?" for column in self.key_columns)
+
+    def lookup(self, connection, value_columns, key, is_valid=None):
+        """
+        Return the `value_columns` of the row that is identified by `key`, or None if there is none.
+        A row that `is_valid` rejects is deleted.
+        """
+        row = connection.execute(
+            "SELECT {} FROM {} WHERE {}".format(
+                ", ".join(value_columns), self.table, self.key_condition()
+            ),
+            key,
+        ).fetchone()
+        if row and is_valid and not is_valid(row):
+            connection.execute(
+                "DELETE FROM {} WHERE {}".format(self.table, self.key_condition()), key
+            )
+            row = None
+        if not row:
+            self.misses += 1
+            return None
+        connection.execute(
+            "UPDATE {} SET last_used = ? WHERE {}".format(
+                self.table, self.key_condition()
+            ),
+            (time.time(),) + tuple(key),
+        )
+        self.hits += 1
+        return row
+
+    def store(self, row):
+        """
+        Insert or replace the `row`, which holds a value for each of the `columns`.
+        """
+
+        def insert(connection):
+            connection.execute(
+                "INSERT OR REPLACE INTO {} VALUES ({})".format(
+                    self.table, ", ".join("?" * (len(self.columns) + 1))
+                ),
+                tuple(row) + (time.time(),),
+            )
+            self.evict(connection)
+            return True
+
+        return self.query(insert, action="write to", default=False)
+
+    def evict(self, connection):
+        (entries,) = connection.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        if entries <= self.max_entries:
+            return
+        connection.execute(
+            """DELETE FROM {0} WHERE rowid IN (
+                SELECT rowid FROM {0} ORDER BY last_used ASC LIMIT ?
+            )""".format(self.table),
+            (entries - self.max_entries,),
+        )
+
+    def clear(self):
+        return self.query(
+            lambda connection: bool(connection.execute(f"DELETE FROM {self.table}")),
+            action="clear",
+            default=False,
+        )
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self.lock:
+            if self.connection:
+                self.connection.close()
+                self.connection = None
+
+
+def _get_cache(cache, env_var, cls):
+    """
+    Resolve which cache of the `cls` type should be used.
+    A `cache` of False disables the cache and an instance of `cls` is used as is.
+    True selects the shared default cache, which None also does if the cache
+    has been enabled via the `env_var` environment variable.
+    """
+    if cache is False:
+        return None
+    if cache is None and not os.environ.get(env_var):
+        return None
+    if isinstance(cache, cls):
+        return cache
+    # The caches are resolved by concurrent workers, which must share a single instance
+    with _default_caches_lock:
+        if cls not in _default_caches:
+            _default_caches[cls] = cls()
+        return _default_caches[cls]
+
+
+class ChecksumCache(SQLiteCache):
+    """
+    A persistent SQLite cache of file digests that is keyed by the device, inode,
+    size and modification time of the file, such that an unchanged file is not hashed again.
+    The cache is bounded to `max_entries` digests, where the least recently used ones are evicted.
+    """
+
+    name = "checksum"
+    table = "checksums"
+    columns = (
+        "device INTEGER NOT NULL",
+        "inode INTEGER NOT NULL",
+        "size INTEGER NOT NULL",
+        "mtime_ns INTEGER NOT NULL",
+        "algorithm TEXT NOT NULL",
+        "digest TEXT NOT NULL",
+    )
+    key_columns = ("device", "inode", "size", "mtime_ns", "algorithm")
+    filename = CHECKSUM_CACHE_FILE
+
+    def __init__(self, path=None, max_entries=CHECKSUM_CACHE_MAX_ENTRIES):
+        super().__init__(path=path, max_entries=max_entries)
+
+    def get(self, path, algorithm, file_stat=None):
+        """
+        Return the cached digest of `path` for `algorithm`, or None if it is not cached.
+        """
+        try:
+            if not file_stat:
+                file_stat = os.stat(path)
+        except OSError:
+            return None
+
+        key = file_identity(file_stat) + (str(algorithm),)
+        row = self.query(lambda connection: self.lookup(connection, ["digest"], key))
+        if not row:
+            return None
+        return row[0]
+
+    def set(self, path, algorithm, digest, file_stat=None):
+        try:
+            if not file_stat:
+                file_stat = os.stat(path)
+        except OSError:
+            return False
+        return self.store(file_identity(file_stat) + (str(algorithm), digest))
+
+
+def get_checksum_cache(cache=None):
+    """
+    Resolve which checksum cache should be used, see `_get_cache`,
+    which can be enabled via the PUBLISH_CHECKSUM_CACHE environment variable.
+    """
+    return _get_cache(cache, CHECKSUM_CACHE_ENV, ChecksumCache)
+
+
+class VerificationCache(SQLiteCache):
+    """
+    A persistent SQLite cache of successful signature verifications.
+    Each verification is stored under a digest of everything that the outcome depends on,
+    see `publish.signature.verification_cache_key`, such that a changed file,
+    signature or keyring results in a new verification.
+    Verifications expire after `ttl` seconds and the cache is bounded to `max_entries`
+    verifications, where the least recently used ones are evicted.
+    """
+
+    name = "verification"
+    table = "verifications"
+    columns = (
+        "key BLOB NOT NULL",
+        "result TEXT NOT NULL",
+        "verified_at REAL NOT NULL",
+    )
+    key_columns = ("key",)
+    filename = VERIFICATION_CACHE_FILE
+
+    def __init__(
+        self,
+        path=None,
+        max_entries=VERIFICATION_CACHE_MAX_ENTRIES,
+        ttl=VERIFICATION_CACHE_TTL,
+    ):
+        super().__init__(path=path, max_entries=max_entries)
+        self.ttl = ttl
+
+    def get(self, key):
+        """
+        Return the cached result of the verification that is identified by `key`,
+        or None if it is not cached or has expired.
+        """
+        expires_before = time.time() - self.ttl
+        row = self.query(
+            lambda connection: self.lookup(
+                connection,
+                ["result", "verified_at"],
+                (key,),
+                is_valid=lambda row: row[1] >= expires_before,
+            )
+        )
+        if not row:
+            return None
+        return json.loads(row[0])
+
+    def set(self, key, result):
+        return self.store((key, json.dumps(result), time.time()))
+
+    def evict(self, connection):
+        connection.execute(
+            "DELETE FROM {} WHERE verified_at < ?".format(self.table),
+            (time.time() - self.ttl,),
+        )
+        super().evict(connection)
+
+
+def get_verification_cache(cache=None):
+    """
+    Resolve which verification cache should be used, see `_get_cache`,
+    which can be enabled via the PUBLISH_VERIFICATION_CACHE environment variable.
+    """
+    return _get_cache(cache, VERIFICATION_CACHE_ENV, VerificationCache)
+
+
+class ArchiveCache(SQLiteCache):
+    """
+    A persistent SQLite cache of published container image archives.
+    Each archive is stored under the id and tags of the image it was saved from and the compression
+    it was written with, together with the identity and digests of the archive file, such that a later
+    publication of the unchanged image can reuse the archive instead of saving the image again.
+    An archive that has been changed or removed since it was cached is no longer returned.
+    The cache is bounded to `max_entries` archives, where the least recently used ones are evicted.
+    """
+
+    name = "archive"
+    table = "archives"
+    columns = (
+        "image_id TEXT NOT NULL",
+        "tags TEXT NOT NULL",
+        "compression TEXT NOT NULL",
+        "compression_level INTEGER NOT NULL",
+        "path TEXT NOT NULL",
+        "device INTEGER NOT NULL",
+        "inode INTEGER NOT NULL",
+        "size INTEGER NOT NULL",
+        "mtime_ns INTEGER NOT NULL",
+        "digests TEXT NOT NULL",
+        "uncompressed_digests TEXT NOT NULL",
+    )
+    key_columns = ("image_id", "tags", "compression", "compression_level")
+    filename = ARCHIVE_CACHE_FILE
+
+    def __init__(self, path=None, max_entries=ARCHIVE_CACHE_MAX_ENTRIES):
+        super().__init__(path=path, max_entries=max_entries)
+
+    def archive_key(self, image_id, tags, compression, compression_level):
+        return (
+            image_id,
+            json.dumps(sorted(tags or [])),
+            str(compression or ""),
+            compression_level or 0,
+        )
+
+    def get(self, image_id, tags=None, compression=None, compression_level=None):
+        """
+        Return the cached archive of the image with `image_id` and `tags` that was written
+        with `compression`, as a dictionary of its path, size, digests and the digests
+        of its uncompressed content, or None if no unchanged archive is cached.
+        """
+
+        def is_unchanged(row):
+            try:
+                return file_identity(os.stat(row[0])) == tuple(row[1:5])
+            except OSError:
+                return False
+
+        key = self.archive_key(image_id, tags, compression, compression_level)
+        row = self.query(
+            lambda connection: self.lookup(
+                connection,
+                [
+                    "path",
+                    "device",
+                    "inode",
+                    "size",
+                    "mtime_ns",
+                    "digests",
+                    "uncompressed_digests",
+                ],
+                key,
+                is_valid=is_unchanged,
+            )
+        )
+        if not row:
+            return None
+        return {
+            "path": row[0],
+            "size": row[3],
+            "digests": json.loads(row[5]),
+            "uncompressed_digests": json.loads(row[6]),
+        }
+
+    def set(
+        self,
+        image_id,
+        tags,
+        path,
+        digests=None,
+        uncompressed_digests=None,
+        compression=None,
+        compression_level=None,
+        file_stat=None,
+    ):
+        try:
+            if not file_stat:
+                file_stat = os.stat(path)
+        except OSError:
+            return False
+        return self.store(
+            self.archive_key(image_id, tags, compression, compression_level)
+            + (os.path.abspath(path),)
+            + file_identity(file_stat)
+            + (json.dumps(digests or {}), json.dumps(uncompressed_digests or {}))
+        )
+
+
+def get_archive_cache(cache=None):
+    """
+    Resolve which archive cache should be used, see `_get_cache`,
+    which can be enabled via the PUBLISH_ARCHIVE_CACHE environment variable.
+    """
+    return _get_cache(cache, ARCHIVE_CACHE_ENV, ArchiveCache)
@@ -14,33 +14,527 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
-from publish.utils.io import hashsum, write, exists, load
-from publish.common import StrEnum
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import json
+from publish.utils.io import (
+    hashsums,
+    hash_file,
+    new_hashers,
+    hexdigests,
+    is_tree_algorithm,
+    write,
+    exists,
+    load,
+    load_json,
+    TreeHasher,
+    TREE_CHUNK_SIZE,
+)
+from publish.cache import get_checksum_cache, file_identity
+from publish.common import StrEnum, WorkerTypes
 
 
 class ChecksumTypes(StrEnum):
     SHA256 = "sha256"
     SHA512 = "sha512"
     MD5 = "md5"
+    # A tree digest of fixed-size chunks that are hashed in parallel,
+    # see publish.utils.io.TreeHasher
+    SHA256_TREE = "sha256tree"
 
 
-def checksum_file(path, algorithm=ChecksumTypes.SHA256):
+class ManifestFormats(StrEnum):
+    # The `<digest>  <path>` format of the coreutils sha256sum family of tools
+    GNU = "gnu"
+    # The `<ALGORITHM> (<path>) = <digest>` format of the --tag option of those tools
+    BSD = "bsd"
+
+
+class ManifestStatus(StrEnum):
+    OK = "OK"
+    FAILED = "FAILED"
+    MISSING = "MISSING"
+
+
+# The algorithm of an untagged GNU manifest entry is deduced from its digest length
+MANIFEST_DIGEST_LENGTHS = {
+    64: ChecksumTypes.SHA256.value,
+    128: ChecksumTypes.SHA512.value,
+    32: ChecksumTypes.MD5.value,
+}
+
+# The mode character in front of the path is `*` for binary and ` ` for text
+GNU_MANIFEST_ENTRY = re.compile(r"^([0-9a-fA-F]+) [ *](.+)$")
+BSD_MANIFEST_ENTRY = re.compile(r"^(\w+) \((.+)\) = ([0-9a-fA-F]+)$")
+
+# The chunk digests of a tree digest are written to a
+# `<checksum file>.chunks` sidecar next to the checksum file.
+TREE_CHUNKS_EXTENSION = "chunks"
+
+
+def checksum_file(path, algorithm=ChecksumTypes.SHA256, cache=None):
+    digests = checksum_file_digests(path, algorithms=[algorithm], cache=cache)
+    if not digests:
+        return False
+    return digests[algorithm]
+
+
+def checksum_file_digests(
+    path, algorithms=None, cache=None, tree_chunk_size=TREE_CHUNK_SIZE
+):
+    """
+    Calculate the digest of every algorithm in `algorithms` with a single read of `path`.
+    Returns a dictionary that maps each algorithm to its hex digest.
+    Digests of an unchanged file are served from the checksum `cache` if one is enabled,
+    see `publish.cache.get_checksum_cache`.
+    """
+    if not algorithms:
+        algorithms = [ChecksumTypes.SHA256]
     if not exists(path):
         return False
-    return hashsum(path, algorithm=algorithm)
 
+    checksum_cache = get_checksum_cache(cache)
+    # The cache only holds tree digests that use the default chunk size
+    if not checksum_cache or tree_chunk_size != TREE_CHUNK_SIZE:
+        return hashsums(path, algorithms=algorithms, tree_chunk_size=tree_chunk_size)
 
-def write_checksum_file(path, destination=None, algorithm=ChecksumTypes.SHA256):
-    checksum = checksum_file(path, algorithm=algorithm)
-    if not checksum:
+    file_stat = os.stat(path)
+    digests, missing_algorithms = {}, []
+    for algorithm in algorithms:
+        digest = checksum_cache.get(path, algorithm, file_stat=file_stat)
+        if digest:
+            digests[algorithm] = digest
+        else:
+            missing_algorithms.append(algorithm)
+    if not missing_algorithms:
+        return digests
+
+    calculated_digests = hashsums(path, algorithms=missing_algorithms)
+    if not calculated_digests:
         return False
+    # Only cache the digests if the file did not change while it was hashed
+    if file_identity(os.stat(path)) == file_identity(file_stat):
+        for algorithm, digest in calculated_digests.items():
+            checksum_cache.set(path, algorithm, digest, file_stat=file_stat)
+    digests.update(calculated_digests)
+    return digests
+
+
+def write_checksum_file(
+    path, destination=None, algorithm=ChecksumTypes.SHA256, cache=None
+):
     if not destination:
-        return write(path + f".{algorithm}", checksum)
+        destination = path + f".{algorithm}"
+    if is_tree_algorithm(algorithm):
+        # The chunk digests are written alongside the root digest
+        hashers = new_hashers([algorithm])
+        if not hashers or not hash_file(path, hashers):
+            return False
+        return write(destination, hashers[algorithm].hexdigest()) and (
+            write_tree_chunks_file(
+                f"{destination}.{TREE_CHUNKS_EXTENSION}", hashers[algorithm]
+            )
+        )
+
+    checksum = checksum_file(path, algorithm=algorithm, cache=cache)
+    if not checksum:
+        return False
     return write(destination, checksum)
 
 
-def checksum_equal(path, checksum_file_path, algorithm=ChecksumTypes.SHA256):
-    checksum = checksum_file(path, algorithm=algorithm)
+def checksum_equal(
+    path,
+    checksum_file_path,
+    algorithm=ChecksumTypes.SHA256,
+    cache=None,
+    verbose=False,
+):
+    if is_tree_algorithm(algorithm):
+        return tree_checksum_equal(
+            path, checksum_file_path, algorithm=algorithm, cache=cache, verbose=verbose
+        )
+    checksum = checksum_file(path, algorithm=algorithm, cache=cache)
     if not checksum:
         return False
     return checksum == load(checksum_file_path)
+
+
+def write_tree_chunks_file(destination, hasher):
+    chunks = {
+        "algorithm": hasher.name,
+        "chunk_size": hasher.chunk_size,
+        "size": hasher.size,
+        "root": hasher.hexdigest(),
+        "chunks": hasher.hexchunks(),
+    }
+    return write(destination, json.dumps(chunks, indent=1))
+
+
+def write_tree_chunks_files(destination, hashers):
+    """
+    Write the `<destination>.<algorithm>.chunks` sidecar of every tree hasher in `hashers`.
+    """
+    for algorithm, hasher in hashers.items():
+        if not isinstance(hasher, TreeHasher):
+            continue
+        chunks_path = f"{destination}.{algorithm}.{TREE_CHUNKS_EXTENSION}"
+        if not write_tree_chunks_file(chunks_path, hasher):
+            return False
+    return True
+
+
+def tree_checksum_equal(
+    path,
+    checksum_file_path,
+    algorithm=ChecksumTypes.SHA256_TREE,
+    cache=None,
+    verbose=False,
+):
+    """
+    Verify `path` against the tree digest in `checksum_file_path`.
+    The chunk size is read from the chunks sidecar of the checksum file if it exists,
+    and when the digests differ, the chunks that differ are reported if `verbose` is set.
+    """
+    chunks_path = f"{checksum_file_path}.{TREE_CHUNKS_EXTENSION}"
+    chunks = None
+    if exists(chunks_path):
+        chunks = load_json(chunks_path)
+        if not chunks:
+            return False
+    chunk_size = chunks["chunk_size"] if chunks else TREE_CHUNK_SIZE
+
+    digests = checksum_file_digests(
+        path, algorithms=[algorithm], cache=cache, tree_chunk_size=chunk_size
+    )
+    if not digests:
+        return False
+    if digests[algorithm] == load(checksum_file_path):
+        return True
+
+    if verbose and chunks:
+        hashers = new_hashers([algorithm], tree_chunk_size=chunk_size)
+        if hashers and hash_file(path, hashers):
+            calculated_chunks = hashers[algorithm].hexchunks()
+            for index, expected_chunk in enumerate(chunks["chunks"]):
+                if (
+                    index >= len(calculated_chunks)
+                    or calculated_chunks[index] != expected_chunk
+                ):
+                    print(
+                        f"Chunk: {index} at offset: {index * chunk_size} of file: {path} does not match"
+                    )
+            if len(calculated_chunks) != len(chunks["chunks"]):
+                print(
+                    f"The file: {path} has: {len(calculated_chunks)} chunks, expected: {len(chunks['chunks'])}"
+                )
+    return False
+
+
+def write_checksum_digests(path, digests, destination=None):
+    """
+    Write each of the `digests` to its own `<destination>.<algorithm>` file.
+    If no destination is provided, the `path` is used as the base of the checksum files.
+    """
+    if not destination:
+        destination = path
+    for algorithm, checksum in digests.items():
+        if not write(f"{destination}.{algorithm}", checksum):
+            return False
+    return True
+
+
+def write_checksum_files(path, destination=None, algorithms=None, cache=None):
+    if not algorithms:
+        algorithms = [ChecksumTypes.SHA256]
+    if not destination:
+        destination = path
+
+    if any(is_tree_algorithm(algorithm) for algorithm in algorithms):
+        # The chunk digests of the tree algorithms have to be written as well
+        hashers = new_hashers(algorithms)
+        if not hashers or not hash_file(path, hashers):
+            return False
+        return write_checksum_digests(
+            path, hexdigests(hashers), destination=destination
+        ) and write_tree_chunks_files(destination, hashers)
+
+    digests = checksum_file_digests(path, algorithms=algorithms, cache=cache)
+    if not digests:
+        return False
+    return write_checksum_digests(path, digests, destination=destination)
+
+
+def checksum_files(
+    paths,
+    algorithms=None,
+    workers=None,
+    worker_type=WorkerTypes.THREAD,
+    cache=None,
+    path_algorithms=None,
+):
+    """
+    Calculate the digests of every file in `paths` concurrently across `workers`.
+    Yields a (path, digests) tuple for each file in the order that they complete,
+    where digests is False if the file could not be checksummed.
+    The `path_algorithms` can map a path to the algorithms of that file,
+    which are then calculated instead of `algorithms`.
+
+    By default a thread pool is used, since hashlib releases the GIL while hashing
+    the large chunks that are read. A process pool can be selected with `worker_type`
+    for algorithms that do not release the GIL, in which case the checksum `cache` is not used,
+    since it can't be shared with the worker processes.
+    """
+    if not algorithms:
+        algorithms = [ChecksumTypes.SHA256]
+    if not workers:
+        workers = os.cpu_count() or 1
+
+    if worker_type == WorkerTypes.PROCESS:
+        # The multiprocessing machinery is only imported when it is used
+        from concurrent.futures import ProcessPoolExecutor
+
+        executor_class, cache = ProcessPoolExecutor, False
+    else:
+        executor_class, cache = ThreadPoolExecutor, get_checksum_cache(cache) or False
+
+    with executor_class(max_workers=workers) as executor:
+        pending = {}
+        paths = iter(paths)
+        try:
+            while True:
+                # Bound the number of files that are in flight,
+                # such that huge trees can be streamed through the pool
+                for path in paths:
+                    future = executor.submit(
+                        checksum_file_digests,
+                        path,
+                        algorithms=(path_algorithms or {}).get(path, algorithms),
+                        cache=cache,
+                    )
+                    pending[future] = path
+                    if len(pending) >= workers * 2:
+                        break
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = pending.pop(future)
+                    try:
+                        digests = future.result()
+                    except Exception as err:
+                        print("Failed to checksum file: {} - {}".format(path, err))
+                        digests = False
+                    yield path, digests
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def escape_manifest_path(path):
+    """
+    Escape `path` as the coreutils tools do, where an entry whose path contains
+    a backslash or a newline is prefixed with a backslash.
+    """
+    if "\\" not in path and "\n" not in path:
+        return "", path
+    return "\\", path.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def unescape_manifest_path(path):
+    unescaped, index = [], 0
+    while index < len(path):
+        if path[index] == "\\" and index + 1 < len(path):
+            unescaped.append("\n" if path[index + 1] == "n" else path[index + 1])
+            index += 2
+        else:
+            unescaped.append(path[index])
+            index += 1
+    return "".join(unescaped)
+
+
+def format_manifest_entry(path, algorithm, digest, manifest_format=ManifestFormats.GNU):
+    prefix, path = escape_manifest_path(path)
+    if manifest_format == ManifestFormats.BSD:
+        return f"{prefix}{algorithm.upper()} ({path}) = {digest}"
+    return f"{prefix}{digest}  {path}"
+
+
+def parse_manifest_entry(line, algorithm=None):
+    """
+    Parse a single GNU or BSD formatted manifest `line`.
+    Returns a (path, algorithm, digest) tuple, or False if the line is malformed.
+    The `algorithm` of a GNU formatted line is deduced from the digest length if it is not provided.
+    """
+    escaped = line.startswith("\\")
+    if escaped:
+        line = line[1:]
+
+    gnu_entry = GNU_MANIFEST_ENTRY.match(line)
+    if gnu_entry:
+        digest, path = gnu_entry.groups()
+        entry_algorithm = algorithm or MANIFEST_DIGEST_LENGTHS.get(len(digest))
+    else:
+        bsd_entry = BSD_MANIFEST_ENTRY.match(line)
+        if not bsd_entry:
+            return False
+        entry_algorithm, path, digest = bsd_entry.groups()
+        entry_algorithm = entry_algorithm.lower()
+
+    if not path or not digest or not entry_algorithm:
+        return False
+    if entry_algorithm not in [checksum_type.value for checksum_type in ChecksumTypes]:
+        return False
+    if escaped:
+        path = unescape_manifest_path(path)
+    return path, entry_algorithm, digest.lower()
+
+
+def write_manifest(
+    destination,
+    paths,
+    algorithms=None,
+    manifest_format=ManifestFormats.GNU,
+    workers=None,
+    worker_type=WorkerTypes.THREAD,
+    cache=None,
+):
+    """
+    Write a single manifest to `destination` with the digests of every file in `paths`.
+    The files are checksummed concurrently and the entries are sorted by path.
+    Each path is written relative to the directory of the manifest,
+    such that the manifest can be verified with e.g. `sha256sum --check` from that directory.
+    Multiple `algorithms` can only be written to a BSD formatted manifest.
+    """
+    if not algorithms:
+        algorithms = [ChecksumTypes.SHA256]
+    if manifest_format == ManifestFormats.GNU and len(algorithms) > 1:
+        print(
+            "Failed to write manifest: {} - a {} manifest can only hold a single algorithm".format(
+                destination, manifest_format
+            )
+        )
+        return False
+
+    manifest_dir = os.path.dirname(os.path.abspath(destination))
+    # An existing manifest is not an entry of itself
+    paths = (
+        path for path in paths if os.path.abspath(path) != os.path.abspath(destination)
+    )
+    entries = []
+    for path, digests in checksum_files(
+        paths,
+        algorithms=algorithms,
+        workers=workers,
+        worker_type=worker_type,
+        cache=cache,
+    ):
+        if not digests:
+            return False
+        entry_path = os.path.relpath(os.path.abspath(path), manifest_dir)
+        for algorithm in algorithms:
+            entries.append((entry_path, algorithm, digests[algorithm]))
+
+    lines = [
+        format_manifest_entry(path, algorithm, digest, manifest_format=manifest_format)
+        for path, algorithm, digest in sorted(entries)
+    ]
+    return write(destination, "".join(f"{line}\n" for line in lines))
+
+
+def read_manifest(manifest_path, algorithm=None):
+    """
+    Read the GNU or BSD formatted manifest in `manifest_path`.
+    Returns a list of (path, algorithm, digest) tuples, where relative paths
+    are resolved against the directory of the manifest, or False if the manifest is malformed.
+    """
+    lines = load(manifest_path, readlines=True)
+    if lines is False:
+        return False
+
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    entries = []
+    for line_number, line in enumerate(lines, start=1):
+        line = line.rstrip("\n")
+        if not line.strip():
+            continue
+        entry = parse_manifest_entry(line, algorithm=algorithm)
+        if not entry:
+            print(
+                "Failed to read manifest: {} - malformed entry on line {}".format(
+                    manifest_path, line_number
+                )
+            )
+            return False
+        path, entry_algorithm, digest = entry
+        path = os.path.normpath(os.path.join(manifest_dir, path))
+        entries.append((path, entry_algorithm, digest))
+    return entries
+
+
+def verify_manifest(
+    manifest_path,
+    algorithm=None,
+    workers=None,
+    worker_type=WorkerTypes.THREAD,
+    cache=None,
+    fail_fast=False,
+):
+    """
+    Verify every entry in the manifest in `manifest_path`, see `verify_manifest_entries`.
+    Nothing is yielded if the manifest can't be read.
+    """
+    entries = read_manifest(manifest_path, algorithm=algorithm)
+    if entries is False:
+        return
+    yield from verify_manifest_entries(
+        entries,
+        workers=workers,
+        worker_type=worker_type,
+        cache=cache,
+        fail_fast=fail_fast,
+    )
+
+
+def verify_manifest_entries(
+    entries,
+    workers=None,
+    worker_type=WorkerTypes.THREAD,
+    cache=None,
+    fail_fast=False,
+):
+    """
+    Verify the (path, algorithm, digest) `entries` of a manifest concurrently across `workers`.
+    Yields a (path, algorithm, status) tuple for each entry, where status is a `ManifestStatus`.
+    Missing files are reported before any file is hashed, and the remaining files are reported
+    in the order that they complete. Each file is only read once, and only hashed with
+    the algorithms that the manifest holds for that file.
+    If `fail_fast` is set, the verification stops at the first entry that does not match.
+    """
+    expected_digests = {}
+    for path, entry_algorithm, digest in entries:
+        if not os.path.isfile(path):
+            yield path, entry_algorithm, ManifestStatus.MISSING
+            if fail_fast:
+                return
+            continue
+        expected_digests.setdefault(path, {})[entry_algorithm] = digest
+
+    for path, digests in checksum_files(
+        expected_digests,
+        path_algorithms={
+            path: list(path_digests) for path, path_digests in expected_digests.items()
+        },
+        workers=workers,
+        worker_type=worker_type,
+        cache=cache,
+    ):
+        failed = False
+        for entry_algorithm, expected_digest in expected_digests[path].items():
+            if digests and digests[entry_algorithm] == expected_digest:
+                status = ManifestStatus.OK
+            else:
+                status, failed = ManifestStatus.FAILED, True
+            yield path, entry_algorithm, status
+        if failed and fail_fast:
+            return
@@ -0,0 +1,266 @@
+# Copyright (C) 2024  The publishing-tools Project by the Science HPC Center at UCPH
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import argparse
+import os
+import sys
+from publish.checksum import (
+    ChecksumTypes,
+    ManifestFormats,
+    ManifestStatus,
+    checksum_files,
+    read_manifest,
+    verify_manifest_entries,
+    write_manifest,
+)
+from publish.common import WorkerTypes
+from publish.cli.common import error_print
+from publish.cli.return_codes import SUCCESS, FILE_NOT_FOUND, CHECKSUM_FAILURE
+
+SCRIPT_NAME = __file__
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        prog=SCRIPT_NAME,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        help="Paths of the files to checksum, or of the manifests to verify if --check is set.",
+    )
+    parser.add_argument(
+        "--checksum-algorithm",
+        "-ca",
+        action="append",
+        default=None,
+        choices=[
+            ChecksumTypes.SHA256.value,
+            ChecksumTypes.SHA512.value,
+            ChecksumTypes.MD5.value,
+            ChecksumTypes.SHA256_TREE.value,
+        ],
+        help="Which checksum algorithm to calculate. Can be given multiple times, in which case every selected algorithm is calculated from a single read of each file. Default is None, which uses sha256.",
+    )
+    parser.add_argument(
+        "--recursive",
+        "-r",
+        action="store_true",
+        default=False,
+        help="Whether directories in 'paths' should be traversed recursively to checksum every file within them.",
+    )
+    parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="How many files should be checksummed concurrently.",
+    )
+    parser.add_argument(
+        "--worker-type",
+        "-wt",
+        default=WorkerTypes.THREAD.value,
+        choices=[WorkerTypes.THREAD.value, WorkerTypes.PROCESS.value],
+        help="Whether the files should be checksummed by a pool of threads or processes.",
+    )
+    parser.add_argument(
+        "--manifest",
+        "-m",
+        default=None,
+        help="Write the checksums of every file to a single manifest at this path instead of printing them. The paths in the manifest are relative to the directory of the manifest.",
+    )
+    parser.add_argument(
+        "--manifest-format",
+        "-mf",
+        default=ManifestFormats.GNU.value,
+        choices=[ManifestFormats.GNU.value, ManifestFormats.BSD.value],
+        help="The format of the written manifest. The gnu format is the one of the sha256sum family of tools and can only hold a single algorithm, the bsd format is the tagged one of their --tag option.",
+    )
+    parser.add_argument(
+        "--check",
+        "-c",
+        action="store_true",
+        default=False,
+        help="Verify the files listed in the manifests given in 'paths' instead of calculating checksums. Both the gnu and bsd manifest formats are understood.",
+    )
+    parser.add_argument(
+        "--fail-fast",
+        "-ff",
+        action="store_true",
+        default=False,
+        help="Stop verifying a manifest at the first file that is missing or does not match.",
+    )
+    parser.add_argument(
+        "--checksum-cache",
+        dest="checksum_cache",
+        action="store_const",
+        const=True,
+        default=None,
+        help="Use the persistent checksum cache to skip hashing files that have not changed since their digest was calculated. The cache can also be enabled by setting the PUBLISH_CHECKSUM_CACHE environment variable.",
+    )
+    parser.add_argument(
+        "--no-checksum-cache",
+        dest="checksum_cache",
+        action="store_const",
+        const=False,
+        help="Disable the persistent checksum cache, even if it has been enabled via the PUBLISH_CHECKSUM_CACHE environment variable.",
+    )
+    parser.add_argument(
+        "--verbose",
+        "-v",
+        action="store_true",
+        default=False,
+        help="Flag to enable verbose output.",
+    )
+    return parser.parse_args(args=args)
+
+
+def discover_files(paths, recursive=False):
+    for path in paths:
+        if recursive and os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def format_digests(path, digests):
+    if len(digests) == 1:
+        # The same format as the coreutils sha256sum family of tools
+        return "\n".join(f"{digest}  {path}" for digest in digests.values())
+    # Otherwise the algorithm is tagged, as with the --tag option of those tools
+    return "\n".join(
+        f"{algorithm.upper()} ({path}) = {digest}"
+        for algorithm, digest in digests.items()
+    )
+
+
+def check_manifests(
+    manifest_paths,
+    workers=None,
+    worker_type=None,
+    checksum_cache=None,
+    fail_fast=False,
+    verbose=False,
+):
+    return_code = SUCCESS
+    for manifest_path in manifest_paths:
+        entries = read_manifest(manifest_path)
+        if entries is False:
+            error_print(f"Failed to read manifest: {manifest_path}")
+            return_code = CHECKSUM_FAILURE
+            continue
+        if verbose:
+            print(f"Verifying {len(entries)} entries in manifest: {manifest_path}")
+
+        for path, algorithm, status in verify_manifest_entries(
+            entries,
+            workers=workers,
+            worker_type=worker_type,
+            cache=checksum_cache,
+            fail_fast=fail_fast,
+        ):
+            if status == ManifestStatus.OK:
+                print(f"{path}: OK")
+                continue
+            return_code = CHECKSUM_FAILURE
+            if status == ManifestStatus.MISSING:
+                print(f"{path}: FAILED open or read")
+            else:
+                print(f"{path}: FAILED")
+        if return_code != SUCCESS and fail_fast:
+            break
+    return return_code
+
+
+def main(args):
+    parsed_args = parse_args(args)
+    paths = [os.path.expanduser(path) for path in parsed_args.paths]
+    checksum_algorithms = parsed_args.checksum_algorithm
+    if not checksum_algorithms:
+        checksum_algorithms = [ChecksumTypes.SHA256.value]
+    recursive = parsed_args.recursive
+    workers = parsed_args.workers
+    worker_type = parsed_args.worker_type
+    manifest = parsed_args.manifest
+    manifest_format = parsed_args.manifest_format
+    check = parsed_args.check
+    fail_fast = parsed_args.fail_fast
+    checksum_cache = parsed_args.checksum_cache
+    verbose = parsed_args.verbose
+
+    return_code = SUCCESS
+    for path in paths:
+        if not os.path.exists(path):
+            error_print(f"File to checksum not found: {path}")
+            return_code = FILE_NOT_FOUND
+    if return_code != SUCCESS:
+        return return_code
+
+    if check:
+        return check_manifests(
+            paths,
+            workers=workers,
+            worker_type=worker_type,
+            checksum_cache=checksum_cache,
+            fail_fast=fail_fast,
+            verbose=verbose,
+        )
+
+    if manifest:
+        if not write_manifest(
+            os.path.expanduser(manifest),
+            discover_files(paths, recursive=recursive),
+            algorithms=checksum_algorithms,
+            manifest_format=manifest_format,
+            workers=workers,
+            worker_type=worker_type,
+            cache=checksum_cache,
+        ):
+            error_print(f"Failed to write manifest: {manifest}")
+            return CHECKSUM_FAILURE
+        if verbose:
+            print(f"Wrote the manifest: {manifest}")
+        return SUCCESS
+
+    if verbose:
+        print(
+            f"Calculating the {', '.join(checksum_algorithms)} checksums with {workers} {worker_type} workers"
+        )
+
+    for path, digests in checksum_files(
+        discover_files(paths, recursive=recursive),
+        algorithms=checksum_algorithms,
+        workers=workers,
+        worker_type=worker_type,
+        cache=checksum_cache,
+    ):
+        if not digests:
+            error_print(f"Failed to checksum file: {path}")
+            return_code = CHECKSUM_FAILURE
+            continue
+        print(format_digests(path, digests))
+    return return_code
+
+
+def cli():
+    sys.exit(main(sys.argv[1:]))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -17,9 +17,9 @@
 import argparse
 import sys
 import os
-from publish.signature import SignatureTypes, SignatureSources
+from publish.signature import SignatureTypes, SignatureSources, SignatureFormats
 from publish.publish import PublishTypes, publish, ChecksumTypes, publish_signature_key
-from publish.publish_container import get_image
+from publish.compression import CompressionTypes, compression_available
 from publish.utils.io import exists
 from publish.cli.common import error_print
 from publish.cli.return_codes import (
@@ -40,7 +40,8 @@ def parse_args(args):
     )
     parser.add_argument(
         "source",
-        help="The source input to publish.",
+        nargs="+",
+        help="The source input to publish. Several container images can be given with the container_images_archive --publish-type.",
     )
     parser.add_argument(
         "destination",
@@ -50,7 +51,41 @@ def parse_args(args):
         "--publish-type",
         "-pt",
         default=PublishTypes.FILE.value,
-        choices=[PublishTypes.FILE.value, PublishTypes.CONTAINER_IMAGE_ARCHIVE.value],
+        choices=[
+            PublishTypes.FILE.value,
+            PublishTypes.CONTAINER_IMAGE_ARCHIVE.value,
+            PublishTypes.CONTAINER_IMAGES_ARCHIVE.value,
+            PublishTypes.CONTAINER_IMAGE_OCI_LAYOUT.value,
+            PublishTypes.CONTAINER_IMAGE_DELTA_ARCHIVE.value,
+        ],
+        help="What type of source to publish. The container_images_archive type publishes several container images to a single archive, in which the layers that they share are stored once. The container_image_oci_layout type publishes a container image to an OCI image layout directory, in which the layers that it already holds are not written again. The container_image_delta_archive type publishes the layers of a container image that are not in the --baseline-archive.",
+    )
+    parser.add_argument(
+        "--baseline-archive",
+        "-ba",
+        default=None,
+        help="The path of a previously published container image archive that the container_image_delta_archive --publish-type leaves out the layers of. The full archive can be recombined from the delta and the baseline archive with the recombine tool.",
+    )
+    parser.add_argument(
+        "--compression",
+        "-co",
+        default=None,
+        choices=[compression.value for compression in CompressionTypes],
+        help="Compress the archive of the container_image_archive --publish-type as it is written. The archive is compressed in independent blocks by a pool of threads, which the standard decompression tools read as a single stream. The zstd compression requires the zstandard package.",
+    )
+    parser.add_argument(
+        "--compression-level",
+        "-cl",
+        default=None,
+        type=int,
+        help="The level of the selected --compression. Default is None, which uses the default level of the compression.",
+    )
+    parser.add_argument(
+        "--with-uncompressed-checksum",
+        "-wuc",
+        action="store_true",
+        default=False,
+        help="Whether to also publish the checksum files of the uncompressed archive, which are calculated in the same pass as the checksum of the compressed archive. They are named after the archive without its compression extension. Requires --with-checksum and --compression.",
     )
     parser.add_argument(
         "--with-checksum",
@@ -62,13 +97,52 @@ def parse_args(args):
     parser.add_argument(
         "--checksum-algorithm",
         "-ca",
-        default=ChecksumTypes.SHA256.value,
+        action="append",
+        default=None,
         choices=[
             ChecksumTypes.SHA256.value,
             ChecksumTypes.SHA512.value,
             ChecksumTypes.MD5.value,
+            ChecksumTypes.SHA256_TREE.value,
         ],
-        help="Which checksum algorithm to use when --with-checksum is enabled.",
+        help="Which checksum algorithm to use when --with-checksum is enabled. Can be given multiple times, in which case every selected algorithm is calculated from a single read of the published output. Default is None, which uses sha256.",
+    )
+    parser.add_argument(
+        "--with-write-verification",
+        "-wwv",
+        action="store_true",
+        default=False,
+        help="Whether the published output should be read back from storage and compared against the checksum that was calculated while publishing it. Requires --with-checksum.",
+    )
+    parser.add_argument(
+        "--checksum-cache",
+        dest="checksum_cache",
+        action="store_const",
+        const=True,
+        default=None,
+        help="Use the persistent checksum cache to skip hashing files that have not changed since their digest was calculated. The cache can also be enabled by setting the PUBLISH_CHECKSUM_CACHE environment variable.",
+    )
+    parser.add_argument(
+        "--no-checksum-cache",
+        dest="checksum_cache",
+        action="store_const",
+        const=False,
+        help="Disable the persistent checksum cache, even if it has been enabled via the PUBLISH_CHECKSUM_CACHE environment variable.",
+    )
+    parser.add_argument(
+        "--archive-cache",
+        dest="archive_cache",
+        action="store_const",
+        const=True,
+        default=None,
+        help="Use the persistent archive cache to reuse the archive and digests of an earlier container_image_archive publication of the same image id, instead of saving the image again. The archive is copied to the destination via a reflink where possible. The cache can also be enabled by setting the PUBLISH_ARCHIVE_CACHE environment variable.",
+    )
+    parser.add_argument(
+        "--no-archive-cache",
+        dest="archive_cache",
+        action="store_const",
+        const=False,
+        help="Disable the persistent archive cache, even if it has been enabled via the PUBLISH_ARCHIVE_CACHE environment variable.",
     )
     parser.add_argument(
         "--with-signature",
@@ -97,8 +171,9 @@ def parse_args(args):
     parser.add_argument(
         "--signature-key",
         "-sk",
+        action="append",
         default=None,
-        help="Which key to sign with when --with-signature is enabled.",
+        help="Which key to sign with when --with-signature is enabled. Can be given multiple times to sign with multiple keys, in which case a signature of every key is made by a single pass over the signature input.",
     )
     parser.add_argument(
         "--signature-args",
@@ -106,6 +181,17 @@ def parse_args(args):
         default="--sign --batch",
         help="Optional arguments to give the selected --signature-generator.",
     )
+    parser.add_argument(
+        "--signature-format",
+        "-sf",
+        default=None,
+        choices=[
+            SignatureFormats.INLINE.value,
+            SignatureFormats.DETACHED.value,
+            SignatureFormats.CLEARSIGN.value,
+        ],
+        help="Which signature format to generate. Replaces the format option in --signature-args. A detached signature does not copy the signed input and is written with a `.sig` extension by default. Default is None, which uses the format in --signature-args.",
+    )
     parser.add_argument(
         "--signature-output",
         "-so",
@@ -131,6 +217,21 @@ def parse_args(args):
         default="--armor --export",
         help="Optional arguments to give the selected --signature-generator when generating the key.",
     )
+    parser.add_argument(
+        "--keyring-cache",
+        dest="keyring_cache",
+        action="store_const",
+        const=True,
+        default=None,
+        help="Use the persistent keyring index to look up and export the signature key without running the --signature-generator again while the keyring is unchanged. The index can also be enabled by setting the PUBLISH_KEYRING_CACHE environment variable.",
+    )
+    parser.add_argument(
+        "--no-keyring-cache",
+        dest="keyring_cache",
+        action="store_const",
+        const=False,
+        help="Disable the persistent keyring index, even if it has been enabled via the PUBLISH_KEYRING_CACHE environment variable.",
+    )
     parser.add_argument(
         "--verbose",
         "-v",
@@ -146,19 +247,41 @@ def main(args):
     source = parsed_args.source
     destination = os.path.realpath(os.path.expanduser(parsed_args.destination))
     publish_type = parsed_args.publish_type
+    baseline_archive = parsed_args.baseline_archive
+    compression = parsed_args.compression
+    compression_level = parsed_args.compression_level
+    with_uncompressed_checksum = parsed_args.with_uncompressed_checksum
     with_checksum = parsed_args.with_checksum
-    checksum_algorithm = parsed_args.checksum_algorithm
+    checksum_algorithms = parsed_args.checksum_algorithm
+    if not checksum_algorithms:
+        checksum_algorithms = [ChecksumTypes.SHA256.value]
+    with_write_verification = parsed_args.with_write_verification
+    checksum_cache = parsed_args.checksum_cache
+    archive_cache = parsed_args.archive_cache
     with_signature = parsed_args.with_signature
     signature_source = parsed_args.signature_source
     signature_generator = parsed_args.signature_generator
     signature_key = parsed_args.signature_key
     signature_args = parsed_args.signature_args
+    signature_format = parsed_args.signature_format
     signature_output = parsed_args.signature_output
     with_signature_key_output = parsed_args.with_signature_key_output
     signature_key_output_path = parsed_args.signature_key_output_path
     signature_key_output_args = parsed_args.signature_key_output_args
+    keyring_cache = parsed_args.keyring_cache
     verbose = parsed_args.verbose
 
+    if publish_type == PublishTypes.CONTAINER_IMAGES_ARCHIVE:
+        sources = source
+    elif len(source) > 1:
+        error_print(
+            f"Only a single source can be published with the --publish-type: {publish_type}"
+        )
+        return PUBLISH_FAILURE
+    else:
+        sources = source
+        source = source[0]
+
     if publish_type == PublishTypes.FILE:
         file_path = os.path.realpath(os.path.expanduser(source))
         if not exists(file_path):
@@ -167,9 +290,53 @@ def main(args):
         else:
             source = file_path
 
-    if publish_type == PublishTypes.CONTAINER_IMAGE_ARCHIVE and not get_image(source):
-        error_print(f"Container image to publish not found: {source}")
-        return IMAGE_NOT_FOUND
+    if publish_type == PublishTypes.CONTAINER_IMAGE_DELTA_ARCHIVE:
+        if not baseline_archive:
+            error_print(
+                f"The --publish-type: {publish_type} requires a --baseline-archive to publish the delta against."
+            )
+            return PUBLISH_FAILURE
+        baseline_archive = os.path.realpath(os.path.expanduser(baseline_archive))
+        if not exists(baseline_archive):
+            error_print(f"Baseline archive not found: {baseline_archive}")
+            return FILE_NOT_FOUND
+
+    if compression:
+        if publish_type != PublishTypes.CONTAINER_IMAGE_ARCHIVE:
+            error_print(
+                f"The --compression can't be used with the --publish-type: {publish_type}, only with: {PublishTypes.CONTAINER_IMAGE_ARCHIVE}"
+            )
+            return PUBLISH_FAILURE
+        if not compression_available(compression):
+            error_print(
+                f"The --compression: {compression} is not available. Please install the package that provides it."
+            )
+            return PUBLISH_FAILURE
+
+    if with_uncompressed_checksum and not (with_checksum and compression):
+        error_print(
+            "The --with-uncompressed-checksum flag requires that --with-checksum and --compression are enabled."
+        )
+        return PUBLISH_FAILURE
+
+    container_session = None
+    if publish_type in (
+        PublishTypes.CONTAINER_IMAGE_ARCHIVE,
+        PublishTypes.CONTAINER_IMAGES_ARCHIVE,
+        PublishTypes.CONTAINER_IMAGE_OCI_LAYOUT,
+        PublishTypes.CONTAINER_IMAGE_DELTA_ARCHIVE,
+    ):
+        # Only import the podman client when a container image is published
+        from publish.publish_container import PodmanSession
+
+        # The session reuses the connection and the images that are looked up here
+        # when the images are published
+        container_session = PodmanSession()
+        for image in sources:
+            if not container_session.get_image(image):
+                container_session.close()
+                error_print(f"Container image to publish not found: {image}")
+                return IMAGE_NOT_FOUND
 
     if with_signature and not signature_key:
         error_print(
@@ -186,6 +353,12 @@ def main(args):
         )
         return PUBLISH_FAILURE
 
+    if with_write_verification and not with_checksum:
+        error_print(
+            "The --with-write-verification flag requires that --with-checksum is enabled."
+        )
+        return PUBLISH_FAILURE
+
     if isinstance(signature_args, str):
         # The underlying API expects a list of arguments
         signature_args = signature_args.split()
@@ -197,20 +370,32 @@ def main(args):
     if verbose:
         print(f"Publishing source: {source} to destination: {destination}")
 
-    if not publish(
+    published = publish(
         source,
         destination,
         publish_type,
         with_checksum=with_checksum,
-        checksum_algorithm=checksum_algorithm,
+        checksum_algorithm=checksum_algorithms,
         with_signature=with_signature,
         signature_source=signature_source,
         signature_generator=signature_generator,
         signature_key=signature_key,
         signauture_args=signature_args,
         signature_output=signature_output,
+        signature_format=signature_format,
+        with_write_verification=with_write_verification,
+        checksum_cache=checksum_cache,
+        container_session=container_session,
+        baseline_archive=baseline_archive,
+        archive_cache=archive_cache,
+        compression=compression,
+        compression_level=compression_level,
+        with_uncompressed_checksum=with_uncompressed_checksum,
         verbose=verbose,
-    ):
+    )
+    if container_session:
+        container_session.close()
+    if not published:
         error_print(
             f"Failed to correctly publish source: {source} to destination: {destination}"
         )
@@ -221,7 +406,9 @@ def main(args):
     if with_signature_key_output:
         if not signature_key_output_path:
             if signature_source == SignatureSources.GENERATED_CHECKSUM_FILE:
-                signature_key_output_path = f"{destination}.{checksum_algorithm}.asc"
+                signature_key_output_path = (
+                    f"{destination}.{checksum_algorithms[0]}.asc"
+                )
             else:
                 signature_key_output_path = f"{destination}.asc"
         if not publish_signature_key(
@@ -229,6 +416,7 @@ def main(args):
             signature_key_output_path,
             sign_command=signature_generator,
             sign_args=signature_key_output_args,
+            keyring_index=keyring_cache,
             verbose=verbose,
         ):
             error_print(f"Failed to write signature key to file: {signature_key}")
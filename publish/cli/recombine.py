@@ -0,0 +1,82 @@
+# Copyright (C) 2024  The publishing-tools Project by the Science HPC Center at UCPH
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import argparse
+import os
+import sys
+from publish.archive import recombine_delta_archive
+from publish.utils.io import exists
+from publish.cli.common import error_print
+from publish.cli.return_codes import SUCCESS, FILE_NOT_FOUND, ARCHIVE_FAILURE
+
+SCRIPT_NAME = __file__
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        prog=SCRIPT_NAME,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "delta",
+        help="Path of the delta archive that was published with the container_image_delta_archive --publish-type.",
+    )
+    parser.add_argument(
+        "baseline",
+        help="Path of the baseline archive that the delta archive was published against.",
+    )
+    parser.add_argument(
+        "destination",
+        help="Path to write the recombined container image archive to.",
+    )
+    parser.add_argument(
+        "--verbose",
+        "-v",
+        action="store_true",
+        default=False,
+        help="Flag to enable verbose output.",
+    )
+    return parser.parse_args(args=args)
+
+
+def main(args):
+    parsed_args = parse_args(args)
+    delta = os.path.realpath(os.path.expanduser(parsed_args.delta))
+    baseline = os.path.realpath(os.path.expanduser(parsed_args.baseline))
+    destination = os.path.realpath(os.path.expanduser(parsed_args.destination))
+    verbose = parsed_args.verbose
+
+    for archive in (delta, baseline):
+        if not exists(archive):
+            error_print(f"Archive to recombine not found: {archive}")
+            return FILE_NOT_FOUND
+
+    if not recombine_delta_archive(delta, baseline, destination, verbose=verbose):
+        error_print(
+            f"Failed to recombine the delta archive: {delta} with the baseline archive: {baseline}"
+        )
+        return ARCHIVE_FAILURE
+    if verbose:
+        print(f"Successfully recombined the delta archive: {delta} into: {destination}")
+    return SUCCESS
+
+
+def cli():
+    sys.exit(main(sys.argv[1:]))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -23,3 +23,4 @@ KEY_GEN_FAILURE = 5
 PUBLISH_FAILURE = 6
 CHECKSUM_FAILURE = 7
 SIGN_KEY_FILE_FAILURE = 8
+ARCHIVE_FAILURE = 9
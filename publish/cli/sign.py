@@ -18,7 +18,13 @@ import sys
 import os
 import argparse
 from publish.utils.io import exists
-from publish.signature import SignatureTypes, sign_file, write_signature_key_file
+from publish.signature import (
+    SignatureTypes,
+    SignatureFormats,
+    sign_file,
+    sign_files,
+    write_signature_key_file,
+)
 from publish.cli.common import error_print
 from publish.cli.return_codes import (
     SUCCESS,
@@ -37,14 +43,29 @@ def parse_args(args):
     )
     parser.add_argument(
         "file",
-        help="Path of the file to sign.",
+        nargs="+",
+        help="Paths of the files to sign.",
     )
     parser.add_argument("key", help="Path of the key to sign the file with.")
+    parser.add_argument(
+        "--additional-key",
+        "-ak",
+        action="append",
+        default=[],
+        help="An additional key to sign the files with. Can be given multiple times. A signature of every key is made by a single pass over each file.",
+    )
     parser.add_argument(
         "--output",
         "-o",
         default=None,
-        help="Path of the output file. Default is None, which will output to the FILE path with the --sign-command extension.",
+        help="Path of the output file. Can only be used when a single file is signed. Default is None, which will output to the FILE path with the --sign-command extension.",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="How many files should be signed concurrently when multiple files are given. The concurrent signers share the same gpg-agent.",
     )
     parser.add_argument(
         "--signature-generator",
@@ -59,6 +80,17 @@ def parse_args(args):
         default="--sign --batch",
         help="Optional arguments to give the selected --signature-generator.",
     )
+    parser.add_argument(
+        "--signature-format",
+        "-sf",
+        default=None,
+        choices=[
+            SignatureFormats.INLINE.value,
+            SignatureFormats.DETACHED.value,
+            SignatureFormats.CLEARSIGN.value,
+        ],
+        help="Which signature format to generate. Replaces the format option in --signature-args. A detached signature does not copy the signed input and is written with a `.sig` extension by default. Default is None, which uses the format in --signature-args.",
+    )
     parser.add_argument(
         "--with-signature-key-output",
         "-wsko",
@@ -70,7 +102,7 @@ def parse_args(args):
         "--signature-key-output-path",
         "-skop",
         default=None,
-        help="The path to where the --with-signature-key-output should be written. If None is set, the default is the same path as the 'file' with an `.asc` extension.",
+        help="The path to where the --with-signature-key-output should be written. If None is set, the default is the same path as the first 'file' with an `.asc` extension.",
     )
     parser.add_argument(
         "--signature-key-output-args",
@@ -78,6 +110,21 @@ def parse_args(args):
         default="--armor --export",
         help="Optional arguments to give the selected --signature-generator when generating the key.",
     )
+    parser.add_argument(
+        "--keyring-cache",
+        dest="keyring_cache",
+        action="store_const",
+        const=True,
+        default=None,
+        help="Use the persistent keyring index to look up and export the signature key without running the --signature-generator again while the keyring is unchanged. The index can also be enabled by setting the PUBLISH_KEYRING_CACHE environment variable.",
+    )
+    parser.add_argument(
+        "--no-keyring-cache",
+        dest="keyring_cache",
+        action="store_const",
+        const=False,
+        help="Disable the persistent keyring index, even if it has been enabled via the PUBLISH_KEYRING_CACHE environment variable.",
+    )
     parser.add_argument(
         "--verbose",
         "-v",
@@ -90,22 +137,34 @@ def parse_args(args):
 
 def main(args):
     parsed_args = parse_args(args)
-    file_ = os.path.realpath(os.path.expanduser(parsed_args.file))
+    files = [os.path.realpath(os.path.expanduser(file_)) for file_ in parsed_args.file]
     key = parsed_args.key
+    if parsed_args.additional_key:
+        key = [key] + parsed_args.additional_key
     if parsed_args.output:
         output = os.path.realpath(os.path.expanduser(parsed_args.output))
     else:
         output = None
+    jobs = parsed_args.jobs
     signature_generator = parsed_args.signature_generator
     signature_args = parsed_args.signature_args
+    signature_format = parsed_args.signature_format
     with_signature_key_output = parsed_args.with_signature_key_output
     signature_key_output_path = parsed_args.signature_key_output_path
     signature_key_output_args = parsed_args.signature_key_output_args
+    keyring_cache = parsed_args.keyring_cache
     verbose = parsed_args.verbose
 
-    if not exists(file_):
-        error_print(f"File to sign not found: {file_}")
-        return FILE_NOT_FOUND
+    for file_ in files:
+        if not exists(file_):
+            error_print(f"File to sign not found: {file_}")
+            return FILE_NOT_FOUND
+
+    if output and len(files) > 1:
+        error_print(
+            "The --output argument can only be used when a single file is signed."
+        )
+        return SIGN_FAILURE
 
     if isinstance(signature_args, str):
         # The underlying API expects a list of arguments
@@ -115,25 +174,53 @@ def main(args):
         # The underlying API expects a list of arguments
         signature_key_output_args = signature_key_output_args.split()
 
-    if verbose:
-        print(
-            f"Signing file: {file_} with key: {key} using signature generator: {signature_generator} with arguments: {signature_args}"
+    if len(files) == 1:
+        file_ = files[0]
+        if verbose:
+            print(
+                f"Signing file: {file_} with key: {key} using signature generator: {signature_generator} with arguments: {signature_args}"
+            )
+        signed = sign_file(
+            file_,
+            key,
+            output=output,
+            sign_command=signature_generator,
+            sign_args=signature_args,
+            signature_format=signature_format,
+            verbose=verbose,
+        )
+        if not signed:
+            error_print(f"Failed to sign file: {file_}")
+            return SIGN_FAILURE
+    else:
+        if verbose:
+            print(
+                f"Signing {len(files)} files with key: {key} using {jobs} concurrent signature generators: {signature_generator} with arguments: {signature_args}"
+            )
+        results = sign_files(
+            files,
+            key,
+            jobs=jobs,
+            sign_command=signature_generator,
+            sign_args=signature_args,
+            signature_format=signature_format,
+            verbose=verbose,
         )
+        failed = False
+        for file_, result in results.items():
+            if not result["signed"]:
+                error_print(f"Failed to sign file: {file_}")
+                failed = True
+            elif verbose:
+                print(
+                    f"Signed file: {file_} to: {result['output']} in {result['latency']:.3f} seconds"
+                )
+        if failed:
+            return SIGN_FAILURE
 
-    signed = sign_file(
-        file_,
-        key,
-        output=output,
-        sign_command=signature_generator,
-        sign_args=signature_args,
-        verbose=verbose,
-    )
-    if not signed:
-        error_print(f"Failed to sign file: {file_}")
-        return SIGN_FAILURE
     if with_signature_key_output:
         if not signature_key_output_path:
-            signature_key_output_path = f"{file_}.asc"
+            signature_key_output_path = f"{files[0]}.asc"
         if verbose:
             print(
                 f"Writing signature key to file: {signature_key_output_path} with signature generator: {signature_generator} with arguments: {signature_args}"
@@ -143,12 +230,13 @@ def main(args):
             signature_key_output_path,
             sign_command=signature_generator,
             sign_args=signature_key_output_args,
+            keyring_index=keyring_cache,
             verbose=verbose,
         ):
             error_print(f"Failed to write signature key to file: {key}")
             return SIGN_KEY_FILE_FAILURE
     if verbose:
-        print(f"Successfully signed file: {file_}")
+        print(f"Successfully signed files: {', '.join(files)}")
     return SUCCESS
 
 
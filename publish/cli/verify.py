@@ -18,8 +18,17 @@ import sys
 import os
 import argparse
 from publish.utils.io import exists
-from publish.signature import SignatureTypes, verify_file
+from publish.signature import (
+    SignatureTypes,
+    KeyMatches,
+    verify_file,
+    signatures_match_keys,
+    verify_files,
+    get_detached_signature_data,
+    GPG_VERIFY_FILES_CHUNK_SIZE,
+)
 from publish.checksum import ChecksumTypes, checksum_equal
+from publish.cache import get_checksum_cache
 from publish.cli.common import error_print
 from publish.cli.return_codes import (
     SUCCESS,
@@ -38,7 +47,8 @@ def parse_args(args):
     )
     parser.add_argument(
         "file",
-        help="Path of the file to verify.",
+        nargs="+",
+        help="Paths of the files to verify. When multiple files are given, they are verified in batches by a few invocations of the --verify-command.",
     )
     parser.add_argument(
         "key",
@@ -49,7 +59,7 @@ def parse_args(args):
         "-vwaf",
         nargs="+",
         default=[],
-        help="Additional files to verify with the key. This is useful when verifying a detached signature.",
+        help="Additional files to verify with the key. This is useful when verifying a detached signature. A detached signature with the `.sig` extension is automatically verified against the data file next to it if no additional files are given.",
     )
     parser.add_argument(
         "--verify-command",
@@ -67,6 +77,27 @@ def parse_args(args):
         default="--verify --batch --status-fd 0 --with-colons",
         help="Additional arguments to pass to the verify command.",
     )
+    parser.add_argument(
+        "--required-key",
+        "-rk",
+        action="append",
+        default=[],
+        help="A key that must have made a good signature of the file. Can be given multiple times. A key can be given as a fingerprint, a key id or a user id.",
+    )
+    parser.add_argument(
+        "--required-keys-match",
+        "-rkm",
+        default=KeyMatches.ALL.value,
+        choices=[KeyMatches.ALL.value, KeyMatches.ANY.value],
+        help="Whether all or any of the --required-key keys must have made a good signature of the file.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        "-bs",
+        type=int,
+        default=GPG_VERIFY_FILES_CHUNK_SIZE,
+        help="How many files a single invocation of the --verify-command verifies when multiple files are given.",
+    )
     parser.add_argument(
         "--with-checksum",
         "-wc",
@@ -99,9 +130,40 @@ def parse_args(args):
             ChecksumTypes.SHA256.value,
             ChecksumTypes.SHA512.value,
             ChecksumTypes.MD5.value,
+            ChecksumTypes.SHA256_TREE.value,
         ],
         help="Which checksum algorithm to use for verification when --with-checksum is enabled.",
     )
+    parser.add_argument(
+        "--checksum-cache",
+        dest="checksum_cache",
+        action="store_const",
+        const=True,
+        default=None,
+        help="Use the persistent checksum cache to skip hashing files that have not changed since their digest was calculated. The cache can also be enabled by setting the PUBLISH_CHECKSUM_CACHE environment variable.",
+    )
+    parser.add_argument(
+        "--no-checksum-cache",
+        dest="checksum_cache",
+        action="store_const",
+        const=False,
+        help="Disable the persistent checksum cache, even if it has been enabled via the PUBLISH_CHECKSUM_CACHE environment variable.",
+    )
+    parser.add_argument(
+        "--verification-cache",
+        dest="verification_cache",
+        action="store_const",
+        const=True,
+        default=None,
+        help="Use the persistent verification cache to skip verifying signatures that have been successfully verified before, as long as neither the files nor the keyring have changed since. The cache can also be enabled by setting the PUBLISH_VERIFICATION_CACHE environment variable.",
+    )
+    parser.add_argument(
+        "--no-verification-cache",
+        dest="verification_cache",
+        action="store_const",
+        const=False,
+        help="Disable the persistent verification cache, even if it has been enabled via the PUBLISH_VERIFICATION_CACHE environment variable.",
+    )
     parser.add_argument(
         "--verbose",
         "-v",
@@ -119,15 +181,75 @@ def search_for_file(path, search_priorities, verbose=False):
     return None
 
 
+def verify_checksum(
+    file_,
+    checksum_original_file=None,
+    checksum_digest_file=None,
+    checksum_algorithm=ChecksumTypes.SHA256,
+    checksum_cache=None,
+    verify_command=SignatureTypes.GPG,
+    verbose=False,
+):
+    if not checksum_original_file:
+        # Try to discover the original file in the same directory as the file to verify
+        # since the user did not provide one.
+        search_priorities = [
+            file_.strip(f".{verify_command}"),
+        ]
+        detached_signature_data = get_detached_signature_data(file_)
+        if detached_signature_data:
+            search_priorities.insert(0, detached_signature_data)
+        checksum_original_file = search_for_file(
+            file_, search_priorities, verbose=verbose
+        )
+        if not checksum_original_file or not exists(checksum_original_file):
+            error_print(
+                "No original file provided to validate the checksum digest against."
+            )
+            return FILE_NOT_FOUND
+
+    if not checksum_digest_file:
+        # Try to discover the checksum digest file in the same directory as the file to verify
+        # since the user did not provide one.
+        if verbose:
+            print(
+                "The Checksum digest file has not been set by the user, attempting to search for one."
+            )
+        search_priority = [
+            f"{checksum_original_file}.{checksum_algorithm}",
+            f"{file_}.{checksum_algorithm}",
+        ]
+        checksum_digest_file = search_for_file(file_, search_priority, verbose=verbose)
+        if not checksum_digest_file or not exists(checksum_digest_file):
+            error_print("Failed to find a checksum digest file to validate against.")
+            return FILE_NOT_FOUND
+    checksum_verified = checksum_equal(
+        checksum_original_file,
+        checksum_digest_file,
+        algorithm=checksum_algorithm,
+        cache=checksum_cache,
+        verbose=verbose,
+    )
+    if not checksum_verified:
+        error_print(
+            f"Checksum verification failed for file: {checksum_original_file} with checksum file: {checksum_digest_file}"
+        )
+        return CHECKSUM_FAILURE
+    return SUCCESS
+
+
 def main(args):
     parsed_args = parse_args(args)
-    file_ = os.path.realpath(os.path.expanduser(parsed_args.file))
+    files = [os.path.realpath(os.path.expanduser(file_)) for file_ in parsed_args.file]
     key = parsed_args.key
     verify_additional_files = [
         os.path.expanduser(path) for path in parsed_args.verify_with_additional_files
     ]
     verify_command = parsed_args.verify_command
     verify_args = parsed_args.verify_args
+    batch_size = parsed_args.batch_size
+    required_keys = parsed_args.required_key
+    required_keys_match = parsed_args.required_keys_match
     with_checksum = parsed_args.with_checksum
     checksum_algorithm = parsed_args.checksum_algorithm
     if parsed_args.checksum_digest_file:
@@ -142,11 +264,22 @@ def main(args):
         )
     else:
         checksum_original_file = None
+    checksum_cache = parsed_args.checksum_cache
+    verification_cache = parsed_args.verification_cache
     verbose = parsed_args.verbose
 
-    if not exists(file_):
-        error_print(f"The file to verify was not found: {file_}")
-        return FILE_NOT_FOUND
+    for file_ in files:
+        if not exists(file_):
+            error_print(f"The file to verify was not found: {file_}")
+            return FILE_NOT_FOUND
+
+    if len(files) > 1 and (
+        verify_additional_files or checksum_digest_file or checksum_original_file
+    ):
+        error_print(
+            "The --verify-with-additional-files, --checksum-digest-file and --checksum-original-file arguments can only be used when a single file is verified."
+        )
+        return VERIFY_FAILURE
 
     if verify_additional_files:
         for additional_file in verify_additional_files:
@@ -157,58 +290,64 @@ def main(args):
                 return FILE_NOT_FOUND
 
     if with_checksum:
-        if not checksum_original_file:
-            # Try to discover the original file in the same directory as the file to verify
-            # since the user did not provide one.
-            search_priorities = [
-                file_.strip(f".{verify_command}"),
-            ]
-            checksum_original_file = search_for_file(
-                file_, search_priorities, verbose=verbose
+        for file_ in files:
+            checksum_return_code = verify_checksum(
+                file_,
+                checksum_original_file=checksum_original_file,
+                checksum_digest_file=checksum_digest_file,
+                checksum_algorithm=checksum_algorithm,
+                checksum_cache=checksum_cache,
+                verify_command=verify_command,
+                verbose=verbose,
             )
-            if not checksum_original_file or not exists(checksum_original_file):
-                error_print(
-                    "No original file provided to validate the checksum digest against."
-                )
-                return FILE_NOT_FOUND
-
-        if not checksum_digest_file:
-            # Try to discover the checksum digest file in the same directory as the file to verify
-            # since the user did not provide one.
-            if verbose:
-                print(
-                    "The Checksum digest file has not been set by the user, attempting to search for one."
-                )
-            search_priority = [
-                f"{checksum_original_file}.{checksum_algorithm}",
-                f"{file_}.{checksum_algorithm}",
-            ]
-            checksum_digest_file = search_for_file(
-                file_, search_priority, verbose=verbose
+            if checksum_return_code != SUCCESS:
+                return checksum_return_code
+        if verbose and get_checksum_cache(checksum_cache):
+            print(
+                f"Checksum cache statistics: {get_checksum_cache(checksum_cache).stats()}"
             )
-            if not checksum_digest_file or not exists(checksum_digest_file):
-                error_print(
-                    "Failed to find a checksum digest file to validate against."
-                )
-                return FILE_NOT_FOUND
-        if not checksum_equal(
-            checksum_original_file, checksum_digest_file, algorithm=checksum_algorithm
-        ):
-            error_print(
-                f"Checksum verification failed for file: {checksum_original_file} with checksum file: {checksum_digest_file}"
-            )
-            return CHECKSUM_FAILURE
 
     if isinstance(verify_args, str):
         # The underlying API expects a list of arguments
         verify_args = verify_args.split()
 
+    if len(files) > 1:
+        results = verify_files(
+            files,
+            key,
+            verify_command=verify_command,
+            verify_args=verify_args,
+            chunk_size=batch_size,
+            verification_cache=verification_cache,
+            verbose=verbose,
+        )
+        return_code = SUCCESS
+        for file_, result in results.items():
+            if required_keys:
+                result["verified"] = signatures_match_keys(
+                    result["signatures"], required_keys, match=required_keys_match
+                )
+                if not result["verified"]:
+                    result["error"] = (
+                        f"Not signed by {required_keys_match} of the required keys"
+                    )
+            if not result["verified"]:
+                error_print(f"Failed to verify file: {file_} - {result['error']}")
+                return_code = VERIFY_FAILURE
+            elif verbose:
+                print(f"Successfully verified file: {file_}")
+        return return_code
+
+    file_ = files[0]
     verified = verify_file(
         file_,
         key,
         verify_command,
         verify_args,
         verify_additional_files=verify_additional_files,
+        required_keys=required_keys,
+        required_keys_match=required_keys_match,
+        verification_cache=verification_cache,
         verbose=verbose,
     )
     if not verified:
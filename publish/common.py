@@ -26,3 +26,8 @@ else:
     # https://docs.python.org/3/library/enum.html#enum.StrEnum
     # The StrEnum class was added in Python 3.11
     from enum import StrEnum
+
+
+class WorkerTypes(StrEnum):
+    THREAD = "thread"
+    PROCESS = "process"
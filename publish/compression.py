@@ -0,0 +1,142 @@
+# Copyright (C) 2024  The publishing-tools Project by the Science HPC Center at UCPH
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import gzip
+import lzma
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from publish.common import StrEnum
+
+# The amount of uncompressed content that is compressed as an independent block
+COMPRESSION_BLOCK_SIZE = 8 * 1024 * 1024
+
+
+class CompressionTypes(StrEnum):
+    GZIP = "gzip"
+    XZ = "xz"
+    # Requires the optional zstandard package
+    ZSTD = "zstd"
+
+
+COMPRESSION_EXTENSIONS = {
+    CompressionTypes.GZIP: "gz",
+    CompressionTypes.XZ: "xz",
+    CompressionTypes.ZSTD: "zst",
+}
+
+DEFAULT_COMPRESSION_LEVELS = {
+    CompressionTypes.GZIP: 6,
+    CompressionTypes.XZ: 6,
+    CompressionTypes.ZSTD: 3,
+}
+
+
+def compress_gzip_block(block, level):
+    # A fixed modification time keeps the compressed output reproducible
+    return gzip.compress(block, compresslevel=level, mtime=0)
+
+
+def compress_xz_block(block, level):
+    return lzma.compress(block, format=lzma.FORMAT_XZ, preset=level)
+
+
+def compress_zstd_block(block, level):
+    import zstandard
+
+    return zstandard.ZstdCompressor(level=level).compress(block)
+
+
+COMPRESSION_BLOCK_FUNCTIONS = {
+    CompressionTypes.GZIP: compress_gzip_block,
+    CompressionTypes.XZ: compress_xz_block,
+    CompressionTypes.ZSTD: compress_zstd_block,
+}
+
+
+def compression_available(compression):
+    if compression not in COMPRESSION_BLOCK_FUNCTIONS:
+        return False
+    if compression == CompressionTypes.ZSTD:
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            return False
+    return True
+
+
+def get_compression_level(compression, level=None):
+    if level is None:
+        return DEFAULT_COMPRESSION_LEVELS[compression]
+    return level
+
+
+def uncompressed_path(path, compression):
+    """
+    The path of the uncompressed content of the compressed file at `path`,
+    which is `path` without its compression extension if it has one.
+    """
+    extension = f".{COMPRESSION_EXTENSIONS[compression]}"
+    if path.endswith(extension) and len(path) > len(extension):
+        return path[: -len(extension)]
+    return f"{path}.uncompressed"
+
+
+def i_compress(
+    i_content,
+    compression,
+    level=None,
+    block_size=COMPRESSION_BLOCK_SIZE,
+    workers=None,
+    hashers=None,
+):
+    """
+    Compress the iterable `i_content` with `compression` and yield the compressed content.
+    The content is split into blocks of `block_size` bytes, which are compressed concurrently
+    by a pool of `workers` threads, as pigz does, into independent gzip members, xz streams
+    or zstd frames. Their concatenation, which is what is yielded in order, decompresses
+    to the whole content with the standard tools.
+    If `hashers` are provided, they are updated with the uncompressed content.
+    """
+    compress_block = COMPRESSION_BLOCK_FUNCTIONS[compression]
+    level = get_compression_level(compression, level)
+    if not workers:
+        workers = os.cpu_count() or 1
+    if not hashers:
+        hashers = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        block_futures = deque()
+        blocks = 0
+        block = bytearray()
+        for chunk in i_content:
+            for hasher in hashers.values():
+                hasher.update(chunk)
+            block += chunk
+            while len(block) >= block_size:
+                block_futures.append(
+                    executor.submit(compress_block, bytes(block[:block_size]), level)
+                )
+                blocks += 1
+                del block[:block_size]
+                # Bound the amount of blocks that are held in memory
+                while len(block_futures) >= workers * 2:
+                    yield block_futures.popleft().result()
+        if block or not blocks:
+            # Empty content is still compressed into a valid, empty stream
+            block_futures.append(executor.submit(compress_block, bytes(block), level))
+        while block_futures:
+            yield block_futures.popleft().result()
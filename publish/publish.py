@@ -14,26 +14,46 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
-from publish.utils.io import exists, copy
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from publish.utils.io import exists, copy, hash_copy, new_hashers, hexdigests, hashsums
 from publish.signature import (
     sign_file,
     SignatureTypes,
     SignatureSources,
     write_signature_key_file,
 )
-from publish.publish_container import container_publish_to_archive
-from publish.checksum import ChecksumTypes, write_checksum_file
+from publish.checksum import (
+    ChecksumTypes,
+    write_checksum_digests,
+    write_tree_chunks_files,
+)
+from publish.cache import get_checksum_cache
+from publish.compression import uncompressed_path
 from publish.common import StrEnum
 
 
 class PublishTypes(StrEnum):
     FILE = "file"
     CONTAINER_IMAGE_ARCHIVE = "container_image_archive"
+    # A single archive of several container images, in which shared layers are stored once
+    CONTAINER_IMAGES_ARCHIVE = "container_images_archive"
+    # A content addressed OCI image layout directory, in which existing blobs are not written again
+    CONTAINER_IMAGE_OCI_LAYOUT = "container_image_oci_layout"
+    # An archive of the layers and config of a container image that are not in a baseline archive
+    CONTAINER_IMAGE_DELTA_ARCHIVE = "container_image_delta_archive"
 
 
 # TODO add GITHUB and CONTAINER_IMAGE_REGISTRY types
 
 
+class PublishStages(StrEnum):
+    PUBLISH = "publish"
+    CHECKSUM = "checksum"
+    SIGNATURE = "signature"
+
+
 def publish(
     source,
     destination,
@@ -46,52 +66,445 @@ def publish(
     signature_key=None,
     signauture_args=None,
     signature_output=None,
+    signature_format=None,
+    with_write_verification=False,
+    checksum_cache=None,
+    container_session=None,
+    baseline_archive=None,
+    archive_cache=None,
+    compression=None,
+    compression_level=None,
+    with_uncompressed_checksum=False,
     verbose=False,
 ):
-    checksum_input, signature_input = None, None
-    if publish_type == PublishTypes.FILE:
-        published = file_publish(source, destination)
-        if not published:
+    """
+    Publish the `source` to the `destination` with the selected `publish_type`.
+    The `checksum_algorithm` can either be a single algorithm or a list of algorithms,
+    in which case every checksum file is generated from a single read of the published output.
+    The `signature_format` selects an inline, detached or clearsigned signature,
+    and the `signature_key` can be a list of keys that each sign the signature input
+    in a single pass, see `publish.signature.sign_file`.
+
+    When a checksum is requested, the digests are calculated while the output is being written.
+    The `with_write_verification` flag additionally re-reads the published output from storage
+    and compares it against the digests that were calculated while it was written.
+    The digests of the published output are also stored in the `checksum_cache` if it is enabled,
+    such that a later verification of the unchanged output does not have to hash it again.
+    A container image is looked up through the `container_session` if one is given,
+    see `publish.publish_container.PodmanSession`.
+    With the CONTAINER_IMAGES_ARCHIVE `publish_type`, the `source` is a list of container images
+    that are published to a single archive. With the CONTAINER_IMAGE_OCI_LAYOUT `publish_type`,
+    the `destination` is an OCI image layout directory, whose index.json is checksummed and signed.
+    With the CONTAINER_IMAGE_DELTA_ARCHIVE `publish_type`, only the layers that are not in the
+    `baseline_archive` are published, see `publish.archive.recombine_delta_archive`.
+    With the CONTAINER_IMAGE_ARCHIVE `publish_type`, an archive of the same image that is in the
+    `archive_cache` is reused together with its digests, see `publish.cache.ArchiveCache`.
+    The archive can also be written with a `compression`, see `publish.compression.i_compress`,
+    where the `with_uncompressed_checksum` flag additionally writes the checksum files of the
+    uncompressed archive, see `publish.compression.uncompressed_path`, from the same pass.
+    """
+    checksum_algorithms = checksum_algorithm_list(checksum_algorithm)
+
+    hashers, uncompressed_hashers = None, None
+    if with_checksum:
+        hashers = new_hashers(checksum_algorithms)
+        if not hashers:
             return False
-        checksum_input = signature_input = destination
-    elif publish_type == PublishTypes.CONTAINER_IMAGE_ARCHIVE:
-        archived = container_publish_to_archive(source, destination, verbose=verbose)
-        if not archived:
+        if compression and with_uncompressed_checksum:
+            uncompressed_hashers = new_hashers(checksum_algorithms)
+
+    published_output = publish_output(
+        source,
+        destination,
+        publish_type,
+        hashers=hashers,
+        container_session=container_session,
+        baseline_archive=baseline_archive,
+        archive_cache=archive_cache,
+        compression=compression,
+        compression_level=compression_level,
+        uncompressed_hashers=uncompressed_hashers,
+        verbose=verbose,
+    )
+    if not published_output:
+        return False
+
+    # The checksum files and the signature can only be written
+    # once the source has been published.
+    if with_checksum:
+        published_digests = publish_checksums(
+            published_output,
+            hashers,
+            with_write_verification=with_write_verification,
+            checksum_cache=checksum_cache,
+            uncompressed_hashers=uncompressed_hashers,
+            uncompressed_output=(
+                uncompressed_path(published_output, compression)
+                if uncompressed_hashers
+                else None
+            ),
+            verbose=verbose,
+        )
+        if not published_digests:
+            return False
+
+    if with_signature:
+        signature_input = get_signature_input(
+            published_output,
+            checksum_algorithms,
+            with_checksum=with_checksum,
+            signature_source=signature_source,
+        )
+        if not publish_signature(
+            signature_input,
+            signature_key,
+            signature_generator=signature_generator,
+            signature_args=signauture_args,
+            signature_output=signature_output,
+            signature_format=signature_format,
+            verbose=verbose,
+        ):
             return False
-        checksum_input = signature_input = destination
-    else:
+    return True
+
+
+def checksum_algorithm_list(checksum_algorithm):
+    if isinstance(checksum_algorithm, str):
+        return [checksum_algorithm]
+    return list(checksum_algorithm)
+
+
+def get_signature_input(
+    published_output,
+    checksum_algorithms,
+    with_checksum=False,
+    signature_source=SignatureSources.SOURCE_INPUT,
+):
+    # When multiple algorithms are selected, the checksum file
+    # of the first algorithm is used as the signature input.
+    if with_checksum and signature_source == SignatureSources.GENERATED_CHECKSUM_FILE:
+        return f"{published_output}.{checksum_algorithms[0]}"
+    return published_output
+
+
+def publish_output(
+    source,
+    destination,
+    publish_type,
+    hashers=None,
+    container_session=None,
+    baseline_archive=None,
+    archive_cache=None,
+    compression=None,
+    compression_level=None,
+    uncompressed_hashers=None,
+    verbose=False,
+):
+    """
+    Publish the `source` to the `destination` with the selected `publish_type`.
+    If `hashers` are provided, they are updated with the published content as it is written.
+    A `compression` is only supported by the CONTAINER_IMAGE_ARCHIVE `publish_type`,
+    in which case the `uncompressed_hashers` are updated with the uncompressed archive.
+    Returns the path of the published output, or False if it could not be published.
+    """
+    if compression and publish_type != PublishTypes.CONTAINER_IMAGE_ARCHIVE:
+        if verbose:
+            print(f"The publish type: {publish_type} can't be compressed")
         return False
+    if publish_type == PublishTypes.FILE:
+        if os.path.isdir(destination):
+            destination = os.path.join(destination, os.path.basename(source))
+        if not file_publish(source, destination, hashers=hashers, verbose=verbose):
+            return False
+        return destination
+    if publish_type == PublishTypes.CONTAINER_IMAGE_ARCHIVE:
+        # The podman client is only imported when a container image is published,
+        # since importing it dominates the start up time of file publishing
+        from publish.publish_container import container_publish_to_archive
 
-    # Because we need to publish the archive file before we can
-    # calculate the checksum and sign it, we need to do it here.
-    if with_checksum and checksum_input and exists(checksum_input):
-        checksum_file_destination = f"{checksum_input}.{checksum_algorithm}"
-        if signature_source == SignatureSources.GENERATED_CHECKSUM_FILE:
-            signature_input = checksum_file_destination
-
-        checksum_file = write_checksum_file(
-            checksum_input,
-            destination=checksum_file_destination,
-            algorithm=checksum_algorithm,
+        if not container_publish_to_archive(
+            source,
+            destination,
+            hashers=hashers,
+            session=container_session,
+            archive_cache=archive_cache,
+            compression=compression,
+            compression_level=compression_level,
+            uncompressed_hashers=uncompressed_hashers,
+            verbose=verbose,
+        ):
+            return False
+        return destination
+    if publish_type == PublishTypes.CONTAINER_IMAGE_OCI_LAYOUT:
+        from publish.publish_container import (
+            container_publish_to_oci_layout,
+            OCI_INDEX_FILE,
         )
-        if not checksum_file:
+
+        if not container_publish_to_oci_layout(
+            source,
+            destination,
+            hashers=hashers,
+            session=container_session,
+            verbose=verbose,
+        ):
             return False
+        # The index references every other file of the layout by its digest,
+        # so it is what the checksum and signature of the publication cover
+        return os.path.join(destination, OCI_INDEX_FILE)
+    if publish_type == PublishTypes.CONTAINER_IMAGE_DELTA_ARCHIVE:
+        from publish.publish_container import container_publish_delta_archive
 
-    if with_signature and signature_input and exists(signature_input):
-        if not signature_key:
+        if not baseline_archive:
+            if verbose:
+                print("A baseline archive is required to publish a delta archive")
             return False
+        if not container_publish_delta_archive(
+            source,
+            destination,
+            baseline_archive,
+            hashers=hashers,
+            session=container_session,
+            verbose=verbose,
+        ):
+            return False
+        return destination
+    if publish_type == PublishTypes.CONTAINER_IMAGES_ARCHIVE:
+        from publish.publish_container import container_publish_images_to_archive
 
-        signed_file = sign_file(
-            signature_input,
-            signature_key,
-            sign_command=signature_generator,
-            sign_args=signauture_args,
-            output=signature_output,
+        if not container_publish_images_to_archive(
+            source,
+            destination,
+            hashers=hashers,
+            session=container_session,
             verbose=verbose,
+        ):
+            return False
+        return destination
+    return False
+
+
+def publish_checksums(
+    published_output,
+    hashers,
+    with_write_verification=False,
+    checksum_cache=None,
+    uncompressed_hashers=None,
+    uncompressed_output=None,
+    verbose=False,
+):
+    """
+    Write the checksum files of the `published_output` from the `hashers`
+    that were updated while it was published.
+    The checksum files of the uncompressed content of a compressed output are written
+    from the `uncompressed_hashers` as if they were of a file at `uncompressed_output`.
+    Returns the digests of the published output, or False on failure.
+    """
+    if not exists(published_output):
+        return False
+
+    # The digests were calculated while the source was published
+    published_digests = hexdigests(hashers)
+    if with_write_verification:
+        written_digests = hashsums(
+            published_output, algorithms=list(hashers), drop_cache=True
         )
-        if not signed_file:
+        if written_digests != published_digests:
+            if verbose:
+                print(
+                    f"The published output: {published_output} does not match the digests calculated while publishing it"
+                )
             return False
-    return True
+    checksum_files = write_checksum_digests(
+        published_output, published_digests, destination=published_output
+    ) and write_tree_chunks_files(published_output, hashers)
+    if not checksum_files:
+        return False
+    if uncompressed_hashers and not (
+        write_checksum_digests(
+            uncompressed_output,
+            hexdigests(uncompressed_hashers),
+            destination=uncompressed_output,
+        )
+        and write_tree_chunks_files(uncompressed_output, uncompressed_hashers)
+    ):
+        return False
+
+    published_checksum_cache = get_checksum_cache(checksum_cache)
+    if published_checksum_cache:
+        for algorithm, digest in published_digests.items():
+            published_checksum_cache.set(published_output, algorithm, digest)
+    return published_digests
+
+
+def publish_signature(
+    signature_input,
+    signature_key,
+    signature_generator=SignatureTypes.GPG,
+    signature_args=None,
+    signature_output=None,
+    signature_format=None,
+    verbose=False,
+):
+    if not signature_key or not exists(signature_input):
+        return False
+    return sign_file(
+        signature_input,
+        signature_key,
+        sign_command=signature_generator,
+        sign_args=signature_args,
+        output=signature_output,
+        signature_format=signature_format,
+        verbose=verbose,
+    )
+
+
+def publish_many(jobs, workers=None, stage_workers=None, verbose=False):
+    """
+    Publish every job in `jobs`, where each job is a dictionary of the `publish` keyword arguments.
+    The jobs are processed by a pipeline of a publish, a checksum and a signature stage,
+    such that the next job is published while the previous ones are checksummed and signed.
+    Each stage has its own pool of `workers`, whose size can be set per stage
+    with `stage_workers`, e.g. {PublishStages.SIGNATURE: 1}.
+
+    Returns a list with a result dictionary for each job in the order of `jobs`,
+    holding whether the job succeeded, the stage that failed, the path of the
+    published output and the digests of the published output.
+    """
+    if not workers:
+        workers = os.cpu_count() or 1
+    if not stage_workers:
+        stage_workers = {}
+
+    jobs = [dict(job) for job in jobs]
+    results = [
+        {
+            "source": job.get("source"),
+            "destination": job.get("destination"),
+            "success": False,
+            "failed_stage": None,
+            "output": None,
+            "digests": None,
+        }
+        for job in jobs
+    ]
+    executors = {
+        stage: ThreadPoolExecutor(max_workers=stage_workers.get(stage, workers))
+        for stage in PublishStages
+    }
+    pending = {}
+    # The stages run in copies of the current context,
+    # such that an active `collect_resources` also records their commands
+    context = contextvars.copy_context()
+
+    def submit(index, stage, function, *args, **kwargs):
+        future = executors[stage].submit(context.copy().run, function, *args, **kwargs)
+        pending[future] = (index, stage)
+
+    def next_stage(index, stage):
+        job, result = jobs[index], results[index]
+        if stage == PublishStages.PUBLISH and job.get("with_checksum", False):
+            submit(
+                index,
+                PublishStages.CHECKSUM,
+                publish_checksums,
+                result["output"],
+                job["hashers"],
+                with_write_verification=job.get("with_write_verification", False),
+                checksum_cache=job.get("checksum_cache"),
+                uncompressed_hashers=job["uncompressed_hashers"],
+                uncompressed_output=(
+                    uncompressed_path(result["output"], job.get("compression"))
+                    if job["uncompressed_hashers"]
+                    else None
+                ),
+                verbose=verbose,
+            )
+        elif stage != PublishStages.SIGNATURE and job.get("with_signature", False):
+            submit(
+                index,
+                PublishStages.SIGNATURE,
+                publish_signature,
+                get_signature_input(
+                    result["output"],
+                    job["checksum_algorithms"],
+                    with_checksum=job.get("with_checksum", False),
+                    signature_source=job.get(
+                        "signature_source", SignatureSources.SOURCE_INPUT
+                    ),
+                ),
+                job.get("signature_key"),
+                signature_generator=job.get("signature_generator", SignatureTypes.GPG),
+                signature_args=job.get("signauture_args"),
+                signature_output=job.get("signature_output"),
+                signature_format=job.get("signature_format"),
+                verbose=verbose,
+            )
+        else:
+            result["success"] = True
+
+    try:
+        for index, job in enumerate(jobs):
+            job["checksum_algorithms"] = checksum_algorithm_list(
+                job.get("checksum_algorithm", ChecksumTypes.SHA256)
+            )
+            job["hashers"], job["uncompressed_hashers"] = None, None
+            if job.get("with_checksum", False):
+                job["hashers"] = new_hashers(job["checksum_algorithms"])
+                if not job["hashers"]:
+                    results[index]["failed_stage"] = PublishStages.PUBLISH
+                    continue
+                if job.get("compression") and job.get(
+                    "with_uncompressed_checksum", False
+                ):
+                    job["uncompressed_hashers"] = new_hashers(
+                        job["checksum_algorithms"]
+                    )
+            submit(
+                index,
+                PublishStages.PUBLISH,
+                publish_output,
+                job.get("source"),
+                job.get("destination"),
+                job.get("publish_type"),
+                hashers=job["hashers"],
+                container_session=job.get("container_session"),
+                baseline_archive=job.get("baseline_archive"),
+                archive_cache=job.get("archive_cache"),
+                compression=job.get("compression"),
+                compression_level=job.get("compression_level"),
+                uncompressed_hashers=job["uncompressed_hashers"],
+                verbose=verbose,
+            )
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, stage = pending.pop(future)
+                try:
+                    stage_result = future.result()
+                except Exception as err:
+                    print(
+                        "Failed the {} stage of publishing: {} - {}".format(
+                            stage, results[index]["source"], err
+                        )
+                    )
+                    stage_result = False
+
+                if not stage_result:
+                    results[index]["failed_stage"] = stage
+                    continue
+                if stage == PublishStages.PUBLISH:
+                    results[index]["output"] = stage_result
+                elif stage == PublishStages.CHECKSUM:
+                    results[index]["digests"] = stage_result
+                next_stage(index, stage)
+    finally:
+        for future in pending:
+            future.cancel()
+        for executor in executors.values():
+            executor.shutdown()
+    return results
 
 
 def publish_signature_key(
@@ -99,6 +512,7 @@ def publish_signature_key(
     destination,
     sign_command=SignatureTypes.GPG,
     sign_args=None,
+    keyring_index=None,
     verbose=False,
 ):
     if verbose:
@@ -110,15 +524,21 @@ def publish_signature_key(
         destination,
         sign_command=sign_command,
         sign_args=sign_args,
+        keyring_index=keyring_index,
         verbose=verbose,
     )
 
 
-def file_publish(source, destination):
+def file_publish(source, destination, hashers=None, verbose=False):
     """
     Publishes a file from source to destination by copy.
     The destination can be either a directory or a file.
+    If `hashers` are provided, they are updated with the content as it is copied.
+    Otherwise the fastest copy strategy that the filesystem supports is used,
+    e.g. a reflink when the source and destination are on the same XFS/Btrfs volume.
     """
     if not exists(source):
         return False
-    return copy(source, destination)
+    if hashers:
+        return hash_copy(source, destination, hashers)
+    return copy(source, destination, verbose=verbose)
@@ -14,22 +14,168 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
+import hashlib
+import io
+import json
+import os
+import tarfile
+import threading
+import time
+from contextlib import contextmanager
+
 from podman import PodmanClient
 from podman.domain.images import Image
 from podman.errors import ImageNotFound, APIError, BuildError
 
-from publish.utils.io import i_write
+from publish.archive import (
+    DOCKER_ARCHIVE_MANIFEST,
+    DOCKER_ARCHIVE_LAYER_NAME,
+    write_delta_archive,
+)
+from publish.cache import get_archive_cache
+from publish.compression import (
+    i_compress,
+    compression_available,
+    get_compression_level,
+)
+from publish.utils.io import (
+    i_write,
+    write,
+    exists,
+    makedirs,
+    remove,
+    load_json,
+    link_file,
+    hash_file,
+    is_tree_algorithm,
+    IterableReader,
+    KnownDigestHasher,
+)
+
+# Seconds that the metadata of an image is reused by a PodmanSession before it is looked up again
+IMAGE_CACHE_TTL = 30
+# How many connections to the podman socket a PodmanSession keeps open
+PODMAN_MAX_POOL_SIZE = 4
+# The format of a single archive that holds several images, in which each layer is stored once
+MULTI_IMAGE_ARCHIVE_FORMAT = "docker-archive"
+DEFAULT_EXPORT_CHUNK_SIZE = 2 * 1024 * 1024
+
+# The OCI image layout, see https://github.com/opencontainers/image-spec/blob/main/image-layout.md
+OCI_LAYOUT_FILE = "oci-layout"
+OCI_LAYOUT_VERSION = "1.0.0"
+OCI_INDEX_FILE = "index.json"
+OCI_BLOBS_DIR = "blobs"
+OCI_DIGEST_ALGORITHM = "sha256"
+OCI_BLOB_BUFFER_SIZE = 1024 * 1024
+OCI_INDEX_MEDIA_TYPE = "application/vnd.oci.image.index.v1+json"
+OCI_MANIFEST_MEDIA_TYPE = "application/vnd.oci.image.manifest.v1+json"
+OCI_CONFIG_MEDIA_TYPE = "application/vnd.oci.image.config.v1+json"
+OCI_LAYER_MEDIA_TYPE = "application/vnd.oci.image.layer.v1.tar"
+OCI_REF_NAME_ANNOTATION = "org.opencontainers.image.ref.name"
+
+
+class PodmanSession:
+    """
+    A PodmanClient that is reused across calls, such that the connections
+    to the podman socket are pooled, together with a short-lived cache of the
+    image metadata that has been looked up through it.
+    The session can be given as the `session` of the functions in this module.
+    """
+
+    def __init__(self, container_client_kwargs=None, image_cache_ttl=IMAGE_CACHE_TTL):
+        if not container_client_kwargs:
+            container_client_kwargs = {}
+        self.container_client_kwargs = dict(container_client_kwargs)
+        self.container_client_kwargs.setdefault("max_pool_size", PODMAN_MAX_POOL_SIZE)
+        self.image_cache_ttl = image_cache_ttl
+        self.lock = threading.Lock()
+        self.podman_client = None
+        self.images = {}
+        self.hits = 0
+        self.misses = 0
+
+    def client(self):
+        with self.lock:
+            if not self.podman_client:
+                self.podman_client = PodmanClient(**self.container_client_kwargs)
+            return self.podman_client
+
+    def get_image(self, image_name_or_id):
+        """
+        Return the image with the name or id `image_name_or_id`, or None if it does not exist.
+        An image that has been looked up within the last `image_cache_ttl` seconds is not looked up again.
+        """
+        with self.lock:
+            cached = self.images.get(image_name_or_id)
+            if cached and cached[0] > time.monotonic():
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        try:
+            image = self.client().images.get(image_name_or_id)
+        except ImageNotFound:
+            return None
+        with self.lock:
+            self.images[image_name_or_id] = (
+                time.monotonic() + self.image_cache_ttl,
+                image,
+            )
+        return image
+
+    def invalidate(self, image_name_or_id=None):
+        """
+        Forget the cached metadata of `image_name_or_id`, or of every image if None is given.
+        """
+        with self.lock:
+            if image_name_or_id is None:
+                self.images = {}
+            else:
+                self.images.pop(image_name_or_id, None)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self.lock:
+            self.images = {}
+            if self.podman_client:
+                self.podman_client.close()
+                self.podman_client = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+@contextmanager
+def podman_client(container_client_kwargs=None, session=None):
+    """
+    Yield the client of the `session` if one is given,
+    otherwise a new PodmanClient that is closed afterwards.
+    """
+    if session:
+        yield session.client()
+        return
+    if not container_client_kwargs:
+        container_client_kwargs = {}
+    with PodmanClient(**container_client_kwargs) as client:
+        yield client
 
 
 def container_publish_to_registry(
-    source, destination, container_client_kwargs=None, verbose=False
+    source, destination, container_client_kwargs=None, session=None, verbose=False
 ):
     """
     Publishes a container image from source to destination.
     The source is the image name and tag of the pre-built image that is to be published.
     The destination is the registry URL and the image name and tag to publish the image to.
     """
-    image = get_image(source, container_client_kwargs=container_client_kwargs)
+    image = get_image(
+        source, container_client_kwargs=container_client_kwargs, session=session
+    )
     if not image:
         return False
 
@@ -38,7 +184,7 @@ def container_publish_to_registry(
     # as a user service. e.g. systemctl --user enable/start podman
     # Another socket option can be set via the base_url parameter.
     # https://podman-py.readthedocs.io/en/stable/podman.client.html
-    with PodmanClient(**container_client_kwargs) as client:
+    with podman_client(container_client_kwargs, session=session) as client:
         try:
             return client.images.push(image, destination=destination)
         except APIError as error:
@@ -48,34 +194,541 @@ def container_publish_to_registry(
     return False
 
 
+def cacheable_digests(hashers):
+    # The tree digests are not cached, since their chunk digests are also required
+    return {
+        algorithm: hasher.hexdigest()
+        for algorithm, hasher in (hashers or {}).items()
+        if not is_tree_algorithm(algorithm)
+    }
+
+
+def publish_cached_archive(
+    cached_archive, destination, hashers=None, uncompressed_hashers=None, verbose=False
+):
+    """
+    Publish the `cached_archive`, see `publish.cache.ArchiveCache.get`, to `destination`
+    by copying it, see `publish.utils.io.link_file`, instead of saving the image again.
+    The `hashers` of the algorithms whose digest is cached are replaced by the cached digest,
+    while the remaining ones, e.g. tree digests that also require the chunk digests,
+    are updated by reading the copied archive.
+    The `uncompressed_hashers` of a compressed archive can only be replaced by cached digests,
+    so the archive is not reused if any of them is not cached.
+    """
+    uncompressed_digests = cached_archive["uncompressed_digests"]
+    if set(uncompressed_hashers or {}) - set(uncompressed_digests):
+        return False
+
+    strategy = link_file(cached_archive["path"], destination)
+    if not strategy:
+        return False
+    for algorithm in list(uncompressed_hashers or {}):
+        uncompressed_hashers[algorithm] = KnownDigestHasher(
+            algorithm, uncompressed_digests[algorithm]
+        )
+    if verbose:
+        print(
+            f"Reused the cached archive: {cached_archive['path']} for: {destination} via: {strategy}"
+        )
+    if not hashers:
+        return True
+
+    uncached_hashers = {}
+    for algorithm, hasher in hashers.items():
+        digest = cached_archive["digests"].get(algorithm)
+        if digest and not is_tree_algorithm(algorithm):
+            hashers[algorithm] = KnownDigestHasher(algorithm, digest)
+        else:
+            uncached_hashers[algorithm] = hasher
+    if uncached_hashers:
+        return hash_file(destination, uncached_hashers)
+    return True
+
+
 def container_publish_to_archive(
-    source, destination, container_client_kwargs=None, verbose=False
+    source,
+    destination,
+    container_client_kwargs=None,
+    hashers=None,
+    session=None,
+    archive_cache=None,
+    compression=None,
+    compression_level=None,
+    uncompressed_hashers=None,
+    verbose=False,
 ):
+    """
+    Publishes a container image from source to a tarball archive at destination.
+    If `hashers` are provided, they are updated with the archive content as it is written.
+    If a `session` is given, its connection and image metadata cache are used to look up the image.
+    If the `archive_cache` is enabled, see `publish.cache.get_archive_cache`, an unchanged archive
+    that was published before from the same image id and tags is reused instead of saving the image.
+    If a `compression` is selected, the archive is compressed in parallel blocks as it is written,
+    see `publish.compression.i_compress`, in which case the `hashers` cover the compressed archive
+    and the `uncompressed_hashers` are updated with the uncompressed archive in the same pass.
+    """
     if not container_client_kwargs:
         container_client_kwargs = {}
+    if compression:
+        if not compression_available(compression):
+            if verbose:
+                print(f"The compression: {compression} is not available")
+            return False
+        compression_level = get_compression_level(compression, compression_level)
 
-    image = get_image(source, container_client_kwargs=container_client_kwargs)
+    image = get_image(
+        source, container_client_kwargs=container_client_kwargs, session=session
+    )
     if not image:
         return False
 
+    cache = get_archive_cache(archive_cache)
+    if cache:
+        cached_archive = cache.get(
+            image.id,
+            image.tags,
+            compression=compression,
+            compression_level=compression_level,
+        )
+        if cached_archive and publish_cached_archive(
+            cached_archive,
+            destination,
+            hashers=hashers,
+            uncompressed_hashers=uncompressed_hashers if compression else None,
+            verbose=verbose,
+        ):
+            return True
+        # The destination can share its inode with another file, e.g. a cached archive
+        # that an earlier version hard linked it to, which must not be overwritten
+        # by the new archive
+        if exists(destination) and not remove(destination):
+            return False
+
     try:
         # Returns a tarball of the image
         tarball = image.save(named=True)
-        return i_write(destination, tarball, mode="wb")
+        if compression:
+            tarball = i_compress(
+                tarball,
+                compression,
+                level=compression_level,
+                hashers=uncompressed_hashers,
+            )
+        if not i_write(destination, tarball, mode="wb", hashers=hashers):
+            return False
     except APIError as error:
         if verbose:
             print(f"Error saving image: {error}")
         return False
-    return False
 
+    if cache:
+        cache.set(
+            image.id,
+            image.tags,
+            destination,
+            digests=cacheable_digests(hashers),
+            uncompressed_digests=(
+                cacheable_digests(uncompressed_hashers) if compression else None
+            ),
+            compression=compression,
+            compression_level=compression_level,
+        )
+    return True
+
+
+def container_publish_delta_archive(
+    source,
+    destination,
+    baseline_archive,
+    container_client_kwargs=None,
+    hashers=None,
+    session=None,
+    verbose=False,
+):
+    """
+    Publishes a container image from source to a delta archive at destination,
+    which only holds the layers and config that are not in the `baseline_archive`,
+    see `publish.archive.write_delta_archive`.
+    If `hashers` are provided, they are updated with the delta archive as it is written.
+    """
+    image = get_image(
+        source, container_client_kwargs=container_client_kwargs, session=session
+    )
+    if not image:
+        return False
+
+    try:
+        tarball = image.save(named=True)
+        return write_delta_archive(
+            tarball, destination, baseline_archive, hashers=hashers, verbose=verbose
+        )
+    except APIError as error:
+        if verbose:
+            print(f"Error saving image: {error}")
+        return False
+
+
+def image_reference(image):
+    # The first tag is used to identify the image in the archive, as with `Image.save(named=True)`
+    if image.tags:
+        return image.tags[0]
+    return image.id
+
+
+def container_publish_images_to_archive(
+    sources,
+    destination,
+    container_client_kwargs=None,
+    hashers=None,
+    session=None,
+    verbose=False,
+):
+    """
+    Publishes several container images from `sources` to a single docker-archive at `destination`,
+    in which the layers that the images share are only stored once.
+    If `hashers` are provided, they are updated with the archive content as it is written.
+    Returns the layer statistics of the archive, see `archive_layer_stats`, or False.
+    """
+    references = []
+    for source in sources:
+        image = get_image(
+            source, container_client_kwargs=container_client_kwargs, session=session
+        )
+        if not image:
+            if verbose:
+                print(f"Container image to publish not found: {source}")
+            return False
+        references.append(image_reference(image))
 
-def build_image(container_client_kwargs=None, **build_kwargs):
+    with podman_client(container_client_kwargs, session=session) as client:
+        try:
+            response = client.api.get(
+                "/images/export",
+                params={
+                    "references": references,
+                    "format": MULTI_IMAGE_ARCHIVE_FORMAT,
+                    "compress": False,
+                },
+                stream=True,
+            )
+            response.raise_for_status(not_found=ImageNotFound)
+            if not i_write(
+                destination,
+                response.iter_content(chunk_size=DEFAULT_EXPORT_CHUNK_SIZE),
+                mode="wb",
+                hashers=hashers,
+            ):
+                return False
+        except (APIError, ImageNotFound) as error:
+            if verbose:
+                print(f"Error exporting images: {error}")
+            return False
+
+    stats = archive_layer_stats(destination)
+    if not stats:
+        return False
+    if verbose:
+        print(
+            f"Stored {stats['unique_layers']} unique of {stats['layers']} layers of {stats['images']} images in: {destination}, saving {stats['saved_bytes']} bytes"
+        )
+    return stats
+
+
+def archive_layer_stats(archive_path):
+    """
+    Count the layers of the images in the docker-archive at `archive_path`, and the bytes
+    that they take up when each layer is stored once, as in the archive, versus when
+    every image is stored in an archive of its own.
+    Returns None if the archive can't be read.
+    """
+    try:
+        with tarfile.open(archive_path, "r:") as archive:
+            members = archive.getmembers()
+            manifest = json.load(archive.extractfile(DOCKER_ARCHIVE_MANIFEST))
+    except (OSError, tarfile.TarError, KeyError, ValueError) as err:
+        print("Failed to read the archive layers: {} - {}".format(archive_path, err))
+        return None
+
+    member_sizes = {member.name: member.size for member in members if member.isfile()}
+    # Layers that are shared in the legacy layout are symlinks to a single layer file
+    for member in members:
+        if member.issym():
+            target = os.path.normpath(
+                os.path.join(os.path.dirname(member.name), member.linkname)
+            )
+            member_sizes[member.name] = member_sizes.get(target, 0)
+
+    image_layers = [layer for image in manifest for layer in image.get("Layers", [])]
+    unique_layers = set(image_layers)
+    layer_bytes = sum(member_sizes.get(layer, 0) for layer in image_layers)
+    stored_layer_bytes = sum(member_sizes.get(layer, 0) for layer in unique_layers)
+    return {
+        "images": len(manifest),
+        "layers": len(image_layers),
+        "unique_layers": len(unique_layers),
+        "layer_bytes": layer_bytes,
+        "stored_layer_bytes": stored_layer_bytes,
+        "saved_bytes": layer_bytes - stored_layer_bytes,
+    }
+
+
+def oci_blob_path(layout_path, digest):
+    algorithm, hexdigest = digest.split(":", 1)
+    return os.path.join(layout_path, OCI_BLOBS_DIR, algorithm, hexdigest)
+
+
+def write_oci_blob(layout_path, fh, expected_digest=None):
+    """
+    Write the content of `fh` as a blob of the OCI image layout at `layout_path`.
+    The blob is written to a temporary file first, which is renamed to
+    the digest of its content once it has been completely written.
+    Returns the digest and size of the blob, or None on failure.
+    """
+    blobs_dir = os.path.join(layout_path, OCI_BLOBS_DIR, OCI_DIGEST_ALGORITHM)
+    tmp_path = os.path.join(
+        blobs_dir, f".{os.getpid()}.{threading.get_ident()}.{time.monotonic_ns()}.tmp"
+    )
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as blob:
+            for chunk in iter(lambda: fh.read(OCI_BLOB_BUFFER_SIZE), b""):
+                blob.write(chunk)
+                hasher.update(chunk)
+                size += len(chunk)
+        digest = f"{OCI_DIGEST_ALGORITHM}:{hasher.hexdigest()}"
+        if expected_digest and digest != expected_digest:
+            print(
+                "Failed to write blob: {} - the content has the digest: {}".format(
+                    expected_digest, digest
+                )
+            )
+            os.remove(tmp_path)
+            return None
+        os.replace(tmp_path, oci_blob_path(layout_path, digest))
+    except OSError as err:
+        print("Failed to write blob to: {} - {}".format(layout_path, err))
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+    return digest, size
+
+
+def write_oci_blob_bytes(layout_path, content, stats):
+    digest = f"{OCI_DIGEST_ALGORITHM}:{hashlib.sha256(content).hexdigest()}"
+    if os.path.exists(oci_blob_path(layout_path, digest)):
+        stats["skipped_blobs"] += 1
+        stats["skipped_bytes"] += len(content)
+        return digest, len(content)
+    written = write_oci_blob(layout_path, io.BytesIO(content), expected_digest=digest)
+    if written:
+        stats["written_blobs"] += 1
+        stats["written_bytes"] += len(content)
+    return written
+
+
+def docker_archive_to_oci_layout(i_archive, layout_path, hashers=None, verbose=False):
+    """
+    Convert the streamed docker-archive `i_archive` into the OCI image layout at `layout_path`.
+    Layers are written to the content addressed blobs directory as the archive is read,
+    where layers that are already in the layout are skipped without being written again.
+    The image manifests are then added to the index.json of the layout,
+    which `hashers` are updated with as it is written.
+    Each manifest is annotated with the tags of its image in the archive.
+
+    Returns the statistics of the written and skipped blobs, or False on failure.
+    """
+    blobs_dir = os.path.join(layout_path, OCI_BLOBS_DIR, OCI_DIGEST_ALGORITHM)
+    if not exists(blobs_dir) and not makedirs(blobs_dir):
+        return False
+
+    stats = {
+        "images": 0,
+        "written_blobs": 0,
+        "written_bytes": 0,
+        "skipped_blobs": 0,
+        "skipped_bytes": 0,
+    }
+    # The blob of each layer in the archive, and the content of the other small files,
+    # of which the configs are only known once the manifest.json has been read
+    layer_blobs, small_files, symlinks = {}, {}, {}
+    reader = io.BufferedReader(IterableReader(i_archive), OCI_BLOB_BUFFER_SIZE)
+    try:
+        with tarfile.open(fileobj=reader, mode="r|") as archive:
+            for member in archive:
+                if member.issym() or member.islnk():
+                    symlinks[member.name] = os.path.normpath(
+                        os.path.join(os.path.dirname(member.name), member.linkname)
+                    )
+                    continue
+                if not member.isfile():
+                    continue
+                if not member.name.endswith(".tar"):
+                    small_files[member.name] = archive.extractfile(member).read()
+                    continue
+
+                # Layers that are named by their digest are skipped without reading them
+                named_digest = DOCKER_ARCHIVE_LAYER_NAME.match(
+                    os.path.basename(member.name)
+                )
+                expected_digest = None
+                if named_digest:
+                    expected_digest = f"{OCI_DIGEST_ALGORITHM}:{named_digest[1]}"
+                    if os.path.exists(oci_blob_path(layout_path, expected_digest)):
+                        layer_blobs[member.name] = (expected_digest, member.size)
+                        stats["skipped_blobs"] += 1
+                        stats["skipped_bytes"] += member.size
+                        continue
+                written = write_oci_blob(
+                    layout_path,
+                    archive.extractfile(member),
+                    expected_digest=expected_digest,
+                )
+                if not written:
+                    return False
+                layer_blobs[member.name] = written
+                stats["written_blobs"] += 1
+                stats["written_bytes"] += written[1]
+    except (OSError, tarfile.TarError) as err:
+        print("Failed to read the image archive for: {} - {}".format(layout_path, err))
+        return False
+
+    try:
+        archive_manifest = json.loads(small_files[DOCKER_ARCHIVE_MANIFEST])
+    except (KeyError, ValueError) as err:
+        print("Failed to read the image archive manifest - {}".format(err))
+        return False
+
+    index_path = os.path.join(layout_path, OCI_INDEX_FILE)
+    index = {
+        "schemaVersion": 2,
+        "mediaType": OCI_INDEX_MEDIA_TYPE,
+        "manifests": [],
+    }
+    if exists(index_path):
+        index = load_json(index_path)
+        if not index:
+            return False
+
+    for image in archive_manifest:
+        config_name = symlinks.get(image["Config"], image["Config"])
+        if config_name not in small_files:
+            print("Failed to find the image config: {}".format(image["Config"]))
+            return False
+        config = write_oci_blob_bytes(layout_path, small_files[config_name], stats)
+        if not config:
+            return False
+
+        layers = []
+        for layer in image["Layers"]:
+            layer_name = symlinks.get(layer, layer)
+            if layer_name not in layer_blobs:
+                print("Failed to find the image layer: {}".format(layer))
+                return False
+            digest, size = layer_blobs[layer_name]
+            layers.append(
+                {"mediaType": OCI_LAYER_MEDIA_TYPE, "digest": digest, "size": size}
+            )
+        manifest = json.dumps(
+            {
+                "schemaVersion": 2,
+                "mediaType": OCI_MANIFEST_MEDIA_TYPE,
+                "config": {
+                    "mediaType": OCI_CONFIG_MEDIA_TYPE,
+                    "digest": config[0],
+                    "size": config[1],
+                },
+                "layers": layers,
+            },
+            sort_keys=True,
+        ).encode()
+        manifest_blob = write_oci_blob_bytes(layout_path, manifest, stats)
+        if not manifest_blob:
+            return False
+
+        descriptor = {
+            "mediaType": OCI_MANIFEST_MEDIA_TYPE,
+            "digest": manifest_blob[0],
+            "size": manifest_blob[1],
+        }
+        names = image.get("RepoTags") or []
+        if names:
+            # A re-published name points to the new manifest instead of the old one
+            index["manifests"] = [
+                existing
+                for existing in index["manifests"]
+                if existing.get("annotations", {}).get(OCI_REF_NAME_ANNOTATION)
+                not in names
+            ]
+            for name in names:
+                index["manifests"].append(
+                    dict(descriptor, annotations={OCI_REF_NAME_ANNOTATION: name})
+                )
+        elif descriptor not in index["manifests"]:
+            index["manifests"].append(descriptor)
+        stats["images"] += 1
+
+    if not write(
+        os.path.join(layout_path, OCI_LAYOUT_FILE),
+        json.dumps({"imageLayoutVersion": OCI_LAYOUT_VERSION}),
+    ):
+        return False
+    # The index is replaced at once, such that readers never see a partial index
+    tmp_index_path = f"{index_path}.{os.getpid()}.tmp"
+    if not i_write(
+        tmp_index_path,
+        [json.dumps(index, indent=2).encode()],
+        mode="wb",
+        hashers=hashers,
+    ):
+        return False
+    os.replace(tmp_index_path, index_path)
+    if verbose:
+        print(
+            f"Wrote {stats['written_blobs']} blobs ({stats['written_bytes']} bytes) and skipped {stats['skipped_blobs']} existing blobs ({stats['skipped_bytes']} bytes) in: {layout_path}"
+        )
+    return stats
+
+
+def container_publish_to_oci_layout(
+    source,
+    destination,
+    container_client_kwargs=None,
+    hashers=None,
+    session=None,
+    verbose=False,
+):
+    """
+    Publishes a container image from source to the OCI image layout directory at destination,
+    see `docker_archive_to_oci_layout`.
+    If `hashers` are provided, they are updated with the index.json of the layout,
+    which references the content addressed manifest, config and layers of the image.
+    """
+    image = get_image(
+        source, container_client_kwargs=container_client_kwargs, session=session
+    )
+    if not image:
+        return False
+
+    try:
+        tarball = image.save(named=True)
+        return docker_archive_to_oci_layout(
+            tarball, destination, hashers=hashers, verbose=verbose
+        )
+    except APIError as error:
+        if verbose:
+            print(f"Error saving image: {error}")
+        return False
+
+
+def build_image(container_client_kwargs=None, session=None, **build_kwargs):
     # Options for the possible build_kwargs can be seen at
     # https://podman-py.readthedocs.io/en/stable/podman.domain.images_manager.html#podman.domain.images_manager.ImagesManager.build
-    if not container_client_kwargs:
-        container_client_kwargs = {}
+    if session:
+        # A build can retag any image, so the cached image metadata is stale
+        session.invalidate()
 
-    with PodmanClient(**container_client_kwargs) as client:
+    with podman_client(container_client_kwargs, session=session) as client:
         try:
             image = client.images.build(**build_kwargs)
             return isinstance(image[0], Image)
@@ -85,11 +738,11 @@ def build_image(container_client_kwargs=None, **build_kwargs):
     return False
 
 
-def remove_image(name_or_id, container_client_kwargs=None, verbose=False):
-    if not container_client_kwargs:
-        container_client_kwargs = {}
+def remove_image(name_or_id, container_client_kwargs=None, session=None, verbose=False):
+    if session:
+        session.invalidate()
 
-    with PodmanClient(**container_client_kwargs) as client:
+    with podman_client(container_client_kwargs, session=session) as client:
         try:
             results = client.images.remove(name_or_id)
             for result in results:
@@ -102,25 +755,21 @@ def remove_image(name_or_id, container_client_kwargs=None, verbose=False):
     return False
 
 
-def exists_image(image_id, container_client_kwargs=None):
-    with PodmanClient(**container_client_kwargs) as client:
+def exists_image(image_id, container_client_kwargs=None, session=None):
+    if session:
+        return session.get_image(image_id) is not None
+
+    with podman_client(container_client_kwargs) as client:
         return client.images.exists(image_id)
 
 
-def get_image(image_name_or_id, container_client_kwargs=None):
-    if not container_client_kwargs:
-        container_client_kwargs = {}
+def get_image(image_name_or_id, container_client_kwargs=None, session=None):
+    if session:
+        return session.get_image(image_name_or_id)
 
-    with PodmanClient(**container_client_kwargs) as client:
+    with podman_client(container_client_kwargs) as client:
         try:
             return client.images.get(image_name_or_id)
         except ImageNotFound:
             return None
     return None
-
-
-# def podman_client(container_client_kwargs=None, verbose=False):
-#     if "XDG_RUNTIME_DIR" not in os.environ:
-#         if verbose:
-#             print("XDG_RUNTIME_DIR is not set. Podman client may not work as expected. Suggesting that it be set to a user available runtime directory such as /run/user/<user_id>")
-#     return PodmanClient(**container_client_kwargs)
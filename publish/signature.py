@@ -14,8 +14,16 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
+import contextvars
+import hashlib
+import json
 import os
-from publish.utils.io import write
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from publish.cache import get_cache_dir, get_verification_cache, file_identity
+from publish.utils.io import write, exists, makedirs
 from publish.utils.job import run
 from publish.common import StrEnum
 
@@ -29,16 +37,101 @@ class SignatureSources(StrEnum):
     GENERATED_CHECKSUM_FILE = "generated_checksum_file"
 
 
+class SignatureFormats(StrEnum):
+    # A signed copy of the input
+    INLINE = "inline"
+    # A separate signature of the input that does not copy it
+    DETACHED = "detached"
+    # A signed copy of a text input that remains readable
+    CLEARSIGN = "clearsign"
+
+
+class KeyMatches(StrEnum):
+    # Every required key must have made a good signature
+    ALL = "all"
+    # At least one of the required keys must have made a good signature
+    ANY = "any"
+
+
+GPG_SIGNATURE_FORMAT_ARGS = {
+    SignatureFormats.INLINE: "--sign",
+    SignatureFormats.DETACHED: "--detach-sign",
+    SignatureFormats.CLEARSIGN: "--clearsign",
+}
+# Short options that gpg also accepts to select the signature format
+GPG_SIGNATURE_FORMAT_SHORT_ARGS = ["-s", "-b"]
+DETACHED_SIGNATURE_EXTENSION = "sig"
+
+
 # When using the gpg --fingerprint command with --with-colons
 # the fingerprint is stored in the 10th field in the output string with the "fpr" prefix
 # if you split on the : character
 GPG_KEY_FINGERPRINT_SPLIT_CHAR = ":"
 GPG_KEY_FINGERPRINT_COLON_PREFIX = "fpr"
 GPG_KEY_FINGERPRINT_COLON_INDEX = 9
+# The lengths of the short and long key ids, and the v4 and v5 fingerprints
+GPG_KEY_ID_LENGTHS = [8, 16, 40, 64]
+
+GPG_HOMEDIR_ARG = "--homedir"
+GPG_HOME_ENV = "GNUPGHOME"
+# The files in the gpg home directory that change when keys are added, removed or (re)trusted
+GPG_KEYRING_FILES = ["pubring.kbx", "pubring.gpg", "trustdb.gpg"]
+# Arguments that select other keyrings than those in the home directory
+GPG_KEYRING_ARGS = ["--keyring", "--primary-keyring"]
+GPG_NO_DEFAULT_KEYRING_ARG = "--no-default-keyring"
+KEYRING_INDEX_DIR_NAME = "keyrings"
+# Setting this environment variable to a non-empty value enables the keyring index
+# for every key lookup and export that does not explicitly select an index.
+KEYRING_CACHE_ENV = "PUBLISH_KEYRING_CACHE"
+
+# Signatures up to this size are identified by their content in the verification cache,
+# larger inline signed files by their path, size and modification time
+VERIFICATION_CACHE_SIGNATURE_HASH_LIMIT = 1024 * 1024
+
+_keyring_indexes = {}
+_keyring_indexes_lock = threading.Lock()
 
 GPG_VERIFY_OUTPUT_PREFIX = "[GNUPG:] "
 GPG_VERIFY_SUCCESS_PREFIX = f"{GPG_VERIFY_OUTPUT_PREFIX}GOODSIG"
 
+# The --status-fd keywords that are used to split the status stream of a
+# batch verification into the results of each file and each signature, see
+# https://github.com/gpg/gnupg/blob/master/doc/DETAILS
+GPG_STATUS_FILE_START = "FILE_START"
+GPG_STATUS_FILE_DONE = "FILE_DONE"
+GPG_STATUS_FILE_ERROR = "FILE_ERROR"
+GPG_STATUS_NEWSIG = "NEWSIG"
+GPG_STATUS_VALIDSIG = "VALIDSIG"
+GPG_STATUS_GOODSIG = "GOODSIG"
+# The keywords that report the outcome of a signature check,
+# each is followed by the long key id and the user id of the signer
+GPG_STATUS_SIGNATURE_RESULTS = [
+    GPG_STATUS_GOODSIG,
+    "EXPSIG",
+    "EXPKEYSIG",
+    "REVKEYSIG",
+    "BADSIG",
+]
+# ERRSIG is followed by the long key id of the signer, but the signature could not be checked
+GPG_STATUS_ERRSIG = "ERRSIG"
+GPG_VERIFY_FORMAT_ARGS = ["--verify", "--verify-files", "--multifile"]
+# Errors that gpg reports when concurrent invocations contend for the
+# gpg-agent or the keyring locks, after which the invocation can be retried
+GPG_TRANSIENT_ERRORS = [
+    "waiting for lock",
+    "can't connect to the agent",
+    "IPC connect call failed",
+    "Resource temporarily unavailable",
+    "Connection timed out",
+]
+SIGN_RETRIES = 3
+# Seconds to wait before the first retry, which is doubled for each following retry
+SIGN_RETRY_DELAY = 0.5
+
+# How many files are verified by a single gpg --verify-files invocation,
+# which keeps the command line within the argument size limit
+GPG_VERIFY_FILES_CHUNK_SIZE = 1000
+
 
 def gen_key(
     key_name,
@@ -60,7 +153,7 @@ def gen_key(
         gen_command.append("--quiet")
 
     gen_command.append(key_name)
-    success, result = run(gen_command, output_format="str")
+    success, result = run(gen_command, output_format="str", label="gen_key")
     if not success:
         if verbose:
             print(
@@ -72,8 +165,18 @@ def gen_key(
 
 
 def get_key_fingerprint(
-    key_name, key_generator=SignatureTypes.GPG, key_args=None, verbose=False
+    key_name,
+    key_generator=SignatureTypes.GPG,
+    key_args=None,
+    keyring_index=None,
+    verbose=False,
 ):
+    keyring_index = get_keyring_index(
+        keyring_index, key_command=key_generator, key_args=key_args
+    )
+    if keyring_index:
+        return keyring_index.lookup(key_name, verbose=verbose)
+
     fingerprint_command = [key_generator]
     if not key_args:
         key_args = [
@@ -95,7 +198,7 @@ def get_key_fingerprint(
         fingerprint_command.append("--quiet")
     fingerprint_command.append(key_name)
 
-    success, result = run(fingerprint_command, output_format="str")
+    success, result = run(fingerprint_command, output_format="str", label="fingerprint")
     if not success:
         if verbose:
             print(
@@ -136,7 +239,7 @@ def delete_key(
     if not verbose:
         del_command.append("--quiet")
     del_command.append(key_fingerprint)
-    success, result = run(del_command, output_format="str")
+    success, result = run(del_command, output_format="str", label="delete_key")
     if not success:
         if verbose:
             print(
@@ -146,18 +249,390 @@ def delete_key(
     return True
 
 
+def gpg_option_values(args, option):
+    values = []
+    for index, arg in enumerate(args or []):
+        if arg == option and index + 1 < len(args):
+            values.append(args[index + 1])
+        elif arg.startswith(f"{option}="):
+            values.append(arg[len(option) + 1 :])
+    return values
+
+
+def gpg_homedir(args=None):
+    """
+    The gpg home directory that is selected by the `args`,
+    the GNUPGHOME environment variable, or the default ~/.gnupg.
+    """
+    homedirs = gpg_option_values(args, GPG_HOMEDIR_ARG)
+    if homedirs:
+        return os.path.realpath(os.path.expanduser(homedirs[-1]))
+    homedir = os.environ.get(GPG_HOME_ENV)
+    if not homedir:
+        homedir = os.path.join(os.path.expanduser("~"), ".gnupg")
+    return os.path.realpath(homedir)
+
+
+def gpg_keyring_args(args=None):
+    """
+    The arguments in `args` that select which keyrings gpg uses.
+    """
+    keyring_args = []
+    if args and GPG_NO_DEFAULT_KEYRING_ARG in args:
+        keyring_args.append(GPG_NO_DEFAULT_KEYRING_ARG)
+    for option in GPG_KEYRING_ARGS:
+        for value in gpg_option_values(args, option):
+            keyring_args.extend([option, value])
+    return keyring_args
+
+
+def keyring_files(homedir, keyring_args=None):
+    """
+    The files of the keyrings and the trust database that gpg uses with the `keyring_args`.
+    """
+    files = [os.path.join(homedir, keyring_file) for keyring_file in GPG_KEYRING_FILES]
+    # gpg looks up keyrings that are not given as a path in the home directory
+    for option in GPG_KEYRING_ARGS:
+        for keyring in gpg_option_values(keyring_args, option):
+            if os.sep not in keyring:
+                keyring = os.path.join(homedir, keyring)
+            files.append(os.path.expanduser(keyring))
+    return files
+
+
+def keyring_state(homedir, keyring_args=None):
+    """
+    The modification time and size of each of the `keyring_files`,
+    which change when keys are added, removed or (re)trusted.
+    """
+    state = []
+    for keyring_file in keyring_files(homedir, keyring_args):
+        try:
+            file_stat = os.stat(keyring_file)
+            state.append([file_stat.st_mtime_ns, file_stat.st_size])
+        except OSError:
+            state.append(None)
+    return state
+
+
+def unescape_colon_field(field):
+    # gpg escapes special characters in the --with-colons fields as \xHH
+    return re.sub(r"\\x([0-9a-fA-F]{2})", lambda match: chr(int(match[1], 16)), field)
+
+
+def parse_colon_keys(output):
+    """
+    Parse the `gpg --list-keys --with-colons --with-fingerprint --with-fingerprint`
+    `output` into a list of keys with their fingerprint, key id,
+    user ids and the fingerprints of their subkeys, in keyring order.
+    """
+    keys = []
+    key, record = None, None
+    for line in output.splitlines():
+        fields = line.split(GPG_KEY_FINGERPRINT_SPLIT_CHAR)
+        if fields[0] == "pub":
+            key = {
+                "fingerprint": None,
+                "key_id": fields[4],
+                "uids": [],
+                "subkeys": [],
+            }
+            keys.append(key)
+            record = "pub"
+        elif key is None:
+            continue
+        elif fields[0] == "sub":
+            record = "sub"
+        elif fields[0] == GPG_KEY_FINGERPRINT_COLON_PREFIX:
+            fingerprint = fields[GPG_KEY_FINGERPRINT_COLON_INDEX]
+            if record == "pub" and not key["fingerprint"]:
+                key["fingerprint"] = fingerprint
+            elif record == "sub":
+                key["subkeys"].append(fingerprint)
+        elif fields[0] == "uid" and len(fields) > 9:
+            key["uids"].append(unescape_colon_field(fields[9]))
+    return [key for key in keys if key["fingerprint"]]
+
+
+def key_matches_name(key, key_name):
+    """
+    Whether `key` is selected by `key_name`, following the gpg rules for
+    specifying a key by a fingerprint or key id, an exact (=) user id,
+    an exact (<) or partial (@) email address, or a part of a user id.
+    """
+    key_name = key_name.strip()
+    if key_name.startswith("="):
+        return key_name[1:] in key["uids"]
+    if key_name.startswith("<"):
+        email = key_name.lower()
+        if not email.endswith(">"):
+            email = f"{email}>"
+        return any(email in uid.lower() for uid in key["uids"])
+    if key_name.startswith("@"):
+        return any(
+            key_name[1:].lower() in uid[uid.find("<") :].lower()
+            for uid in key["uids"]
+            if "<" in uid
+        )
+    if key_name.startswith("*"):
+        key_name = key_name[1:]
+    else:
+        hex_id = key_name.rstrip("!")
+        if hex_id.upper().startswith("0X"):
+            hex_id = hex_id[2:]
+        if len(hex_id) in GPG_KEY_ID_LENGTHS and re.fullmatch(r"[0-9a-fA-F]+", hex_id):
+            return any(
+                identifier.upper().endswith(hex_id.upper())
+                for identifier in [key["fingerprint"], key["key_id"]] + key["subkeys"]
+            )
+    return any(key_name.lower() in uid.lower() for uid in key["uids"])
+
+
+class KeyringIndex:
+    """
+    An index of the keys in a gpg keyring that is built from a single `gpg --list-keys` run,
+    and which also caches the armored exports of the keys.
+    The index is persisted in the cache directory and rebuilt when the modification
+    time of the keyring or the trust database changes.
+    """
+
+    def __init__(
+        self,
+        homedir=None,
+        key_command=SignatureTypes.GPG,
+        keyring_args=None,
+        path=None,
+    ):
+        self.homedir = gpg_homedir() if not homedir else os.path.realpath(homedir)
+        self.key_command = key_command
+        if not keyring_args:
+            keyring_args = []
+        self.keyring_args = list(keyring_args)
+        if not path:
+            index_id = hashlib.sha256(
+                json.dumps([self.homedir, self.keyring_args]).encode()
+            ).hexdigest()
+            path = os.path.join(
+                get_cache_dir(), KEYRING_INDEX_DIR_NAME, f"{index_id}.json"
+            )
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = None
+        self.keys = []
+        self.exports = {}
+        self.refreshes = 0
+        self.loaded = False
+
+    def keyring_files(self):
+        return keyring_files(self.homedir, self.keyring_args)
+
+    def keyring_state(self):
+        return keyring_state(self.homedir, self.keyring_args)
+
+    def load(self):
+        if not exists(self.path):
+            return False
+        try:
+            with open(self.path, "r") as fh:
+                index = json.load(fh)
+        except (OSError, ValueError) as err:
+            print("Failed to load the keyring index: {} - {}".format(self.path, err))
+            return False
+        if (
+            index.get("homedir") != self.homedir
+            or index.get("keyring_args") != self.keyring_args
+        ):
+            return False
+        self.state = index["state"]
+        self.keys = index["keys"]
+        self.exports = index["exports"]
+        return True
+
+    def save(self):
+        cache_dir = os.path.dirname(self.path)
+        if cache_dir and not exists(cache_dir) and not makedirs(cache_dir):
+            return False
+        index = {
+            "homedir": self.homedir,
+            "keyring_args": self.keyring_args,
+            "state": self.state,
+            "keys": self.keys,
+            "exports": self.exports,
+        }
+        # Written to a temporary file first, such that concurrent readers never see a partial index
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if not write(tmp_path, json.dumps(index)):
+            return False
+        try:
+            os.replace(tmp_path, self.path)
+        except OSError as err:
+            print("Failed to save the keyring index: {} - {}".format(self.path, err))
+            return False
+        return True
+
+    def refresh(self, verbose=False):
+        list_command = [
+            self.key_command,
+            GPG_HOMEDIR_ARG,
+            self.homedir,
+            *self.keyring_args,
+            "--batch",
+            "--with-colons",
+            # Given twice, the fingerprints of the subkeys are listed as well
+            "--with-fingerprint",
+            "--with-fingerprint",
+            "--list-keys",
+        ]
+        success, result = run(list_command, output_format="str", label="list_keys")
+        if not success:
+            if verbose:
+                print(
+                    f"Failed to list the keys in: {self.homedir}, output: {result['output']}, error: {result['error']}"
+                )
+            return False
+        self.refreshes += 1
+        self.keys = parse_colon_keys(result["output"])
+        self.exports = {}
+        self.state = self.keyring_state()
+        self.save()
+        return True
+
+    def ensure_current(self, verbose=False):
+        if not self.loaded:
+            self.loaded = True
+            self.load()
+        if self.state is not None and self.state == self.keyring_state():
+            return True
+        return self.refresh(verbose=verbose)
+
+    def lookup_all(self, key_name, verbose=False):
+        """
+        Return the fingerprints of every key that `key_name` selects, in keyring order.
+        """
+        with self.lock:
+            if not self.ensure_current(verbose=verbose):
+                return None
+            return [
+                key["fingerprint"]
+                for key in self.keys
+                if key_matches_name(key, key_name)
+            ]
+
+    def lookup(self, key_name, verbose=False):
+        """
+        Return the fingerprint of the first key that `key_name` selects, or None.
+        """
+        fingerprints = self.lookup_all(key_name, verbose=verbose)
+        if not fingerprints:
+            return None
+        return fingerprints[0]
+
+    def get_export(self, fingerprints, export_args):
+        with self.lock:
+            if not self.ensure_current():
+                return None
+            return self.exports.get(json.dumps([fingerprints, export_args]))
+
+    def set_export(self, fingerprints, export_args, signature_key):
+        with self.lock:
+            if not self.ensure_current():
+                return False
+            self.exports[json.dumps([fingerprints, export_args])] = signature_key
+            return self.save()
+
+    def stats(self):
+        return {"refreshes": self.refreshes, "keys": len(self.keys)}
+
+
+def get_keyring_index(index=None, key_command=SignatureTypes.GPG, key_args=None):
+    """
+    Resolve which keyring index should be used for the gpg `key_args`.
+    A `index` of False disables the index and a KeyringIndex instance is used as is.
+    True selects the shared index of the home directory, which None also does
+    if the index has been enabled via the PUBLISH_KEYRING_CACHE environment variable.
+    """
+    if index is False:
+        return None
+    if index is None and not os.environ.get(KEYRING_CACHE_ENV):
+        return None
+    if isinstance(index, KeyringIndex):
+        return index
+    homedir = gpg_homedir(key_args)
+    keyring_args = gpg_keyring_args(key_args)
+    index_key = (key_command, homedir, tuple(keyring_args))
+    with _keyring_indexes_lock:
+        if index_key not in _keyring_indexes:
+            _keyring_indexes[index_key] = KeyringIndex(
+                homedir=homedir, key_command=key_command, keyring_args=keyring_args
+            )
+        return _keyring_indexes[index_key]
+
+
+def signature_format_args(sign_args, signature_format):
+    """
+    Replace the signature format options in `sign_args` with the option of `signature_format`.
+    """
+    format_args = (
+        list(GPG_SIGNATURE_FORMAT_ARGS.values()) + GPG_SIGNATURE_FORMAT_SHORT_ARGS
+    )
+    format_sign_args = [arg for arg in sign_args if arg not in format_args]
+    format_sign_args.append(GPG_SIGNATURE_FORMAT_ARGS[signature_format])
+    return format_sign_args
+
+
+def key_name_list(key_name):
+    if isinstance(key_name, str):
+        return [key_name]
+    return list(key_name)
+
+
+def get_signature_output(file_, sign_command=SignatureTypes.GPG, signature_format=None):
+    filename = os.path.basename(file_)
+    directory = os.path.dirname(file_)
+    if signature_format == SignatureFormats.DETACHED:
+        return os.path.join(directory, f"{filename}.{DETACHED_SIGNATURE_EXTENSION}")
+    return os.path.join(directory, f"{filename}.{sign_command}")
+
+
+def get_detached_signature_data(file_):
+    """
+    Return the path of the data file that the detached `.sig` signature `file_` signs,
+    or None if `file_` is not a detached signature with an existing data file.
+    """
+    suffix = f".{DETACHED_SIGNATURE_EXTENSION}"
+    if not file_.endswith(suffix):
+        return None
+    data_file = file_[: -len(suffix)]
+    if not data_file or not os.path.isfile(data_file):
+        return None
+    return data_file
+
+
 def sign_file(
     file_,
     key_name,
     sign_command=SignatureTypes.GPG,
     sign_args=None,
     output=None,
+    signature_format=None,
+    retries=0,
+    retry_delay=SIGN_RETRY_DELAY,
     verbose=False,
 ):
+    """
+    Sign `file_` with `key_name`, which can also be a list of keys,
+    in which case a signature of every key is made by a single pass over `file_`.
+    The `signature_format` selects whether an inline signed copy of `file_`, a detached signature
+    or a clearsigned copy is written, and replaces the format option in `sign_args`.
+    A detached signature is only a few hundred bytes and is written to `<file_>.sig` by default,
+    whereas the other formats are written to `<file_>.<sign_command>`.
+    If the signing fails because of a transient gpg-agent or keyring lock contention,
+    it is retried up to `retries` times with an exponential backoff from `retry_delay` seconds.
+    """
     if not output:
-        filename = os.path.basename(file_)
-        directory = os.path.dirname(file_)
-        output = os.path.join(directory, f"{filename}.{sign_command}")
+        output = get_signature_output(
+            file_, sign_command=sign_command, signature_format=signature_format
+        )
 
     if not sign_args:
         # https://www.gnupg.org/documentation/manuals/gnupg24/gpg.1.html
@@ -171,32 +646,99 @@ def sign_file(
             "--batch",
             "--sign",
         ]
+    if signature_format:
+        sign_args = signature_format_args(sign_args, signature_format)
 
     if verbose:
         print(
             f"Signing file: {file_} with key: {key_name} using the command: {sign_command} with arguments: {sign_args} outputting to: {output}"
         )
 
-    sign_job_command = [sign_command, "-u", key_name, "--output", output]
+    sign_job_command = [sign_command]
+    for signature_key in key_name_list(key_name):
+        sign_job_command.extend(["-u", signature_key])
+    sign_job_command.extend(["--output", output])
     if sign_args:
         sign_job_command.extend(sign_args)
     sign_job_command.append(file_)
     if verbose:
         print(f"Executing signing command: {' '.join(sign_job_command)}")
-    success, result = run(sign_job_command, output_format="str")
-    if not success:
+    for attempt in range(retries + 1):
+        success, result = run(sign_job_command, output_format="str", label="sign")
+        if success:
+            return True
+        transient = any(error in result["error"] for error in GPG_TRANSIENT_ERRORS)
+        if not transient or attempt == retries:
+            break
         if verbose:
             print(
-                f"Failed to sign file: {file_}, output: {result['output']} error: {result['error']}"
+                f"Retrying to sign file: {file_} after a transient error: {result['error']}"
             )
-        return False
-    return True
+        time.sleep(retry_delay * 2**attempt)
+    if verbose:
+        print(
+            f"Failed to sign file: {file_}, output: {result['output']} error: {result['error']}"
+        )
+    return False
+
+
+def sign_files(
+    files,
+    key_name,
+    jobs=None,
+    sign_command=SignatureTypes.GPG,
+    sign_args=None,
+    signature_format=None,
+    retries=SIGN_RETRIES,
+    verbose=False,
+):
+    """
+    Sign every file in `files` with `key_name` by up to `jobs` concurrent signers.
+    The signers share the gpg-agent of the selected home directory, and signings that fail
+    because of contention for the agent or the keyring locks are retried, see `sign_file`.
+    Returns a dictionary that maps each file to a result dictionary, holding whether it was signed,
+    the path of its signature and the latency in seconds of signing it.
+    """
+    if not jobs:
+        jobs = os.cpu_count() or 1
+    files = list(files)
+
+    def sign(file_):
+        start = time.perf_counter()
+        signed = sign_file(
+            file_,
+            key_name,
+            sign_command=sign_command,
+            sign_args=sign_args,
+            signature_format=signature_format,
+            retries=retries,
+            verbose=verbose,
+        )
+        return {
+            "signed": signed,
+            "output": get_signature_output(
+                file_, sign_command=sign_command, signature_format=signature_format
+            ),
+            "latency": time.perf_counter() - start,
+        }
+
+    # The files are signed in copies of the current context,
+    # such that an active `collect_resources` also records the sign commands
+    context = contextvars.copy_context()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return dict(
+            zip(
+                files,
+                executor.map(lambda file_: context.copy().run(sign, file_), files),
+            )
+        )
 
 
 def export_signature_key(
     key_name,
     sign_command=SignatureTypes.GPG,
     sign_args=None,
+    keyring_index=None,
     verbose=False,
 ):
     export_key_command = [sign_command]
@@ -208,17 +750,46 @@ def export_signature_key(
         export_key_command.append("--armor")
     if "--export" not in export_key_command:
         export_key_command.append("--export")
-    export_key_command.append(key_name)
+
+    key_names = key_name_list(key_name)
+    fingerprints = None
+    keyring_index = get_keyring_index(
+        keyring_index, key_command=sign_command, key_args=sign_args
+    )
+    if keyring_index:
+        # The keys are exported by their fingerprints, such that the export
+        # can be reused for every name that selects the same keys
+        fingerprints = []
+        for name in key_names:
+            name_fingerprints = keyring_index.lookup_all(name, verbose=verbose)
+            if not name_fingerprints:
+                fingerprints = None
+                break
+            fingerprints.extend(
+                fingerprint
+                for fingerprint in name_fingerprints
+                if fingerprint not in fingerprints
+            )
+    if fingerprints:
+        signature_key = keyring_index.get_export(fingerprints, export_key_command)
+        if signature_key:
+            return signature_key
+        key_names = fingerprints
+    export_key_command.extend(key_names)
 
     if verbose:
         print(f"Exporting the signature key: {key_name}")
-    success, result = run(export_key_command, output_format="str")
+    success, result = run(export_key_command, output_format="str", label="export")
     if not success:
         if verbose:
             print(
                 f"Failed to export the signature key: {key_name}, output: {result['output']}, error: {result['error']}"
             )
         return None
+    if fingerprints and result["output"]:
+        keyring_index.set_export(
+            fingerprints, export_key_command[: -len(fingerprints)], result["output"]
+        )
     return result["output"]
 
 
@@ -227,12 +798,14 @@ def write_signature_key_file(
     destination,
     sign_command=SignatureTypes.GPG,
     sign_args=None,
+    keyring_index=None,
     verbose=False,
 ):
     signature_key = export_signature_key(
         key_name,
         sign_command=sign_command,
         sign_args=sign_args,
+        keyring_index=keyring_index,
         verbose=verbose,
     )
     if not signature_key:
@@ -240,18 +813,67 @@ def write_signature_key_file(
     return write(destination, signature_key)
 
 
+def verification_cache_key(
+    files, key_name, verify_command=SignatureTypes.GPG, verify_args=None, options=None
+):
+    """
+    A digest of everything that the outcome of verifying the signed `files` depends on,
+    i.e. the identity of the files, the content of the signature, which is the first
+    of the `files`, the state of the keyring and how the verification is done.
+    Returns None if any of the `files` can't be accessed.
+    """
+    file_identities = []
+    for file_ in files:
+        try:
+            file_stat = os.stat(file_)
+        except OSError:
+            return None
+        file_identities.append([os.path.realpath(file_), *file_identity(file_stat)])
+
+    signature_digest = None
+    if file_identities[0][3] <= VERIFICATION_CACHE_SIGNATURE_HASH_LIMIT:
+        try:
+            with open(files[0], "rb") as fh:
+                signature_digest = hashlib.sha256(fh.read()).hexdigest()
+        except OSError:
+            return None
+
+    key = [
+        verify_command,
+        verify_args,
+        key_name,
+        options,
+        file_identities,
+        signature_digest,
+        keyring_state(gpg_homedir(verify_args), gpg_keyring_args(verify_args)),
+    ]
+    return hashlib.sha256(json.dumps(key).encode()).digest()
+
+
 def verify_file(
     file_,
     key_name,
     verify_command=SignatureTypes.GPG,
     verify_args=None,
     verify_additional_files=None,
+    required_keys=None,
+    required_keys_match=KeyMatches.ALL,
+    verification_cache=None,
     verbose=False,
 ):
     """
     Verify a file with a key using SignatureTypes.GPG by default.
     If the file is successfully verified, return True, otherwise return False.
 
+    If `required_keys` are given, the file must also carry good signatures from all
+    or any of them depending on `required_keys_match`, see `signatures_match_keys`.
+
+    If `file_` is a detached `.sig` signature and no `verify_additional_files` are given,
+    the signature is verified against the data file next to it.
+
+    If a `verification_cache` is selected, see `publish.cache.get_verification_cache`,
+    a successful verification is remembered until the files or the keyring change.
+
     Note:
     gpg will try to use every available public key in the selected keyring
     after the specified `key_name`. Therefore if the file is signed with any key
@@ -267,8 +889,57 @@ def verify_file(
             "--verify",
         ]
 
+    verification_cache = get_verification_cache(verification_cache)
+    cache_key = None
+    if verification_cache:
+        signed_files = [file_]
+        if verify_additional_files:
+            signed_files.extend(verify_additional_files)
+        elif get_detached_signature_data(file_):
+            signed_files.append(get_detached_signature_data(file_))
+        cache_key = verification_cache_key(
+            signed_files,
+            key_name,
+            verify_command=verify_command,
+            verify_args=verify_args,
+            options=["file", required_keys, required_keys_match],
+        )
+        if cache_key and verification_cache.get(cache_key):
+            if verbose:
+                print(f"Verified file: {file_} by the verification cache")
+            return True
+
+    if required_keys:
+        # The signers are parsed from the status stream of the verification
+        result = verify_file_status(
+            file_,
+            key_name,
+            verify_command=verify_command,
+            verify_args=verify_args,
+            verify_additional_files=verify_additional_files,
+            verbose=verbose,
+        )
+        verified = signatures_match_keys(
+            result["signatures"], required_keys, match=required_keys_match
+        )
+        if verbose:
+            if verified:
+                print(
+                    f"Successfully verified file: {file_} with {required_keys_match} of the keys: {', '.join(required_keys)}"
+                )
+            else:
+                print(
+                    f"Failed to verify file: {file_} with {required_keys_match} of the keys: {', '.join(required_keys)}, signatures: {result['signatures']}"
+                )
+        if verified and cache_key:
+            verification_cache.set(cache_key, result)
+        return verified
+
     if not verify_additional_files:
         verify_additional_files = []
+        data_file = get_detached_signature_data(file_)
+        if data_file:
+            verify_additional_files = [data_file]
 
     execute_command = [verify_command]
     execute_command.extend(verify_args)
@@ -281,13 +952,17 @@ def verify_file(
     if verbose:
         print(f"Executing command: {execute_command}")
 
-    success, result = run(execute_command, output_format="str")
+    success, result = run(execute_command, output_format="str", label="verify")
     if not success:
         if verbose:
             print(
                 f"Failed to verify file: {file_}, output: {result['output']}, error: {result['error']}"
             )
         return False
+    if cache_key:
+        verification_cache.set(
+            cache_key, {"verified": True, "signatures": [], "error": None}
+        )
     for line in result["output"].split("\n"):
         if line.startswith(GPG_VERIFY_SUCCESS_PREFIX):
             if verbose:
@@ -296,3 +971,239 @@ def verify_file(
     if verbose:
         print(f"Successfully verified file: {file_} with key: {key_name}")
     return True
+
+
+def parse_verify_status(lines):
+    """
+    Parse the gpg --status-fd `lines` of a single verified file.
+    Returns a result dictionary with a list of the signatures that were found in the file,
+    each with the status, key id, user id and fingerprint of the signature.
+    The file is verified if at least one signature was found and every signature is good.
+    """
+    signatures, error = [], None
+    for line in lines:
+        if not line.startswith(GPG_VERIFY_OUTPUT_PREFIX):
+            continue
+        keyword, _, arguments = line[len(GPG_VERIFY_OUTPUT_PREFIX) :].partition(" ")
+        if keyword == GPG_STATUS_NEWSIG or (
+            not signatures
+            and keyword in GPG_STATUS_SIGNATURE_RESULTS + [GPG_STATUS_ERRSIG]
+        ):
+            signatures.append(
+                {"status": None, "key_id": None, "uid": None, "fingerprint": None}
+            )
+        if keyword in GPG_STATUS_SIGNATURE_RESULTS:
+            key_id, _, uid = arguments.partition(" ")
+            signatures[-1].update({"status": keyword, "key_id": key_id, "uid": uid})
+        elif keyword == GPG_STATUS_ERRSIG:
+            signatures[-1].update(
+                {"status": keyword, "key_id": arguments.partition(" ")[0]}
+            )
+        elif keyword == GPG_STATUS_VALIDSIG and signatures:
+            # The first field is the fingerprint of the signing (sub)key
+            # and the last is the fingerprint of the primary key
+            fields = arguments.split(" ")
+            signatures[-1]["fingerprint"] = fields[9] if len(fields) > 9 else fields[0]
+        elif keyword == GPG_STATUS_FILE_ERROR:
+            error = f"Failed to open the file: {arguments.partition(' ')[2]}"
+
+    verified = bool(signatures) and all(
+        signature["status"] == GPG_STATUS_GOODSIG for signature in signatures
+    )
+    if not verified and not error:
+        error = "No valid signature was found" if not signatures else "Bad signature"
+    return {"verified": verified, "signatures": signatures, "error": error}
+
+
+def signature_matches_key(signature, key):
+    """
+    Whether the `signature` was made by `key`, which can be a fingerprint,
+    a long or short key id, or (a part of) the user id of the key.
+    """
+    key = key.strip()
+    if key.upper().startswith("0X"):
+        key = key[2:]
+    # Key ids shorter than a short key id are not matched against the fingerprint
+    if len(key) >= 8:
+        for identifier in (signature["fingerprint"], signature["key_id"]):
+            if identifier and identifier.upper().endswith(key.upper()):
+                return True
+    # User ids are matched case-insensitively, as gpg does
+    return bool(signature["uid"]) and key.lower() in signature["uid"].lower()
+
+
+def signatures_match_keys(signatures, required_keys, match=KeyMatches.ALL):
+    """
+    Whether the `signatures` of a verified file, see `parse_verify_status`,
+    include good signatures from all or any of the `required_keys`.
+    A bad signature always fails the match, since it means that the file was modified.
+    """
+    if any(signature["status"] == "BADSIG" for signature in signatures):
+        return False
+    good_signatures = [
+        signature
+        for signature in signatures
+        if signature["status"] == GPG_STATUS_GOODSIG
+    ]
+    matches = [
+        any(signature_matches_key(signature, key) for signature in good_signatures)
+        for key in key_name_list(required_keys)
+    ]
+    if match == KeyMatches.ANY:
+        return any(matches)
+    return bool(matches) and all(matches)
+
+
+def verify_status_args(verify_args, format_arg):
+    """
+    Replace the verification mode in `verify_args` with `format_arg`
+    and write the status stream to stdout, such that it can be parsed.
+    """
+    status_args, skip_next = [], False
+    for arg in verify_args:
+        if skip_next:
+            skip_next = False
+            continue
+        if arg == "--status-fd":
+            skip_next = True
+            continue
+        if arg in GPG_VERIFY_FORMAT_ARGS or arg.startswith("--status-fd="):
+            continue
+        status_args.append(arg)
+    return status_args + ["--status-fd", "1", format_arg]
+
+
+def verify_file_status(
+    file_,
+    key_name,
+    verify_command=SignatureTypes.GPG,
+    verify_args=None,
+    verify_additional_files=None,
+    verbose=False,
+):
+    """
+    Verify a single file, see `verify_file`, and return its parsed result dictionary.
+    """
+    if not verify_args:
+        verify_args = ["--no-tty", "--batch", "--with-colons"]
+    if not verify_additional_files:
+        verify_additional_files = []
+        data_file = get_detached_signature_data(file_)
+        if data_file:
+            verify_additional_files = [data_file]
+
+    execute_command = [verify_command]
+    execute_command.extend(verify_status_args(verify_args, "--verify"))
+    if not verbose:
+        execute_command.append("--quiet")
+    execute_command.extend(["-u", key_name, file_])
+    execute_command.extend(verify_additional_files)
+
+    success, result = run(execute_command, output_format="str", label="verify")
+    verify_result = parse_verify_status(result["output"].split("\n"))
+    if not success and verify_result["verified"]:
+        verify_result.update({"verified": False, "error": result["error"]})
+    return verify_result
+
+
+def verify_files(
+    files,
+    key_name,
+    verify_command=SignatureTypes.GPG,
+    verify_args=None,
+    chunk_size=GPG_VERIFY_FILES_CHUNK_SIZE,
+    verification_cache=None,
+    verbose=False,
+):
+    """
+    Verify many signed `files` with a few gpg --verify-files invocations,
+    each of which verifies up to `chunk_size` files.
+    Returns a dictionary that maps each file to its result dictionary, see `parse_verify_status`.
+
+    The status stream of each invocation is split into the results of each file at the
+    FILE_START and FILE_DONE status lines. gpg --verify-files can't pair a detached signature
+    with its data file, so detached `.sig` signatures are verified one at a time, as are the
+    files of a chunk whose status stream can't be split, e.g. with an older gpg version.
+
+    The results of files that are found in the `verification_cache` are returned
+    without verifying them again, see `verify_file`.
+    """
+    if not verify_args:
+        verify_args = ["--no-tty", "--batch", "--with-colons"]
+
+    files = list(files)
+    verification_cache = get_verification_cache(verification_cache)
+    results, batch_files, cache_keys = {}, [], {}
+    for file_ in files:
+        if verification_cache:
+            signed_files = [file_]
+            if get_detached_signature_data(file_):
+                signed_files.append(get_detached_signature_data(file_))
+            cache_key = verification_cache_key(
+                signed_files,
+                key_name,
+                verify_command=verify_command,
+                verify_args=verify_args,
+                options=["files"],
+            )
+            cached_result = cache_key and verification_cache.get(cache_key)
+            if cached_result:
+                results[file_] = cached_result
+                continue
+            if cache_key:
+                cache_keys[file_] = cache_key
+
+        if get_detached_signature_data(file_):
+            results[file_] = verify_file_status(
+                file_,
+                key_name,
+                verify_command=verify_command,
+                verify_args=verify_args,
+                verbose=verbose,
+            )
+        else:
+            batch_files.append(file_)
+
+    for chunk_start in range(0, len(batch_files), chunk_size):
+        chunk_files = batch_files[chunk_start : chunk_start + chunk_size]
+        execute_command = [verify_command]
+        execute_command.extend(verify_status_args(verify_args, "--verify-files"))
+        if not verbose:
+            execute_command.append("--quiet")
+        execute_command.extend(["-u", key_name])
+        execute_command.extend(chunk_files)
+        if verbose:
+            print(f"Verifying {len(chunk_files)} files with a single: {verify_command}")
+
+        # The command fails if any of the files fail to verify,
+        # so the results of each file are taken from the status stream
+        _, result = run(execute_command, output_format="str", label="verify")
+        file_lines = []
+        for line in result["output"].split("\n"):
+            if line.startswith(f"{GPG_VERIFY_OUTPUT_PREFIX}{GPG_STATUS_FILE_START}"):
+                file_lines.append([])
+            elif file_lines:
+                file_lines[-1].append(line)
+
+        if len(file_lines) != len(chunk_files):
+            if verbose:
+                print(
+                    f"Failed to split the status output of: {verify_command} into {len(chunk_files)} files, verifying them one at a time"
+                )
+            for file_ in chunk_files:
+                results[file_] = verify_file_status(
+                    file_,
+                    key_name,
+                    verify_command=verify_command,
+                    verify_args=verify_args,
+                    verbose=verbose,
+                )
+            continue
+
+        for file_, lines in zip(chunk_files, file_lines):
+            results[file_] = parse_verify_status(lines)
+
+    for file_, cache_key in cache_keys.items():
+        if results[file_]["verified"]:
+            verification_cache.set(cache_key, results[file_])
+    return {file_: results[file_] for file_ in files}
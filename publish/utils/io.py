@@ -14,11 +14,53 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
+import io
 import os
+import errno
 import fcntl
-import yaml
+import mmap
 import shutil
 import json
+import threading
+from stat import S_ISREG
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from publish.common import StrEnum
+
+# The hashing buffer is sized as a multiple of the preferred I/O block size
+# of the file, within these bounds.
+HASH_MIN_BUFFER_SIZE = 64 * 1024
+HASH_TARGET_BUFFER_SIZE = 1024 * 1024
+
+# Algorithms with this suffix, e.g. sha256tree, are calculated as a tree digest
+# of fixed-size chunks that are hashed in parallel, see TreeHasher.
+TREE_HASH_SUFFIX = "tree"
+TREE_CHUNK_SIZE = 8 * 1024 * 1024
+
+# The maximum number of bytes that is handed to the kernel per copy call
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+# The buffer size used by the userspace fallback copy
+COPY_BUFFER_SIZE = 1024 * 1024
+# Linux ioctl that shares the extents of one file with another (reflink)
+FICLONE = 0x40049409
+# Errors that indicate a copy strategy is not supported
+# for the given files, such that the next strategy should be tried
+COPY_UNSUPPORTED_ERRNOS = {
+    errno.EXDEV,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.ENOTTY,
+    errno.EOPNOTSUPP,
+    errno.ENOTSUP,
+    errno.EPERM,
+    errno.EBADF,
+}
+
+
+class CopyStrategies(StrEnum):
+    REFLINK = "reflink"
+    COPY_FILE_RANGE = "copy_file_range"
+    SENDFILE = "sendfile"
+    BUFFERED = "buffered"
 
 
 def makedirs(path):
@@ -71,9 +113,16 @@ def write(path, content, mode="w", mkdirs=False, opener=None):
     return False
 
 
-def i_write(path, i_content, mode="w", mkdirs=False, opener=None):
+def i_write(path, i_content, mode="w", mkdirs=False, opener=None, hashers=None):
+    """
+    Write each chunk of the iterable `i_content` to `path`.
+    If `hashers` are provided, each chunk is also fed to every one of them,
+    such that the digests are ready when the last chunk has been written.
+    """
     if not opener:
         opener = open
+    if not hashers:
+        hashers = {}
 
     dir_path = os.path.dirname(path)
     if not os.path.exists(dir_path) and mkdirs:
@@ -83,15 +132,266 @@ def i_write(path, i_content, mode="w", mkdirs=False, opener=None):
         with opener(path, mode) as fh:
             for chunk in i_content:
                 fh.write(chunk)
+                for hasher in hashers.values():
+                    hasher.update(chunk)
         return True
     except Exception as err:
         print("Failed to save file: {} - {}".format(path, err))
     return False
 
 
-def copy(src, dst):
+class IterableReader(io.RawIOBase):
+    """
+    A readable binary file object over an iterable of bytes chunks, e.g. a streamed
+    HTTP response, such that the chunks can be read by file based readers like tarfile.
+    """
+
+    def __init__(self, i_content):
+        self.iterator = iter(i_content)
+        self.chunk = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.chunk:
+            try:
+                self.chunk = memoryview(next(self.iterator))
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self.chunk))
+        buffer[:size] = self.chunk[:size]
+        self.chunk = self.chunk[size:]
+        return size
+
+
+def data_segments(fd, size, sparse=True):
+    """
+    Yield the (offset, length) segments of the file that contain data.
+    The holes of a sparse file are skipped if the filesystem supports SEEK_DATA/SEEK_HOLE.
+    """
+    if not sparse or not hasattr(os, "SEEK_DATA"):
+        yield 0, size
+        return
+
+    offset = 0
+    while offset < size:
+        try:
+            data_offset = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as err:
+            if err.errno == errno.ENXIO:
+                # Only a hole remains until the end of the file
+                return
+            yield offset, size - offset
+            return
+        hole_offset = min(os.lseek(fd, data_offset, os.SEEK_HOLE), size)
+        if hole_offset > data_offset:
+            yield data_offset, hole_offset - data_offset
+        offset = hole_offset
+
+
+def copy_reflink(src_fd, dst_fd, segments, chunk_size):
+    fcntl.ioctl(dst_fd, FICLONE, src_fd)
+
+
+def copy_file_range(src_fd, dst_fd, segments, chunk_size):
+    for offset, length in segments:
+        end = offset + length
+        while offset < end:
+            copied = os.copy_file_range(
+                src_fd, dst_fd, min(chunk_size, end - offset), offset, offset
+            )
+            if copied == 0:
+                break
+            offset += copied
+
+
+def copy_sendfile(src_fd, dst_fd, segments, chunk_size):
+    for offset, length in segments:
+        end = offset + length
+        # sendfile writes at the current position of the destination
+        os.lseek(dst_fd, offset, os.SEEK_SET)
+        while offset < end:
+            sent = os.sendfile(dst_fd, src_fd, offset, min(chunk_size, end - offset))
+            if sent == 0:
+                break
+            offset += sent
+
+
+def copy_buffered(src_fd, dst_fd, segments, chunk_size):
+    buffer = bytearray(min(chunk_size, COPY_BUFFER_SIZE))
+    view = memoryview(buffer)
+    for offset, length in segments:
+        end = offset + length
+        while offset < end:
+            read = os.preadv(src_fd, [view[: min(len(buffer), end - offset)]], offset)
+            if read == 0:
+                break
+            written = 0
+            while written < read:
+                written += os.pwrite(dst_fd, view[written:read], offset + written)
+            offset += read
+    view.release()
+
+
+COPY_STRATEGY_FUNCTIONS = {
+    CopyStrategies.REFLINK: copy_reflink,
+    CopyStrategies.COPY_FILE_RANGE: copy_file_range,
+    CopyStrategies.SENDFILE: copy_sendfile,
+    CopyStrategies.BUFFERED: copy_buffered,
+}
+
+
+def temporary_path(path):
+    """
+    Return a temporary path next to `path` that is unique to the calling process and thread,
+    from which a completely written file can replace `path` via `os.replace`.
+    """
+    return "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+
+
+def copy_file(
+    src,
+    dst,
+    strategies=None,
+    sparse=True,
+    preallocate=True,
+    chunk_size=COPY_CHUNK_SIZE,
+):
+    """
+    Copy `src` to `dst` by trying each of the `strategies` in order until one is supported.
+    By default the kernel is asked to share the extents (reflink), then to copy
+    the data in-kernel via copy_file_range or sendfile, before falling back to a userspace copy.
+    Holes in a sparse `src` are preserved, and a non-sparse `dst` is preallocated.
+    As with `copy`, the `dst` can be a directory and the permission bits are copied.
+    The copy is written to a temporary file that only replaces `dst` once it is complete,
+    such that a failed copy doesn't leave a partial `dst` behind.
+    Returns the strategy that was used to copy the file.
+    """
+    if not strategies:
+        strategies = list(CopyStrategies)
+
+    tmp_dst = None
+    try:
+        if os.path.isdir(dst):
+            dst = os.path.join(dst, os.path.basename(src))
+        # Opening the destination for writing would truncate the source
+        if os.path.exists(dst) and os.path.samefile(src, dst):
+            raise shutil.SameFileError("{} and {} are the same file".format(src, dst))
+        tmp_dst = temporary_path(dst)
+        with open(src, "rb", buffering=0) as src_fh, open(
+            tmp_dst, "wb", buffering=0
+        ) as dst_fh:
+            src_fd, dst_fd = src_fh.fileno(), dst_fh.fileno()
+            src_stat = os.fstat(src_fd)
+            size = src_stat.st_size
+            is_sparse = (
+                sparse
+                and hasattr(src_stat, "st_blocks")
+                and src_stat.st_blocks * 512 < size
+            )
+            segments = list(data_segments(src_fd, size, sparse=is_sparse))
+
+            used_strategy, preallocated = None, False
+            for strategy in strategies:
+                if strategy != CopyStrategies.REFLINK and not preallocated:
+                    # Reserve the space up front to avoid fragmentation,
+                    # unless that would fill the holes of a sparse file
+                    if (
+                        preallocate
+                        and not is_sparse
+                        and size > 0
+                        and hasattr(os, "posix_fallocate")
+                    ):
+                        try:
+                            os.posix_fallocate(dst_fd, 0, size)
+                        except OSError as err:
+                            if err.errno not in COPY_UNSUPPORTED_ERRNOS:
+                                raise
+                    preallocated = True
+                try:
+                    COPY_STRATEGY_FUNCTIONS[strategy](
+                        src_fd, dst_fd, segments, chunk_size
+                    )
+                    used_strategy = strategy
+                    break
+                except (OSError, AttributeError) as err:
+                    # AttributeError signals that the platform lacks the system call
+                    if (
+                        isinstance(err, OSError)
+                        and err.errno not in COPY_UNSUPPORTED_ERRNOS
+                    ):
+                        raise
+            if not used_strategy:
+                raise OSError(
+                    errno.EOPNOTSUPP,
+                    "None of the copy strategies: {} are supported".format(
+                        ", ".join(strategies)
+                    ),
+                )
+            # Trailing holes are not covered by the data segments
+            os.ftruncate(dst_fd, size)
+        shutil.copymode(src, tmp_dst)
+        os.replace(tmp_dst, dst)
+        return used_strategy
+    except Exception as err:
+        print("Failed to copy file: {} - {}".format(src, err))
+    if tmp_dst and os.path.exists(tmp_dst):
+        os.remove(tmp_dst)
+    return False
+
+
+class LinkStrategies(StrEnum):
+    EXISTING = "existing"
+
+
+def link_file(src, dst, copy_strategies=None):
+    """
+    Make `dst` hold the content of `src` without writing the content again where possible.
+    Nothing is done if `dst` already is `src`, otherwise `src` is copied via `copy_file`,
+    which shares the extents (reflink) when it is supported, before falling back to a real copy.
+    Since `copy_file` writes to a temporary file that then replaces `dst`, a `dst`
+    that shares its content with another file is replaced instead of being overwritten.
+    A hard link is never used, since a later write to `dst` would also change `src`.
+    Returns the strategy that was used, or False on failure.
+    """
     try:
-        shutil.copy(src, dst)
+        if os.path.isdir(dst):
+            dst = os.path.join(dst, os.path.basename(src))
+        if os.path.exists(dst) and os.path.samefile(src, dst):
+            return LinkStrategies.EXISTING
+    except Exception as err:
+        print("Failed to link file: {} - {}".format(src, err))
+        return False
+    return copy_file(src, dst, strategies=copy_strategies)
+
+
+def copy(src, dst, strategies=None, verbose=False):
+    strategy = copy_file(src, dst, strategies=strategies)
+    if not strategy:
+        return False
+    if verbose:
+        print("Copied file: {} to: {} via: {}".format(src, dst, strategy))
+    return True
+
+
+def hash_copy(src, dst, hashers, buffer_size=None):
+    """
+    Copy `src` to `dst` while updating each of the `hashers` with the bytes
+    as they are streamed, such that the copy can be checksummed without reading it back.
+    As with `copy`, the `dst` can be a directory and the permission bits are copied.
+    """
+    try:
+        if os.path.isdir(dst):
+            dst = os.path.join(dst, os.path.basename(src))
+        # Opening the destination for writing would truncate the source
+        if os.path.exists(dst) and os.path.samefile(src, dst):
+            raise shutil.SameFileError("{} and {} are the same file".format(src, dst))
+        with open(src, "rb", buffering=0) as src_fh, open(dst, "wb") as dst_fh:
+            if not buffer_size:
+                buffer_size = hash_buffer_size(os.fstat(src_fh.fileno()))
+            update_hashers(src_fh, hashers, buffer_size, output=dst_fh)
+        shutil.copymode(src, dst)
         return True
     except Exception as err:
         print("Failed to copy file: {} - {}".format(src, err))
@@ -223,6 +523,9 @@ def stat(path):
 
 
 def parse_yaml(data):
+    # yaml is only imported when it is used to keep the start up time of the tools low
+    import yaml
+
     try:
         parsed = yaml.safe_load(data)
         return parsed
@@ -232,6 +535,8 @@ def parse_yaml(data):
 
 
 def dump_yaml(path, data, opener=None):
+    import yaml
+
     if not opener:
         opener = open
 
@@ -245,6 +550,8 @@ def dump_yaml(path, data, opener=None):
 
 
 def load_yaml(path, opener=None):
+    import yaml
+
     if not opener:
         opener = open
     try:
@@ -266,19 +573,256 @@ def load_json(path, opener=None):
     return False
 
 
-# Read chunks of a file, default to 64KB
-def hashsum(path, algorithm="sha256", buffer_size=65536):
-    try:
+class TreeHasher:
+    """
+    A hashlib like hasher that splits the input into fixed-size chunks, where the digest
+    of each chunk is calculated concurrently by a pool of `workers` threads.
+    The root digest is the `algorithm` digest of the chunk size and total size
+    (both as 8 byte big-endian integers) followed by every chunk digest in order.
+    """
+
+    def __init__(self, algorithm, chunk_size=TREE_CHUNK_SIZE, workers=None):
+        self.algorithm = algorithm
+        self.name = f"{algorithm}{TREE_HASH_SUFFIX}"
+        self.chunk_size = chunk_size
+        self.workers = workers or os.cpu_count() or 1
+        self.size = 0
+        self.chunk = bytearray()
+        self.chunk_futures = []
+        self.chunk_digests = None
+        self.executor = None
+
+    def hash_chunk(self, chunk):
         import hashlib
 
+        return hashlib.new(self.algorithm, chunk).digest()
+
+    def submit_chunk(self):
+        if not self.executor:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        # Bound the amount of chunks that are held in memory
+        in_flight = [future for future in self.chunk_futures if not future.done()]
+        if len(in_flight) >= self.workers * 2:
+            wait(in_flight, return_when=FIRST_COMPLETED)
+        self.chunk_futures.append(self.executor.submit(self.hash_chunk, self.chunk))
+        self.chunk = bytearray()
+
+    def update(self, data):
+        if self.chunk_digests is not None:
+            raise ValueError("The tree digest has already been finalized")
+        view = memoryview(data).cast("B")
+        self.size += len(view)
+        while len(view):
+            remaining = self.chunk_size - len(self.chunk)
+            self.chunk += view[:remaining]
+            view = view[remaining:]
+            if len(self.chunk) == self.chunk_size:
+                self.submit_chunk()
+
+    def finalize(self):
+        if self.chunk_digests is not None:
+            return
+        if self.chunk:
+            self.submit_chunk()
+        self.chunk_digests = [future.result() for future in self.chunk_futures]
+        self.chunk_futures = []
+        if self.executor:
+            self.executor.shutdown()
+            self.executor = None
+
+    def digest(self):
+        import hashlib
+
+        self.finalize()
+        root = hashlib.new(self.algorithm)
+        root.update(self.chunk_size.to_bytes(8, "big"))
+        root.update(self.size.to_bytes(8, "big"))
+        for chunk_digest in self.chunk_digests:
+            root.update(chunk_digest)
+        return root.digest()
+
+    def hexdigest(self):
+        return self.digest().hex()
+
+    def hexchunks(self):
+        self.finalize()
+        return [chunk_digest.hex() for chunk_digest in self.chunk_digests]
+
+
+class KnownDigestHasher:
+    """
+    A hashlib like hasher of content whose digest is already known,
+    such that the content does not have to be read to checksum it.
+    """
+
+    def __init__(self, name, hexdigest):
+        self.name = name
+        self.known_hexdigest = hexdigest
+
+    def update(self, data):
+        raise ValueError("The digest of the content is already known")
+
+    def digest(self):
+        return bytes.fromhex(self.known_hexdigest)
+
+    def hexdigest(self):
+        return self.known_hexdigest
+
+
+def is_tree_algorithm(algorithm):
+    return str(algorithm).endswith(TREE_HASH_SUFFIX)
+
+
+def new_hashers(algorithms, tree_chunk_size=TREE_CHUNK_SIZE):
+    import hashlib
+
+    hashers = {}
+    for algorithm in algorithms:
+        if is_tree_algorithm(algorithm):
+            base_algorithm = str(algorithm)[: -len(TREE_HASH_SUFFIX)]
+            if base_algorithm not in hashlib.algorithms_available:
+                return False
+            hashers[algorithm] = TreeHasher(base_algorithm, chunk_size=tree_chunk_size)
+            continue
         if algorithm not in hashlib.algorithms_available:
             return False
+        hashers[algorithm] = hashlib.new(algorithm)
+    return hashers
+
+
+def hexdigests(hashers):
+    return {algorithm: hasher.hexdigest() for algorithm, hasher in hashers.items()}
+
+
+def hash_buffer_size(file_stat):
+    """
+    Select a hashing buffer size based on the preferred I/O block size
+    and the size of the file that is to be hashed.
+    """
+    block_size = getattr(file_stat, "st_blksize", 0) or HASH_MIN_BUFFER_SIZE
+    buffer_size = max(block_size, (HASH_TARGET_BUFFER_SIZE // block_size) * block_size)
+    if S_ISREG(file_stat.st_mode) and file_stat.st_size < buffer_size:
+        # No reason to allocate more than the file requires,
+        # rounded up to a whole number of blocks.
+        blocks = max(1, -(-file_stat.st_size // block_size))
+        buffer_size = blocks * block_size
+    return buffer_size
+
+
+def drop_page_cache(fd, offset=0, length=0):
+    # A length of 0 covers everything from the offset to the end of the file
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(fd, offset, length, os.POSIX_FADV_DONTNEED)
+
+
+def update_hashers(fh, hashers, buffer_size, output=None, drop_cache=False):
+    """
+    Read the unbuffered `fh` into a single preallocated buffer
+    and update each of the `hashers` with the read chunks.
+    If an `output` file object is given, every chunk is also written to it.
+    If `drop_cache` is set, the read chunks are evicted from the page cache.
+    """
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    offset = 0
+    read = fh.readinto(view)
+    while read:
+        chunk = view[:read]
+        if output is not None:
+            output.write(chunk)
+        for hasher in hashers.values():
+            hasher.update(chunk)
+        chunk.release()
+        if drop_cache:
+            drop_page_cache(fh.fileno(), offset, read)
+        offset += read
+        read = fh.readinto(view)
+    view.release()
+
+
+def update_hashers_mmap(fh, hashers, buffer_size):
+    with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if hasattr(mapped, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        view = memoryview(mapped)
+        for offset in range(0, len(mapped), buffer_size):
+            chunk = view[offset : offset + buffer_size]
+            for hasher in hashers.values():
+                hasher.update(chunk)
+            chunk.release()
+        view.release()
+
+
+# Read each chunk of a file once and feed it to every one of the hashers.
+# If no buffer_size is given, one is selected based on the file.
+# With drop_cache, the file is read from storage instead of the page cache
+# and the read pages are not kept in the cache afterwards.
+def hash_file(path, hashers, buffer_size=None, use_mmap=False, drop_cache=False):
+    try:
+        with open(path, "rb", buffering=0) as fh:
+            file_stat = os.fstat(fh.fileno())
+            if not buffer_size:
+                buffer_size = hash_buffer_size(file_stat)
+            if drop_cache:
+                # Dirty pages can't be dropped, so flush them before
+                # evicting the file from the page cache
+                os.fsync(fh.fileno())
+                drop_page_cache(fh.fileno())
+            # mmap is only possible for non-empty regular files
+            if (
+                use_mmap
+                and not drop_cache
+                and S_ISREG(file_stat.st_mode)
+                and file_stat.st_size > 0
+            ):
+                update_hashers_mmap(fh, hashers, buffer_size)
+            else:
+                update_hashers(fh, hashers, buffer_size, drop_cache=drop_cache)
+        return True
+    except Exception as err:
+        print("Failed to hash file: {} - {}".format(path, err))
+    return False
+
+
+def hashsums(
+    path,
+    algorithms=None,
+    buffer_size=None,
+    use_mmap=False,
+    drop_cache=False,
+    tree_chunk_size=TREE_CHUNK_SIZE,
+):
+    if not algorithms:
+        algorithms = ["sha256"]
 
-        hash_algorithm = hashlib.new(algorithm)
-        with open(path, "rb") as fh:
-            for chunk in iter(lambda: fh.read(buffer_size), b""):
-                hash_algorithm.update(chunk)
-        return hash_algorithm.hexdigest()
+    hashers = new_hashers(algorithms, tree_chunk_size=tree_chunk_size)
+    if not hashers:
+        return False
+    if not hash_file(
+        path,
+        hashers,
+        buffer_size=buffer_size,
+        use_mmap=use_mmap,
+        drop_cache=drop_cache,
+    ):
+        return False
+    try:
+        return hexdigests(hashers)
     except Exception as err:
-        print("Failed to calculate hashsum: {} - {}".format(path, err))
+        print("Failed to calculate hashsums: {} - {}".format(path, err))
     return False
+
+
+def hashsum(
+    path, algorithm="sha256", buffer_size=None, use_mmap=False, drop_cache=False
+):
+    digests = hashsums(
+        path,
+        algorithms=[algorithm],
+        buffer_size=buffer_size,
+        use_mmap=use_mmap,
+        drop_cache=drop_cache,
+    )
+    if not digests:
+        return False
+    return digests[algorithm]
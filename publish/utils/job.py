@@ -14,9 +14,19 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
+import contextvars
 import json
+import os
+import signal
 import subprocess
+import sys
+import threading
+import time
 import datetime
+from contextlib import contextmanager
+
+# The maximum length of a single output line that run_async can read
+ASYNC_STREAM_LIMIT = 16 * 1024 * 1024
 
 
 def __to_str__(o):
@@ -91,12 +101,200 @@ def check_call(cmd, output_format="str", **run_kwargs):
     return __format_output__(result, to_format=output_format)
 
 
-def run(cmd, output_format="str", **run_kwargs):
+class ResourceCollector:
+    """
+    Aggregates the resource usage of the commands that `run` executes by their label.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.usages = {}
+
+    def add(self, resources):
+        with self.lock:
+            usage = self.usages.setdefault(
+                resources["label"],
+                {
+                    "count": 0,
+                    "wall_time": 0.0,
+                    "user_time": 0.0,
+                    "system_time": 0.0,
+                    "max_rss": 0,
+                },
+            )
+            usage["count"] += 1
+            usage["wall_time"] += resources["wall_time"]
+            usage["user_time"] += resources["user_time"]
+            usage["system_time"] += resources["system_time"]
+            usage["max_rss"] = max(usage["max_rss"], resources["max_rss"])
+
+    def summary(self):
+        with self.lock:
+            return {label: dict(usage) for label, usage in self.usages.items()}
+
+    def clear(self):
+        with self.lock:
+            self.usages = {}
+
+
+# The collector that every `run` reports its resource usage to while `collect_resources` is active.
+# A thread pool that runs commands on behalf of the context has to run them in a copy of it,
+# see `contextvars.copy_context`.
+_resource_collector = contextvars.ContextVar("resource_collector", default=None)
+
+
+@contextmanager
+def collect_resources(collector=None):
+    """
+    Record the resource usage of every command that `run` executes within the context
+    in the `collector`, which is yielded.
+    """
+    if collector is None:
+        collector = ResourceCollector()
+    token = _resource_collector.set(collector)
+    try:
+        yield collector
+    finally:
+        _resource_collector.reset(token)
+
+
+def __run_with_resources__(cmd, label=None, input=None, **run_kwargs):
+    """
+    Run `cmd` like `subprocess.run` and reap it with `os.wait4`,
+    which returns the resource usage of that single child.
+    As with `subprocess.run`, the command is killed and `subprocess.TimeoutExpired` is raised
+    if it has not finished within `timeout` seconds, and `subprocess.CalledProcessError`
+    is raised on a non-zero exit code if `check` is set.
+    """
+    timeout = run_kwargs.pop("timeout", None)
+    check = run_kwargs.pop("check", False)
+    # The output is always captured
+    run_kwargs.pop("capture_output", None)
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE if input is not None else run_kwargs.pop("stdin", None),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        **run_kwargs,
+    )
+    # The child is killed via its pid, since Popen.kill would reap it before os.wait4 can
+    timed_out, exited = threading.Event(), threading.Event()
+    kill_lock = threading.Lock()
+
+    def kill():
+        with kill_lock:
+            if not exited.is_set():
+                timed_out.set()
+                try:
+                    os.kill(process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    timer, error_reader, input_writer, reaped = None, None, None, False
+    try:
+        if timeout is not None:
+            timer = threading.Timer(timeout, kill)
+            timer.start()
+        # The pipes are drained concurrently, such that the child can't block on a full pipe
+        errors = []
+        error_reader = threading.Thread(
+            target=lambda: errors.append(process.stderr.read())
+        )
+        error_reader.start()
+        if input is not None:
+            input_writer = threading.Thread(
+                target=lambda: (process.stdin.write(input), process.stdin.close())
+            )
+            input_writer.start()
+        output = process.stdout.read()
+        error_reader.join()
+        if input_writer:
+            input_writer.join()
+
+        # os.waitid is not available on every platform, e.g. macOS
+        if timer and hasattr(os, "waitid"):
+            # Wait for the child to exit without reaping it, such that its pid can't be reused
+            # by another process before the timer is stopped
+            os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+            with kill_lock:
+                exited.set()
+        _, status, rusage = os.wait4(process.pid, 0)
+        reaped = True
+        with kill_lock:
+            exited.set()
+    except BaseException:
+        # The child must neither keep running nor be left as a zombie
+        if not reaped:
+            with kill_lock:
+                exited.set()
+            try:
+                os.kill(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            try:
+                os.wait4(process.pid, 0)
+            except ChildProcessError:
+                pass
+        for thread in (error_reader, input_writer):
+            if thread:
+                thread.join()
+        raise
+    finally:
+        if timer:
+            timer.cancel()
+        for pipe in (process.stdin, process.stdout, process.stderr):
+            if pipe and not pipe.closed:
+                try:
+                    pipe.close()
+                except OSError:
+                    pass
+    process.returncode = os.waitstatus_to_exitcode(status)
+    error = errors[0] if errors else b""
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout, output=output, stderr=error)
+    if check and process.returncode != 0:
+        raise subprocess.CalledProcessError(
+            process.returncode, cmd, output=output, stderr=error
+        )
+    resources = {
+        "label": label or os.path.basename(str(cmd[0])),
+        "wall_time": time.perf_counter() - start,
+        "user_time": rusage.ru_utime,
+        "system_time": rusage.ru_stime,
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        "max_rss": rusage.ru_maxrss * (1 if sys.platform == "darwin" else 1024),
+    }
+    raw_results = subprocess.CompletedProcess(
+        cmd, process.returncode, stdout=output, stderr=error
+    )
+    return raw_results, resources
+
+
+def run(cmd, output_format="str", label=None, with_resources=False, **run_kwargs):
+    """
+    Run `cmd` and return a (success, results) tuple,
+    where results holds the formatted output and error of the command.
+
+    If `with_resources` is set or a `collect_resources` context is active, the wall time,
+    user and system CPU time and maximum resident set size of the command are also
+    recorded in the `resources` of the results, under the `label` of the command.
+    """
     if not output_format:
         output_format = "str"
     return_values = {"output": "", "error": ""}
+    collector = _resource_collector.get()
     try:
-        raw_results = subprocess.run(cmd, **run_kwargs, capture_output=True)
+        if with_resources or collector:
+            raw_results, resources = __run_with_resources__(
+                cmd, label=label, **run_kwargs
+            )
+            return_values["resources"] = resources
+            if collector:
+                collector.add(resources)
+        else:
+            raw_results = subprocess.run(cmd, **run_kwargs, capture_output=True)
     except Exception as e:
         return_values["error"] = f"Failed to run command: {cmd}, error: {e}"
         return False, return_values
@@ -115,3 +313,107 @@ def run(cmd, output_format="str", **run_kwargs):
     if result["returncode"] != 0:
         return False, return_values
     return True, return_values
+
+
+async def __read_lines__(stream, lines, callback=None):
+    while True:
+        line = await stream.readline()
+        if not line:
+            break
+        lines.append(line)
+        if callback:
+            callback(line.decode("utf-8", errors="replace"))
+
+
+async def run_async(
+    cmd,
+    output_format="str",
+    semaphore=None,
+    timeout=None,
+    stdout_callback=None,
+    stderr_callback=None,
+    **run_kwargs,
+):
+    """
+    Run `cmd` as an asyncio subprocess and return the same (success, results) tuple as `run`.
+    If a `semaphore` is provided, it is acquired while the command runs,
+    which limits how many commands run concurrently.
+    The command is started in its own session, such that its whole process group
+    is killed if it has not finished within `timeout` seconds.
+    Each line of the output and error streams is passed to the `stdout_callback` and
+    `stderr_callback` as it is read, if they are provided.
+    """
+    # asyncio is only imported when it is used to keep the start up time of the tools low
+    import asyncio
+
+    if not output_format:
+        output_format = "str"
+    if semaphore is None:
+        # A semaphore that is never contended
+        semaphore = asyncio.Semaphore(1)
+
+    return_values = {"output": "", "error": ""}
+    async with semaphore:
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True,
+                limit=ASYNC_STREAM_LIMIT,
+                **run_kwargs,
+            )
+        except Exception as e:
+            return_values["error"] = f"Failed to run command: {cmd}, error: {e}"
+            return False, return_values
+
+        output_lines, error_lines = [], []
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(
+                    __read_lines__(process.stdout, output_lines, stdout_callback),
+                    __read_lines__(process.stderr, error_lines, stderr_callback),
+                    process.wait(),
+                ),
+                timeout=timeout,
+            )
+        except asyncio.TimeoutError:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            await process.wait()
+            return_values["error"] = (
+                f"Failed to run command: {cmd}, error: timed out after {timeout} seconds"
+            )
+            return False, return_values
+        except asyncio.CancelledError:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            raise
+        except Exception as e:
+            # E.g. a line that exceeds the ASYNC_STREAM_LIMIT
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            await process.wait()
+            return_values["error"] = f"Failed to run command: {cmd}, error: {e}"
+            return False, return_values
+
+    output, error = b"".join(output_lines), b"".join(error_lines)
+    if error:
+        formatted_error = __format_output__(error, to_format=output_format)
+        if formatted_error:
+            return_values["error"] = formatted_error
+
+    if output:
+        formatted_output = __format_output__(output, to_format=output_format)
+        if formatted_output:
+            return_values["output"] = formatted_output
+
+    if process.returncode != 0:
+        return False, return_values
+    return True, return_values
@@ -60,12 +60,15 @@ setup(
     install_requires=read_req("requirements.txt"),
     extras_require={
         "dev": read_req("requirements-dev.txt"),
+        "zstd": ["zstandard"],
     },
     entry_points={
         "console_scripts": [
             "sign = publish.cli.sign:cli",
             "verify = publish.cli.verify:cli",
             "publish = publish.cli.publish:cli",
+            "checksum = publish.cli.checksum:cli",
+            "recombine = publish.cli.recombine:cli",
         ]
     },
     classifiers=[
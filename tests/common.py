@@ -14,7 +14,13 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
+import hashlib
+import io
+import json
 import os
+import tarfile
+
+from publish.utils.job import run
 
 BASE_TESTS_PATH = os.path.abspath(os.path.dirname(__file__))
 TMP_TEST_PATH = os.path.join(BASE_TESTS_PATH, "tmp")
@@ -33,3 +39,52 @@ NON_EXISTING_DESTINATION = "non_existing_destination"
 NON_EXISTING_KEY = "non_existing_key"
 TEST_FILE = "test_file"
 TEST_CONTENT = "sfopawmdioamwioac aoimaw aw 2414 14 foobar"
+
+
+def kill_gpg_agents(path):
+    """
+    Stop the gpg-agent of every gpg home directory below `path`.
+    An agent removes its sockets when it exits,
+    which would otherwise race with the removal of `path`.
+    """
+    for directory, _, files in os.walk(path):
+        if any(name.startswith("S.gpg-agent") for name in files):
+            run(["gpgconf", "--homedir", directory, "--kill", "gpg-agent"])
+
+
+def sha256_digest(content):
+    return f"sha256:{hashlib.sha256(content).hexdigest()}"
+
+
+def docker_archive(layers, tag):
+    """
+    Create the content of a docker-archive of an image with the `layers` and `tag`,
+    in which the layers and config are named by their digest, as podman does.
+    """
+    config = json.dumps(
+        {
+            "rootfs": {
+                "type": "layers",
+                "diff_ids": [sha256_digest(layer) for layer in layers],
+            }
+        }
+    ).encode()
+    config_name = f"{hashlib.sha256(config).hexdigest()}.json"
+    layer_names = [f"{hashlib.sha256(layer).hexdigest()}.tar" for layer in layers]
+    manifest = [{"Config": config_name, "RepoTags": [tag], "Layers": layer_names}]
+
+    archive_content = io.BytesIO()
+    with tarfile.open(fileobj=archive_content, mode="w") as archive:
+        for name, content in list(zip(layer_names, layers)) + [
+            (config_name, config),
+            ("manifest.json", json.dumps(manifest).encode()),
+        ]:
+            member = tarfile.TarInfo(name)
+            member.size = len(content)
+            archive.addfile(member, io.BytesIO(content))
+    return archive_content.getvalue()
+
+
+def chunks(content, chunk_size=1000):
+    # Streamed in chunks, as an archive is received from podman
+    return [content[i : i + chunk_size] for i in range(0, len(content), chunk_size)]
@@ -0,0 +1,168 @@
+# Copyright (C) 2024  The publishing-tools Project by the Science HPC Center at UCPH
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import hashlib
+import io
+import json
+import os
+import tarfile
+import unittest
+
+from publish.archive import (
+    DELTA_MANIFEST,
+    DeltaSources,
+    read_archive_layers,
+    write_delta_archive,
+    recombine_delta_archive,
+)
+from publish.utils.io import exists, makedirs, remove, write
+from tests.common import TMP_TEST_PATH, sha256_digest, docker_archive, chunks
+
+TEST_NAME = os.path.basename(__file__).split(".")[0]
+CURRENT_TEST_DIR = os.path.join(TMP_TEST_PATH, TEST_NAME)
+
+
+def archive_members(path):
+    with tarfile.open(path, "r:") as archive:
+        return {
+            member.name: archive.extractfile(member).read()
+            for member in archive.getmembers()
+        }
+
+
+class TestDeltaArchive(unittest.TestCase):
+    def setUp(self):
+        if not exists(CURRENT_TEST_DIR):
+            self.assertTrue(makedirs(CURRENT_TEST_DIR))
+        self.base_layer = b"b" * 5000
+        self.top_layer = b"t" * 100
+        self.new_top_layer = b"n" * 200
+        self.tag = "localhost/test/nightly:latest"
+        self.baseline_path = os.path.join(CURRENT_TEST_DIR, "baseline.tar")
+        self.assertTrue(
+            write(
+                self.baseline_path,
+                docker_archive([self.base_layer, self.top_layer], self.tag),
+                mode="wb",
+            )
+        )
+        self.archive = docker_archive([self.base_layer, self.new_top_layer], self.tag)
+        self.delta_path = os.path.join(CURRENT_TEST_DIR, "delta.tar")
+        self.recombined_path = os.path.join(CURRENT_TEST_DIR, "recombined.tar")
+
+    def tearDown(self):
+        self.assertTrue(remove(CURRENT_TEST_DIR, recursive=True))
+
+    def test_read_archive_layers(self):
+        manifest, layers = read_archive_layers(self.baseline_path)
+        self.assertEqual(json.loads(manifest)[0]["RepoTags"], [self.tag])
+        self.assertEqual(
+            layers,
+            {
+                sha256_digest(layer): f"{hashlib.sha256(layer).hexdigest()}.tar"
+                for layer in (self.base_layer, self.top_layer)
+            },
+        )
+
+    def test_read_archive_layers_missing(self):
+        self.assertFalse(
+            read_archive_layers(os.path.join(CURRENT_TEST_DIR, "missing.tar"))
+        )
+
+    def test_write_delta_archive(self):
+        hasher = hashlib.sha256()
+        stats = write_delta_archive(
+            chunks(self.archive),
+            self.delta_path,
+            self.baseline_path,
+            hashers={"sha256": hasher},
+        )
+        self.assertEqual(stats["members"], 4)
+        self.assertEqual(stats["baseline_members"], 1)
+        self.assertEqual(stats["baseline_bytes"], len(self.base_layer))
+        self.assertEqual(stats["delta_members"], 3)
+
+        with open(self.delta_path, "rb") as fh:
+            self.assertEqual(hasher.hexdigest(), hashlib.sha256(fh.read()).hexdigest())
+
+        # The shared base layer is only stored in the baseline
+        delta_members = archive_members(self.delta_path)
+        self.assertNotIn(self.base_layer, delta_members.values())
+        self.assertIn(self.new_top_layer, delta_members.values())
+        delta_manifest = json.loads(delta_members[DELTA_MANIFEST])
+        self.assertEqual(delta_manifest["baseline"], "baseline.tar")
+        self.assertEqual(
+            [entry["source"] for entry in delta_manifest["members"]].count(
+                DeltaSources.BASELINE
+            ),
+            1,
+        )
+
+    def test_write_delta_archive_failure(self):
+        # A failed write leaves neither a truncated delta nor a temporary file behind
+        self.assertTrue(write(self.delta_path, b"previous delta", mode="wb"))
+        self.assertFalse(
+            write_delta_archive(
+                chunks(self.archive[: len(self.archive) // 2]),
+                self.delta_path,
+                self.baseline_path,
+            )
+        )
+        with open(self.delta_path, "rb") as fh:
+            self.assertEqual(fh.read(), b"previous delta")
+        self.assertEqual(
+            sorted(os.listdir(CURRENT_TEST_DIR)), ["baseline.tar", "delta.tar"]
+        )
+
+    def test_recombine_delta_archive(self):
+        self.assertTrue(
+            write_delta_archive(
+                chunks(self.archive), self.delta_path, self.baseline_path
+            )
+        )
+        self.assertTrue(
+            recombine_delta_archive(
+                self.delta_path, self.baseline_path, self.recombined_path
+            )
+        )
+        # The recombined archive holds the same members in the same order
+        with tarfile.open(fileobj=io.BytesIO(self.archive), mode="r:") as archive:
+            expected = [
+                (member.name, archive.extractfile(member).read())
+                for member in archive.getmembers()
+            ]
+        self.assertEqual(list(archive_members(self.recombined_path).items()), expected)
+
+    def test_recombine_with_other_baseline(self):
+        self.assertTrue(
+            write_delta_archive(
+                chunks(self.archive), self.delta_path, self.baseline_path
+            )
+        )
+        other_baseline_path = os.path.join(CURRENT_TEST_DIR, "other-baseline.tar")
+        self.assertTrue(
+            write(
+                other_baseline_path,
+                docker_archive([self.base_layer], self.tag),
+                mode="wb",
+            )
+        )
+        self.assertFalse(
+            recombine_delta_archive(
+                self.delta_path, other_baseline_path, self.recombined_path
+            )
+        )
+        self.assertFalse(exists(self.recombined_path))
@@ -0,0 +1,399 @@
+# Copyright (C) 2024  The publishing-tools Project by the Science HPC Center at UCPH
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import os
+import hashlib
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from publish.cache import ChecksumCache, get_checksum_cache
+from publish.checksum import (
+    ChecksumTypes,
+    checksum_file,
+    checksum_file_digests,
+    checksum_equal,
+    checksum_files,
+    write_checksum_file,
+    write_checksum_files,
+    write_manifest,
+    read_manifest,
+    verify_manifest,
+    verify_manifest_entries,
+    ManifestFormats,
+    ManifestStatus,
+    TREE_CHUNKS_EXTENSION,
+)
+from publish.common import WorkerTypes
+from publish.utils.io import (
+    makedirs,
+    exists,
+    remove,
+    write,
+    load,
+    hashsum,
+    hashsums,
+    hash_copy,
+    i_write,
+    new_hashers,
+    hexdigests,
+    load_json,
+    is_tree_algorithm,
+    TreeHasher,
+)
+from tests.common import TMP_TEST_PATH, TEST_FILE, TEST_CONTENT
+
+TEST_NAME = os.path.basename(__file__).split(".")[0]
+CURRENT_TEST_DIR = os.path.join(TMP_TEST_PATH, TEST_NAME)
+TEST_LARGE_CONTENT = os.urandom(3 * 1024 * 1024 + 17)
+
+
+class TestChecksum(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        if not exists(CURRENT_TEST_DIR):
+            assert makedirs(CURRENT_TEST_DIR) is True
+        cls.test_file = os.path.join(CURRENT_TEST_DIR, TEST_FILE)
+        assert write(cls.test_file, TEST_CONTENT)
+        cls.test_large_file = os.path.join(CURRENT_TEST_DIR, f"{TEST_FILE}-large")
+        assert write(cls.test_large_file, TEST_LARGE_CONTENT, mode="wb")
+        cls.test_empty_file = os.path.join(CURRENT_TEST_DIR, f"{TEST_FILE}-empty")
+        assert write(cls.test_empty_file, "")
+
+    @classmethod
+    def tearDownClass(cls):
+        assert remove(CURRENT_TEST_DIR, recursive=True) is True
+        assert not exists(CURRENT_TEST_DIR)
+
+    def test_hashsums_single_pass(self):
+        algorithms = [
+            checksum_type
+            for checksum_type in ChecksumTypes
+            if not is_tree_algorithm(checksum_type)
+        ]
+        digests = hashsums(self.test_file, algorithms=algorithms)
+        self.assertEqual(len(digests), len(algorithms))
+        for algorithm in algorithms:
+            self.assertEqual(
+                digests[algorithm],
+                hashlib.new(algorithm, TEST_CONTENT.encode()).hexdigest(),
+            )
+
+    def test_hashsums_unknown_algorithm(self):
+        self.assertFalse(hashsums(self.test_file, algorithms=["non_existing"]))
+
+    def test_checksum_file_digests(self):
+        digests = checksum_file_digests(
+            self.test_file, algorithms=[ChecksumTypes.SHA256, ChecksumTypes.MD5]
+        )
+        self.assertEqual(
+            digests[ChecksumTypes.SHA256],
+            hashsum(self.test_file, algorithm=ChecksumTypes.SHA256),
+        )
+        self.assertEqual(
+            digests[ChecksumTypes.MD5],
+            hashsum(self.test_file, algorithm=ChecksumTypes.MD5),
+        )
+
+    def test_hashsum_engines_equal(self):
+        expected = hashlib.sha256(TEST_LARGE_CONTENT).hexdigest()
+        self.assertEqual(hashsum(self.test_large_file), expected)
+        self.assertEqual(hashsum(self.test_large_file, use_mmap=True), expected)
+        # Buffer sizes that do not align with the file size
+        self.assertEqual(hashsum(self.test_large_file, buffer_size=4099), expected)
+        self.assertEqual(
+            hashsum(self.test_large_file, buffer_size=4099, use_mmap=True), expected
+        )
+
+    def test_hashsum_empty_file(self):
+        expected = hashlib.sha256(b"").hexdigest()
+        self.assertEqual(hashsum(self.test_empty_file), expected)
+        self.assertEqual(hashsum(self.test_empty_file, use_mmap=True), expected)
+
+    def test_hash_copy(self):
+        copy_destination = os.path.join(CURRENT_TEST_DIR, f"{TEST_FILE}-copy")
+        algorithms = [ChecksumTypes.SHA256, ChecksumTypes.SHA512]
+        hashers = new_hashers(algorithms)
+        self.assertTrue(hash_copy(self.test_large_file, copy_destination, hashers))
+        self.assertEqual(load(copy_destination, mode="rb"), TEST_LARGE_CONTENT)
+        self.assertEqual(
+            hexdigests(hashers),
+            hashsums(copy_destination, algorithms=algorithms, drop_cache=True),
+        )
+
+    def test_hash_copy_same_file(self):
+        hashers = new_hashers([ChecksumTypes.SHA256])
+        self.assertFalse(hash_copy(self.test_large_file, self.test_large_file, hashers))
+        self.assertEqual(load(self.test_large_file, mode="rb"), TEST_LARGE_CONTENT)
+
+    def test_i_write_with_hashers(self):
+        write_destination = os.path.join(CURRENT_TEST_DIR, f"{TEST_FILE}-i_write")
+        chunk_size = 1024 * 1024
+        chunks = (
+            TEST_LARGE_CONTENT[offset : offset + chunk_size]
+            for offset in range(0, len(TEST_LARGE_CONTENT), chunk_size)
+        )
+        hashers = new_hashers([ChecksumTypes.SHA256])
+        self.assertTrue(i_write(write_destination, chunks, mode="wb", hashers=hashers))
+        self.assertEqual(
+            hexdigests(hashers)[ChecksumTypes.SHA256],
+            hashsum(write_destination, algorithm=ChecksumTypes.SHA256),
+        )
+
+    def test_checksum_files(self):
+        paths = [self.test_file, self.test_large_file, self.test_empty_file]
+        algorithms = [ChecksumTypes.SHA256, ChecksumTypes.MD5]
+        for worker_type in WorkerTypes:
+            results = dict(
+                checksum_files(
+                    paths, algorithms=algorithms, workers=2, worker_type=worker_type
+                )
+            )
+            self.assertEqual(sorted(results), sorted(paths))
+            for path in paths:
+                self.assertEqual(results[path], hashsums(path, algorithms=algorithms))
+
+    def test_checksum_files_non_existing(self):
+        results = dict(checksum_files([self.test_file, "non_existing_file"]))
+        self.assertTrue(results[self.test_file])
+        self.assertFalse(results["non_existing_file"])
+
+    def test_tree_digest(self):
+        chunk_size = 1024 * 1024
+        expected_root = hashlib.sha256()
+        expected_root.update(chunk_size.to_bytes(8, "big"))
+        expected_root.update(len(TEST_LARGE_CONTENT).to_bytes(8, "big"))
+        for offset in range(0, len(TEST_LARGE_CONTENT), chunk_size):
+            expected_root.update(
+                hashlib.sha256(
+                    TEST_LARGE_CONTENT[offset : offset + chunk_size]
+                ).digest()
+            )
+
+        hasher = TreeHasher("sha256", chunk_size=chunk_size, workers=2)
+        # Updates that do not align with the chunks
+        for offset in range(0, len(TEST_LARGE_CONTENT), 100000):
+            hasher.update(TEST_LARGE_CONTENT[offset : offset + 100000])
+        self.assertEqual(hasher.hexdigest(), expected_root.hexdigest())
+        self.assertEqual(len(hasher.hexchunks()), 4)
+        self.assertEqual(
+            hashsums(
+                self.test_large_file,
+                algorithms=[ChecksumTypes.SHA256_TREE],
+                tree_chunk_size=chunk_size,
+            )[ChecksumTypes.SHA256_TREE],
+            expected_root.hexdigest(),
+        )
+
+    def test_tree_checksum_equal(self):
+        tree_file = os.path.join(CURRENT_TEST_DIR, f"{TEST_FILE}-tree")
+        self.assertTrue(write(tree_file, TEST_LARGE_CONTENT, mode="wb"))
+        self.assertTrue(
+            write_checksum_files(
+                tree_file,
+                algorithms=[ChecksumTypes.SHA256_TREE, ChecksumTypes.SHA256],
+            )
+        )
+        checksum_path = f"{tree_file}.{ChecksumTypes.SHA256_TREE}"
+        chunks = load_json(f"{checksum_path}.{TREE_CHUNKS_EXTENSION}")
+        self.assertEqual(chunks["root"], load(checksum_path))
+        self.assertEqual(chunks["size"], len(TEST_LARGE_CONTENT))
+        self.assertTrue(
+            checksum_equal(
+                tree_file, checksum_path, algorithm=ChecksumTypes.SHA256_TREE
+            )
+        )
+
+        modified_content = bytearray(TEST_LARGE_CONTENT)
+        modified_content[-1] ^= 0xFF
+        self.assertTrue(write(tree_file, bytes(modified_content), mode="wb"))
+        self.assertFalse(
+            checksum_equal(
+                tree_file,
+                checksum_path,
+                algorithm=ChecksumTypes.SHA256_TREE,
+                verbose=True,
+            )
+        )
+
+    def test_write_and_read_manifest(self):
+        paths = [self.test_file, self.test_large_file, self.test_empty_file]
+        for manifest_format in ManifestFormats:
+            algorithms = [ChecksumTypes.SHA256]
+            if manifest_format == ManifestFormats.BSD:
+                algorithms.append(ChecksumTypes.MD5)
+            manifest_path = os.path.join(CURRENT_TEST_DIR, f"{manifest_format}-SUMS")
+            self.assertTrue(
+                write_manifest(
+                    manifest_path,
+                    paths,
+                    algorithms=algorithms,
+                    manifest_format=manifest_format,
+                    workers=2,
+                )
+            )
+            # The paths are written relative to the manifest directory
+            self.assertNotIn(CURRENT_TEST_DIR, load(manifest_path))
+
+            entries = read_manifest(manifest_path)
+            self.assertEqual(len(entries), len(paths) * len(algorithms))
+            for path, algorithm, digest in entries:
+                self.assertIn(path, paths)
+                self.assertEqual(digest, hashsum(path, algorithm=algorithm))
+
+    def test_write_gnu_manifest_multiple_algorithms(self):
+        manifest_path = os.path.join(CURRENT_TEST_DIR, "multiple-SUMS")
+        self.assertFalse(
+            write_manifest(
+                manifest_path,
+                [self.test_file],
+                algorithms=[ChecksumTypes.SHA256, ChecksumTypes.MD5],
+            )
+        )
+        self.assertFalse(exists(manifest_path))
+
+    def test_read_manifest_malformed(self):
+        manifest_path = os.path.join(CURRENT_TEST_DIR, "malformed-SUMS")
+        self.assertTrue(write(manifest_path, "not a manifest entry\n"))
+        self.assertFalse(read_manifest(manifest_path))
+
+    def test_verify_manifest(self):
+        manifest_dir = os.path.join(CURRENT_TEST_DIR, "verify-manifest")
+        self.assertTrue(makedirs(manifest_dir))
+        paths = []
+        for index in range(4):
+            path = os.path.join(manifest_dir, f"{TEST_FILE}-{index}")
+            self.assertTrue(write(path, f"{TEST_CONTENT}{index}"))
+            paths.append(path)
+        manifest_path = os.path.join(manifest_dir, "SHA256SUMS")
+        self.assertTrue(write_manifest(manifest_path, paths))
+
+        results = list(verify_manifest(manifest_path, workers=2))
+        self.assertEqual(len(results), len(paths))
+        for _, _, status in results:
+            self.assertEqual(status, ManifestStatus.OK)
+
+        # Modify one file and remove another
+        self.assertTrue(write(paths[0], "modified"))
+        self.assertTrue(remove(paths[1]))
+        results = {path: status for path, _, status in verify_manifest(manifest_path)}
+        self.assertEqual(results[paths[0]], ManifestStatus.FAILED)
+        self.assertEqual(results[paths[1]], ManifestStatus.MISSING)
+        self.assertEqual(results[paths[2]], ManifestStatus.OK)
+        self.assertEqual(results[paths[3]], ManifestStatus.OK)
+
+        # The missing file is reported before any file is hashed
+        results = list(verify_manifest(manifest_path, fail_fast=True))
+        self.assertEqual(
+            results, [(paths[1], ChecksumTypes.SHA256, ManifestStatus.MISSING)]
+        )
+
+
+class TestChecksumCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.test_dir = os.path.join(CURRENT_TEST_DIR, "cache")
+        if not exists(cls.test_dir):
+            assert makedirs(cls.test_dir) is True
+
+    @classmethod
+    def tearDownClass(cls):
+        assert remove(CURRENT_TEST_DIR, recursive=True) is True
+        assert not exists(CURRENT_TEST_DIR)
+
+    def setUp(self):
+        self.cache = ChecksumCache(
+            path=os.path.join(self.test_dir, f"{self._testMethodName}.sqlite")
+        )
+
+    def tearDown(self):
+        self.cache.close()
+
+    def test_cache_hit_and_miss(self):
+        test_file = os.path.join(self.test_dir, f"{TEST_FILE}-1")
+        self.assertTrue(write(test_file, TEST_CONTENT))
+        expected = hashsum(test_file, algorithm=ChecksumTypes.SHA256)
+        self.assertEqual(checksum_file(test_file, cache=self.cache), expected)
+        self.assertEqual(self.cache.stats(), {"hits": 0, "misses": 1})
+        self.assertEqual(checksum_file(test_file, cache=self.cache), expected)
+        self.assertEqual(self.cache.stats(), {"hits": 1, "misses": 1})
+
+        self.assertTrue(write_checksum_file(test_file, cache=self.cache))
+        self.assertTrue(
+            checksum_equal(
+                test_file,
+                f"{test_file}.{ChecksumTypes.SHA256}",
+                cache=self.cache,
+            )
+        )
+        self.assertEqual(self.cache.stats(), {"hits": 3, "misses": 1})
+
+    def test_cache_invalidated_by_modification(self):
+        test_file = os.path.join(self.test_dir, f"{TEST_FILE}-2")
+        self.assertTrue(write(test_file, TEST_CONTENT))
+        self.assertTrue(checksum_file(test_file, cache=self.cache))
+        self.assertTrue(write(test_file, TEST_CONTENT + "modified"))
+        self.assertEqual(
+            checksum_file(test_file, cache=self.cache),
+            hashsum(test_file, algorithm=ChecksumTypes.SHA256),
+        )
+        self.assertEqual(self.cache.stats(), {"hits": 0, "misses": 2})
+
+    def test_cache_eviction(self):
+        self.cache.max_entries = 2
+        test_files = []
+        for index in range(3):
+            test_file = os.path.join(self.test_dir, f"{TEST_FILE}-evict-{index}")
+            self.assertTrue(write(test_file, f"{TEST_CONTENT}{index}"))
+            self.assertTrue(checksum_file(test_file, cache=self.cache))
+            test_files.append(test_file)
+        # The least recently used digest is the one that was evicted
+        self.assertIsNone(self.cache.get(test_files[0], ChecksumTypes.SHA256))
+        self.assertIsNotNone(self.cache.get(test_files[2], ChecksumTypes.SHA256))
+
+    def test_cache_disabled(self):
+        test_file = os.path.join(self.test_dir, f"{TEST_FILE}-3")
+        self.assertTrue(write(test_file, TEST_CONTENT))
+        self.assertTrue(checksum_file(test_file, cache=False))
+        self.assertEqual(self.cache.stats(), {"hits": 0, "misses": 0})
+
+    def test_verify_manifest_entries_per_file_algorithms(self):
+        paths = []
+        for index in range(2):
+            path = os.path.join(self.test_dir, f"{TEST_FILE}-manifest-{index}")
+            self.assertTrue(write(path, f"{TEST_CONTENT}{index}"))
+            paths.append(path)
+        entries = [
+            (paths[0], ChecksumTypes.SHA256, hashsum(paths[0], ChecksumTypes.SHA256)),
+            (paths[1], ChecksumTypes.MD5, hashsum(paths[1], ChecksumTypes.MD5)),
+        ]
+        results = list(verify_manifest_entries(entries, cache=self.cache))
+        self.assertEqual(
+            sorted(results),
+            sorted(
+                (path, algorithm, ManifestStatus.OK) for path, algorithm, _ in entries
+            ),
+        )
+        # Each file is only hashed with the algorithm that the manifest holds for it
+        self.assertEqual(self.cache.stats(), {"hits": 0, "misses": 2})
+        self.assertIsNone(self.cache.get(paths[0], ChecksumTypes.MD5))
+        self.assertIsNone(self.cache.get(paths[1], ChecksumTypes.SHA256))
+
+    def test_default_cache_shared_between_threads(self):
+        # Concurrent workers that resolve the default cache must share one instance
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            caches = list(executor.map(lambda _: get_checksum_cache(True), range(32)))
+        self.assertEqual(len({id(cache) for cache in caches}), 1)
+        self.assertIsInstance(caches[0], ChecksumCache)
@@ -0,0 +1,124 @@
+# Copyright (C) 2024  The publishing-tools Project by the Science HPC Center at UCPH
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import os
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from publish.checksum import ChecksumTypes
+from publish.utils.io import exists, makedirs, remove, write, hashsum
+from publish.cli.return_codes import SUCCESS, FILE_NOT_FOUND, CHECKSUM_FAILURE
+from publish.cli.checksum import main
+from tests.common import TMP_TEST_PATH, TEST_CONTENT, TEST_FILE, NON_EXISTING_FILE
+
+TEST_NAME = os.path.basename(__file__).split(".")[0]
+CURRENT_TEST_DIR = os.path.join(TMP_TEST_PATH, TEST_NAME)
+# The manifests are kept apart from the checksummed files
+MANIFEST_TEST_DIR = os.path.join(TMP_TEST_PATH, f"{TEST_NAME}-manifests")
+
+
+class TestChecksumCLI(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        if not exists(CURRENT_TEST_DIR):
+            assert makedirs(CURRENT_TEST_DIR) is True
+        if not exists(MANIFEST_TEST_DIR):
+            assert makedirs(MANIFEST_TEST_DIR) is True
+        cls.test_files = []
+        for index in range(4):
+            test_file = os.path.join(CURRENT_TEST_DIR, f"{TEST_FILE}-{index}")
+            assert write(test_file, f"{TEST_CONTENT}{index}")
+            cls.test_files.append(test_file)
+
+    @classmethod
+    def tearDownClass(cls):
+        assert remove(CURRENT_TEST_DIR, recursive=True) is True
+        assert not exists(CURRENT_TEST_DIR)
+        assert remove(MANIFEST_TEST_DIR, recursive=True) is True
+        assert not exists(MANIFEST_TEST_DIR)
+
+    def test_help_msg(self):
+        return_code = None
+        try:
+            _ = main(["-h"])
+        except SystemExit as e:
+            return_code = e.code
+        self.assertEqual(return_code, SUCCESS)
+
+    def test_file_not_found(self):
+        self.assertEqual(main([NON_EXISTING_FILE]), FILE_NOT_FOUND)
+
+    def test_checksum_files(self):
+        output = StringIO()
+        with redirect_stdout(output):
+            self.assertEqual(main(self.test_files + ["--workers", "2"]), SUCCESS)
+        lines = sorted(output.getvalue().splitlines())
+        expected_lines = sorted(
+            f"{hashsum(test_file, algorithm=ChecksumTypes.SHA256)}  {test_file}"
+            for test_file in self.test_files
+        )
+        self.assertEqual(lines, expected_lines)
+
+    def test_checksum_directory_recursive(self):
+        output = StringIO()
+        with redirect_stdout(output):
+            self.assertEqual(
+                main(
+                    [
+                        CURRENT_TEST_DIR,
+                        "--recursive",
+                        "--checksum-algorithm",
+                        ChecksumTypes.SHA256.value,
+                        "--checksum-algorithm",
+                        ChecksumTypes.MD5.value,
+                    ]
+                ),
+                SUCCESS,
+            )
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), len(self.test_files) * 2)
+        for test_file in self.test_files:
+            self.assertIn(
+                f"MD5 ({test_file}) = {hashsum(test_file, algorithm=ChecksumTypes.MD5)}",
+                lines,
+            )
+
+    def test_write_and_check_manifest(self):
+        manifest_path = os.path.join(MANIFEST_TEST_DIR, "SHA256SUMS")
+        self.assertEqual(main(self.test_files + ["--manifest", manifest_path]), SUCCESS)
+        self.assertTrue(exists(manifest_path))
+
+        output = StringIO()
+        with redirect_stdout(output):
+            self.assertEqual(main(["--check", manifest_path]), SUCCESS)
+        lines = sorted(output.getvalue().splitlines())
+        self.assertEqual(
+            lines, sorted(f"{test_file}: OK" for test_file in self.test_files)
+        )
+
+    def test_check_manifest_failure(self):
+        manifest_path = os.path.join(MANIFEST_TEST_DIR, "failure-SUMS")
+        self.assertTrue(
+            write(
+                manifest_path,
+                f"SHA256 ({self.test_files[0]}) = {'0' * 64}\n",
+            )
+        )
+        output = StringIO()
+        with redirect_stdout(output):
+            self.assertEqual(main(["--check", manifest_path]), CHECKSUM_FAILURE)
+        self.assertEqual(output.getvalue(), f"{self.test_files[0]}: FAILED\n")
@@ -0,0 +1,108 @@
+# Copyright (C) 2024  The publishing-tools Project by the Science HPC Center at UCPH
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import gzip
+import hashlib
+import lzma
+import os
+import unittest
+
+from publish.compression import (
+    CompressionTypes,
+    compression_available,
+    i_compress,
+    uncompressed_path,
+)
+from tests.common import chunks
+
+COMPRESSION_TEST_CONTENT = os.urandom(64 * 1024) * 8 + b"compressible" * 100000
+TEST_BLOCK_SIZE = 256 * 1024
+
+DECOMPRESS = {
+    CompressionTypes.GZIP: gzip.decompress,
+    CompressionTypes.XZ: lzma.decompress,
+}
+
+
+class TestCompression(unittest.TestCase):
+    def test_i_compress_blocks(self):
+        for compression, decompress in DECOMPRESS.items():
+            hashers = {"sha256": hashlib.sha256()}
+            compressed = b"".join(
+                i_compress(
+                    chunks(COMPRESSION_TEST_CONTENT, chunk_size=100000),
+                    compression,
+                    block_size=TEST_BLOCK_SIZE,
+                    workers=4,
+                    hashers=hashers,
+                )
+            )
+            # The concatenated blocks decompress to the whole content
+            self.assertEqual(decompress(compressed), COMPRESSION_TEST_CONTENT)
+            self.assertLess(len(compressed), len(COMPRESSION_TEST_CONTENT))
+            self.assertEqual(
+                hashers["sha256"].hexdigest(),
+                hashlib.sha256(COMPRESSION_TEST_CONTENT).hexdigest(),
+            )
+
+    def test_i_compress_reproducible(self):
+        for compression in DECOMPRESS:
+            compressed = [
+                b"".join(
+                    i_compress(
+                        chunks(COMPRESSION_TEST_CONTENT, chunk_size=100000),
+                        compression,
+                        block_size=TEST_BLOCK_SIZE,
+                        workers=workers,
+                    )
+                )
+                for workers in (1, 4)
+            ]
+            self.assertEqual(compressed[0], compressed[1])
+
+    def test_i_compress_empty(self):
+        for compression, decompress in DECOMPRESS.items():
+            compressed = b"".join(i_compress([], compression))
+            self.assertTrue(compressed)
+            self.assertEqual(decompress(compressed), b"")
+
+    @unittest.skipUnless(
+        compression_available(CompressionTypes.ZSTD), "zstandard is not installed"
+    )
+    def test_i_compress_zstd(self):
+        import zstandard
+
+        compressed = b"".join(
+            i_compress(
+                chunks(COMPRESSION_TEST_CONTENT, chunk_size=100000),
+                CompressionTypes.ZSTD,
+                block_size=TEST_BLOCK_SIZE,
+            )
+        )
+        reader = zstandard.ZstdDecompressor().stream_reader(
+            compressed, read_across_frames=True
+        )
+        self.assertEqual(reader.read(), COMPRESSION_TEST_CONTENT)
+
+    def test_uncompressed_path(self):
+        self.assertEqual(
+            uncompressed_path("/tmp/image.tar.gz", CompressionTypes.GZIP),
+            "/tmp/image.tar",
+        )
+        self.assertEqual(
+            uncompressed_path("/tmp/image.tar.gz", CompressionTypes.XZ),
+            "/tmp/image.tar.gz.uncompressed",
+        )
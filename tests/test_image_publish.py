@@ -14,22 +14,53 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
+import io
+import json
 import os
+import tarfile
 import unittest
 
-from publish.utils.io import exists, makedirs, remove, hashsum, load
+from publish.utils.io import (
+    exists,
+    makedirs,
+    remove,
+    hashsum,
+    load,
+    load_json,
+    write,
+    new_hashers,
+    hexdigests,
+    KnownDigestHasher,
+)
+from publish.cache import ArchiveCache
 from publish.signature import gen_key, SignatureTypes
 from publish.publish import publish, PublishTypes, ChecksumTypes
-from publish.publish_container import build_image, remove_image
+from publish.publish_container import (
+    build_image,
+    remove_image,
+    get_image,
+    exists_image,
+    PodmanSession,
+    archive_layer_stats,
+    publish_cached_archive,
+    docker_archive_to_oci_layout,
+    oci_blob_path,
+    OCI_INDEX_FILE,
+    OCI_LAYOUT_FILE,
+    OCI_REF_NAME_ANNOTATION,
+)
 from tests.common import (
     TMP_TEST_PATH,
     TESTS_RESOURCES_DIR,
     TESTS_DOCKERFILE,
     LOCAL_OWNER,
     LOCAL_REGISTRY,
+    sha256_digest,
+    docker_archive,
+    chunks,
+    kill_gpg_agents,
 )
 
-
 TEST_NAME = os.path.basename(__file__).split(".")[0]
 CURRENT_TEST_DIR = os.path.join(TMP_TEST_PATH, TEST_NAME)
 
@@ -87,6 +118,8 @@ class TestPublishContainerImage(unittest.TestCase):
 
     @classmethod
     def tearDownClass(cls):
+        # Stop the gpg-agents before their sockets are removed
+        kill_gpg_agents(CURRENT_TEST_DIR)
         assert remove(CURRENT_TEST_DIR, recursive=True) is True
         assert not exists(CURRENT_TEST_DIR)
         assert remove_image(LOCAL_IMAGE_NAME) is True
@@ -127,6 +160,36 @@ class TestPublishContainerImage(unittest.TestCase):
             load(publish_checksum_destination),
         )
 
+    def test_publish_image_to_archive_with_archive_cache(self):
+        archive_cache = ArchiveCache(
+            path=os.path.join(CURRENT_TEST_DIR, "archives.sqlite")
+        )
+        publish_destinations = [
+            os.path.join(
+                self.publish_directory,
+                f"{TEST_PUBLISH_CONTAINER_IMAGE}.{ARCHIVE_EXTENSION}-cached-{index}",
+            )
+            for index in range(2)
+        ]
+        for publish_destination in publish_destinations:
+            self.assertTrue(
+                publish(
+                    LOCAL_IMAGE_NAME,
+                    publish_destination,
+                    PublishTypes.CONTAINER_IMAGE_ARCHIVE,
+                    with_checksum=True,
+                    archive_cache=archive_cache,
+                )
+            )
+        # The second publication reuses the archive of the first
+        self.assertEqual(archive_cache.stats(), {"hits": 1, "misses": 1})
+        self.assertFalse(os.path.samefile(*publish_destinations))
+        self.assertEqual(
+            load(f"{publish_destinations[0]}.{ChecksumTypes.SHA256}"),
+            load(f"{publish_destinations[1]}.{ChecksumTypes.SHA256}"),
+        )
+        archive_cache.close()
+
     def test_publish_image_to_archive_with_signature(self):
         # Setup the key to sign the file with
         signature_key = f"{TEST_KEY_NAME}_1"
@@ -157,3 +220,335 @@ class TestPublishContainerImage(unittest.TestCase):
         )
         self.assertTrue(exists(publish_destination))
         self.assertTrue(exists(publish_signature_destination))
+
+    def test_publish_image_to_archive_with_session(self):
+        publish_destination = os.path.join(
+            self.publish_directory,
+            f"{TEST_PUBLISH_CONTAINER_IMAGE}.{ARCHIVE_EXTENSION}-3",
+        )
+        with PodmanSession() as session:
+            # The image that is looked up first is reused when it is published
+            self.assertIsNotNone(get_image(LOCAL_IMAGE_NAME, session=session))
+            self.assertTrue(exists_image(LOCAL_IMAGE_NAME, session=session))
+            self.assertTrue(
+                publish(
+                    LOCAL_IMAGE_NAME,
+                    publish_destination,
+                    PublishTypes.CONTAINER_IMAGE_ARCHIVE,
+                    container_session=session,
+                )
+            )
+            self.assertEqual(session.stats(), {"hits": 2, "misses": 1})
+            self.assertIsNone(get_image("non_existing_image", session=session))
+        self.assertTrue(exists(publish_destination))
+
+    def test_podman_session_image_cache_expiry(self):
+        with PodmanSession(image_cache_ttl=0) as session:
+            self.assertIsNotNone(session.get_image(LOCAL_IMAGE_NAME))
+            self.assertIsNotNone(session.get_image(LOCAL_IMAGE_NAME))
+            self.assertEqual(session.stats(), {"hits": 0, "misses": 2})
+
+    def test_publish_images_to_archive(self):
+        # An image that is built on top of the test image shares all of its layers
+        derived_image = f"{LOCAL_IMAGE_NAME}_derived"
+        derived_dockerfile = os.path.join(CURRENT_TEST_DIR, "Dockerfile.derived")
+        self.assertTrue(
+            write(
+                derived_dockerfile,
+                f"FROM {LOCAL_IMAGE_NAME}\nRUN echo derived > /derived\n",
+            )
+        )
+        self.assertTrue(
+            build_image(
+                path=CURRENT_TEST_DIR,
+                dockerfile=derived_dockerfile,
+                tag=derived_image,
+            )
+        )
+
+        publish_destination = os.path.join(
+            self.publish_directory,
+            f"{TEST_PUBLISH_CONTAINER_IMAGE}.{ARCHIVE_EXTENSION}-images",
+        )
+        publish_checksum_destination = f"{publish_destination}.{ChecksumTypes.SHA256}"
+        self.assertTrue(
+            publish(
+                [LOCAL_IMAGE_NAME, derived_image],
+                publish_destination,
+                PublishTypes.CONTAINER_IMAGES_ARCHIVE,
+                with_checksum=True,
+                checksum_algorithm=ChecksumTypes.SHA256,
+            )
+        )
+        self.assertEqual(
+            hashsum(publish_destination, algorithm=ChecksumTypes.SHA256),
+            load(publish_checksum_destination),
+        )
+        stats = archive_layer_stats(publish_destination)
+        self.assertEqual(stats["images"], 2)
+        self.assertLess(stats["unique_layers"], stats["layers"])
+        self.assertGreater(stats["saved_bytes"], 0)
+        self.assertTrue(remove_image(derived_image))
+
+    def test_publish_image_to_oci_layout(self):
+        publish_destination = os.path.join(
+            self.publish_directory, f"{TEST_PUBLISH_CONTAINER_IMAGE}-oci"
+        )
+        for _ in range(2):
+            self.assertTrue(
+                publish(
+                    LOCAL_IMAGE_NAME,
+                    publish_destination,
+                    PublishTypes.CONTAINER_IMAGE_OCI_LAYOUT,
+                    with_checksum=True,
+                    checksum_algorithm=ChecksumTypes.SHA256,
+                )
+            )
+        index_path = os.path.join(publish_destination, OCI_INDEX_FILE)
+        self.assertEqual(
+            hashsum(index_path, algorithm=ChecksumTypes.SHA256),
+            load(f"{index_path}.{ChecksumTypes.SHA256}"),
+        )
+        index = load_json(index_path)
+        self.assertEqual(len(index["manifests"]), 1)
+        self.assertTrue(
+            exists(oci_blob_path(publish_destination, index["manifests"][0]["digest"]))
+        )
+
+
+class TestArchiveLayerStats(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        if not exists(CURRENT_TEST_DIR):
+            assert makedirs(CURRENT_TEST_DIR) is True
+
+    @classmethod
+    def tearDownClass(cls):
+        assert remove(CURRENT_TEST_DIR, recursive=True) is True
+
+    def add_member(self, archive, name, content):
+        member = tarfile.TarInfo(name)
+        member.size = len(content)
+        archive.addfile(member, io.BytesIO(content))
+
+    def test_archive_layer_stats(self):
+        archive_path = os.path.join(CURRENT_TEST_DIR, "layers.tar")
+        manifest = [
+            {"Config": "base.json", "Layers": ["base.tar"]},
+            {"Config": "cuda.json", "Layers": ["base.tar", "cuda.tar"]},
+            {"Config": "cuda-dev.json", "Layers": ["base.tar", "cuda.tar", "dev.tar"]},
+        ]
+        with tarfile.open(archive_path, "w") as archive:
+            self.add_member(archive, "base.tar", b"b" * 1000)
+            self.add_member(archive, "cuda.tar", b"c" * 100)
+            self.add_member(archive, "dev.tar", b"d" * 10)
+            self.add_member(archive, "manifest.json", json.dumps(manifest).encode())
+
+        self.assertEqual(
+            archive_layer_stats(archive_path),
+            {
+                "images": 3,
+                "layers": 6,
+                "unique_layers": 3,
+                "layer_bytes": 3 * 1000 + 2 * 100 + 10,
+                "stored_layer_bytes": 1110,
+                "saved_bytes": 2 * 1000 + 100,
+            },
+        )
+        self.assertIsNone(
+            archive_layer_stats(os.path.join(CURRENT_TEST_DIR, "non_existing.tar"))
+        )
+
+
+class TestArchiveCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        if not exists(CURRENT_TEST_DIR):
+            assert makedirs(CURRENT_TEST_DIR) is True
+
+    @classmethod
+    def tearDownClass(cls):
+        assert remove(CURRENT_TEST_DIR, recursive=True) is True
+
+    def setUp(self):
+        self.archive_cache = ArchiveCache(
+            path=os.path.join(CURRENT_TEST_DIR, f"{self._testMethodName}.sqlite")
+        )
+        self.archive_path = os.path.join(
+            CURRENT_TEST_DIR, f"{self._testMethodName}.{ARCHIVE_EXTENSION}"
+        )
+        self.assertTrue(
+            write(
+                self.archive_path,
+                docker_archive([b"b" * 5000], "localhost/test/nightly:latest"),
+                mode="wb",
+            )
+        )
+        self.digests = {
+            ChecksumTypes.SHA256: hashsum(
+                self.archive_path, algorithm=ChecksumTypes.SHA256
+            )
+        }
+
+    def tearDown(self):
+        self.archive_cache.close()
+
+    def test_archive_cache_hit_and_miss(self):
+        tags = ["localhost/test/nightly:latest"]
+        self.assertIsNone(self.archive_cache.get("image-id", tags))
+        self.assertTrue(
+            self.archive_cache.set(
+                "image-id", tags, self.archive_path, digests=self.digests
+            )
+        )
+        cached_archive = self.archive_cache.get("image-id", tags)
+        self.assertEqual(cached_archive["path"], self.archive_path)
+        self.assertEqual(cached_archive["size"], os.path.getsize(self.archive_path))
+        self.assertEqual(cached_archive["digests"], self.digests)
+        # The tags of the image are part of the saved archive
+        self.assertIsNone(self.archive_cache.get("image-id", tags + ["other:latest"]))
+        self.assertEqual(self.archive_cache.stats(), {"hits": 1, "misses": 2})
+
+    def test_archive_cache_invalidated_by_modification(self):
+        self.assertTrue(
+            self.archive_cache.set(
+                "image-id", [], self.archive_path, digests=self.digests
+            )
+        )
+        self.assertTrue(write(self.archive_path, b"modified", mode="wb"))
+        self.assertIsNone(self.archive_cache.get("image-id", []))
+
+    def test_publish_cached_archive(self):
+        self.assertTrue(
+            self.archive_cache.set(
+                "image-id", [], self.archive_path, digests=self.digests
+            )
+        )
+        destination = os.path.join(CURRENT_TEST_DIR, f"cached.{ARCHIVE_EXTENSION}")
+        hashers = new_hashers([ChecksumTypes.SHA256, ChecksumTypes.SHA512])
+        self.assertTrue(
+            publish_cached_archive(
+                self.archive_cache.get("image-id", []), destination, hashers=hashers
+            )
+        )
+        # The archive is copied, such that a change to the destination leaves the cache intact
+        self.assertFalse(os.path.samefile(self.archive_path, destination))
+        self.assertEqual(
+            load(destination, mode="rb"), load(self.archive_path, mode="rb")
+        )
+        # The cached digest is reused, while the uncached one is calculated
+        self.assertIsInstance(hashers[ChecksumTypes.SHA256], KnownDigestHasher)
+        self.assertEqual(
+            hexdigests(hashers),
+            {
+                ChecksumTypes.SHA256: self.digests[ChecksumTypes.SHA256],
+                ChecksumTypes.SHA512: hashsum(
+                    destination, algorithm=ChecksumTypes.SHA512
+                ),
+            },
+        )
+
+    def test_publish_cached_archive_without_uncompressed_digests(self):
+        self.assertTrue(
+            self.archive_cache.set(
+                "image-id",
+                [],
+                self.archive_path,
+                digests=self.digests,
+                compression="gzip",
+                compression_level=6,
+            )
+        )
+        self.assertIsNone(self.archive_cache.get("image-id", []))
+        cached_archive = self.archive_cache.get(
+            "image-id", [], compression="gzip", compression_level=6
+        )
+        destination = os.path.join(CURRENT_TEST_DIR, f"cached.{ARCHIVE_EXTENSION}.gz")
+        # The uncompressed digest can't be reused, so the image has to be saved again
+        self.assertFalse(
+            publish_cached_archive(
+                cached_archive,
+                destination,
+                hashers=new_hashers([ChecksumTypes.SHA256]),
+                uncompressed_hashers=new_hashers([ChecksumTypes.SHA256]),
+            )
+        )
+        self.assertFalse(exists(destination))
+
+
+class TestOCILayout(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        if not exists(CURRENT_TEST_DIR):
+            assert makedirs(CURRENT_TEST_DIR) is True
+
+    @classmethod
+    def tearDownClass(cls):
+        assert remove(CURRENT_TEST_DIR, recursive=True) is True
+
+    def test_docker_archive_to_oci_layout(self):
+        layout_path = os.path.join(CURRENT_TEST_DIR, "oci_layout")
+        base_layer, top_layer = b"b" * 10000, b"t" * 100
+        hashers = new_hashers([ChecksumTypes.SHA256])
+        stats = docker_archive_to_oci_layout(
+            chunks(
+                docker_archive([base_layer, top_layer], "localhost/test/nightly:latest")
+            ),
+            layout_path,
+            hashers=hashers,
+        )
+        self.assertEqual(stats["images"], 1)
+        # The two layers, the config and the manifest
+        self.assertEqual(stats["written_blobs"], 4)
+        self.assertEqual(stats["skipped_blobs"], 0)
+        self.assertEqual(
+            load_json(os.path.join(layout_path, OCI_LAYOUT_FILE)),
+            {"imageLayoutVersion": "1.0.0"},
+        )
+
+        index_path = os.path.join(layout_path, OCI_INDEX_FILE)
+        self.assertEqual(
+            hexdigests(hashers)[ChecksumTypes.SHA256],
+            hashsum(index_path, algorithm=ChecksumTypes.SHA256),
+        )
+        index = load_json(index_path)
+        self.assertEqual(len(index["manifests"]), 1)
+        descriptor = index["manifests"][0]
+        self.assertEqual(
+            descriptor["annotations"][OCI_REF_NAME_ANNOTATION],
+            "localhost/test/nightly:latest",
+        )
+        manifest = load_json(oci_blob_path(layout_path, descriptor["digest"]))
+        self.assertEqual(
+            [layer["digest"] for layer in manifest["layers"]],
+            [sha256_digest(base_layer), sha256_digest(top_layer)],
+        )
+        for blob in [manifest["config"]] + manifest["layers"]:
+            content = load(oci_blob_path(layout_path, blob["digest"]), mode="rb")
+            self.assertEqual(sha256_digest(content), blob["digest"])
+            self.assertEqual(len(content), blob["size"])
+
+        # Only the changed top layer is written when the image is published again
+        new_top_layer = b"n" * 100
+        stats = docker_archive_to_oci_layout(
+            chunks(
+                docker_archive(
+                    [base_layer, new_top_layer], "localhost/test/nightly:latest"
+                )
+            ),
+            layout_path,
+        )
+        self.assertEqual(stats["skipped_blobs"], 1)
+        self.assertEqual(stats["skipped_bytes"], len(base_layer))
+        self.assertEqual(stats["written_blobs"], 3)
+        self.assertTrue(
+            exists(oci_blob_path(layout_path, sha256_digest(new_top_layer)))
+        )
+
+        # The name now refers to the new manifest
+        index = load_json(index_path)
+        self.assertEqual(len(index["manifests"]), 1)
+        manifest = load_json(
+            oci_blob_path(layout_path, index["manifests"][0]["digest"])
+        )
+        self.assertEqual(manifest["layers"][1]["digest"], sha256_digest(new_top_layer))
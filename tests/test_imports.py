@@ -0,0 +1,48 @@
+# Copyright (C) 2024  The publishing-tools Project by the Science HPC Center at UCPH
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import subprocess
+import sys
+import unittest
+
+# The container and YAML support must only be imported when it is used
+LAZY_MODULES = ["asyncio", "podman", "sqlite3", "yaml"]
+ENTRY_POINT_MODULES = [
+    "publish.cli.publish",
+    "publish.cli.sign",
+    "publish.cli.verify",
+    "publish.cli.checksum",
+]
+
+
+def imported_modules(module):
+    # A fresh interpreter is used, since the other tests import the lazy modules
+    result = subprocess.run(
+        [sys.executable, "-c", f"import sys, {module}; print(' '.join(sys.modules))"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return set(result.stdout.split())
+
+
+class TestImports(unittest.TestCase):
+    def test_entry_points_lazy_imports(self):
+        for module in ENTRY_POINT_MODULES:
+            loaded_modules = imported_modules(module)
+            self.assertIn(module, loaded_modules)
+            for lazy_module in LAZY_MODULES:
+                self.assertNotIn(lazy_module, loaded_modules, msg=module)
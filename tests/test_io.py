@@ -0,0 +1,175 @@
+# Copyright (C) 2024  The publishing-tools Project by the Science HPC Center at UCPH
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import os
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from publish.utils.io import (
+    makedirs,
+    exists,
+    remove,
+    write,
+    load,
+    copy,
+    copy_file,
+    link_file,
+    CopyStrategies,
+    LinkStrategies,
+)
+from tests.common import TMP_TEST_PATH, TEST_FILE, TEST_CONTENT
+
+TEST_NAME = os.path.basename(__file__).split(".")[0]
+CURRENT_TEST_DIR = os.path.join(TMP_TEST_PATH, TEST_NAME)
+TEST_SPARSE_SIZE = 16 * 1024 * 1024
+TEST_SPARSE_DATA_OFFSET = 8 * 1024 * 1024
+
+
+class TestCopy(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        if not exists(CURRENT_TEST_DIR):
+            assert makedirs(CURRENT_TEST_DIR) is True
+        cls.test_file = os.path.join(CURRENT_TEST_DIR, TEST_FILE)
+        assert write(cls.test_file, TEST_CONTENT)
+        # A file that mostly consists of holes
+        cls.test_sparse_file = os.path.join(CURRENT_TEST_DIR, f"{TEST_FILE}-sparse")
+        with open(cls.test_sparse_file, "wb") as fh:
+            fh.write(TEST_CONTENT.encode())
+            fh.seek(TEST_SPARSE_DATA_OFFSET)
+            fh.write(TEST_CONTENT.encode())
+            fh.truncate(TEST_SPARSE_SIZE)
+
+    @classmethod
+    def tearDownClass(cls):
+        assert remove(CURRENT_TEST_DIR, recursive=True) is True
+        assert not exists(CURRENT_TEST_DIR)
+
+    def test_copy(self):
+        copy_destination = os.path.join(CURRENT_TEST_DIR, f"{TEST_FILE}-copy")
+        self.assertTrue(copy(self.test_file, copy_destination))
+        self.assertEqual(load(copy_destination), TEST_CONTENT)
+
+    def test_copy_to_directory(self):
+        copy_directory = os.path.join(CURRENT_TEST_DIR, "directory")
+        self.assertTrue(makedirs(copy_directory))
+        self.assertTrue(copy(self.test_file, copy_directory))
+        self.assertEqual(load(os.path.join(copy_directory, TEST_FILE)), TEST_CONTENT)
+
+    def test_copy_file_strategies(self):
+        expected_content = load(self.test_sparse_file, mode="rb")
+        for strategy in CopyStrategies:
+            copy_destination = os.path.join(
+                CURRENT_TEST_DIR, f"{TEST_FILE}-{strategy.value}"
+            )
+            used_strategy = copy_file(
+                self.test_sparse_file,
+                copy_destination,
+                strategies=[strategy, CopyStrategies.BUFFERED],
+            )
+            # Not every filesystem supports every strategy,
+            # but the buffered fallback is always available
+            self.assertIn(used_strategy, [strategy, CopyStrategies.BUFFERED])
+            self.assertEqual(load(copy_destination, mode="rb"), expected_content)
+
+    def test_copy_file_preserves_holes(self):
+        copy_destination = os.path.join(CURRENT_TEST_DIR, f"{TEST_FILE}-holes")
+        self.assertTrue(
+            copy_file(
+                self.test_sparse_file,
+                copy_destination,
+                strategies=[CopyStrategies.BUFFERED],
+            )
+        )
+        source_stat = os.stat(self.test_sparse_file)
+        destination_stat = os.stat(copy_destination)
+        self.assertEqual(destination_stat.st_size, TEST_SPARSE_SIZE)
+        if source_stat.st_blocks * 512 < TEST_SPARSE_SIZE:
+            self.assertLess(destination_stat.st_blocks * 512, TEST_SPARSE_SIZE)
+
+    def test_copy_same_file(self):
+        # Copying a file onto itself must not truncate it
+        self.assertFalse(copy(self.test_file, self.test_file))
+        self.assertFalse(copy(self.test_file, CURRENT_TEST_DIR))
+        self.assertEqual(load(self.test_file), TEST_CONTENT)
+
+    def test_copy_file_non_existing(self):
+        copy_destination = os.path.join(CURRENT_TEST_DIR, f"{TEST_FILE}-missing")
+        self.assertFalse(copy_file("non_existing_file", copy_destination))
+
+    def test_copy_file_failure(self):
+        # A failed copy leaves neither a partial destination nor a temporary file behind
+        copy_destination = os.path.join(CURRENT_TEST_DIR, f"{TEST_FILE}-failed")
+        self.assertFalse(
+            copy_file(self.test_file, copy_destination, strategies=["unsupported"])
+        )
+        self.assertFalse(exists(copy_destination))
+        # A reflink is not supported by every filesystem
+        if not copy_file(
+            self.test_file, copy_destination, strategies=[CopyStrategies.REFLINK]
+        ):
+            self.assertFalse(exists(copy_destination))
+        self.assertFalse(
+            [name for name in os.listdir(CURRENT_TEST_DIR) if name.endswith(".tmp")]
+        )
+
+    def test_link_file(self):
+        link_destination = os.path.join(CURRENT_TEST_DIR, f"{TEST_FILE}-link")
+        self.assertTrue(write(link_destination, "replaced content"))
+        self.assertIn(link_file(self.test_file, link_destination), list(CopyStrategies))
+        self.assertFalse(os.path.samefile(self.test_file, link_destination))
+        self.assertEqual(load(link_destination), TEST_CONTENT)
+        # Writing to the destination must not change the source
+        self.assertTrue(write(link_destination, "changed content"))
+        self.assertEqual(load(self.test_file), TEST_CONTENT)
+        # A destination that already is the source is left as is
+        self.assertEqual(
+            link_file(self.test_file, self.test_file), LinkStrategies.EXISTING
+        )
+        self.assertEqual(load(self.test_file), TEST_CONTENT)
+
+    def test_link_file_replaces_hard_link(self):
+        # A destination that is a hard link to another file is replaced, not overwritten
+        other_file = os.path.join(CURRENT_TEST_DIR, f"{TEST_FILE}-other")
+        link_destination = os.path.join(CURRENT_TEST_DIR, f"{TEST_FILE}-hard-link")
+        self.assertTrue(write(other_file, "other content"))
+        os.link(other_file, link_destination)
+        self.assertTrue(link_file(self.test_file, link_destination))
+        self.assertEqual(load(link_destination), TEST_CONTENT)
+        self.assertEqual(load(other_file), "other content")
+
+    def test_link_file_concurrently(self):
+        # Concurrent links to the same destination don't share a temporary file
+        link_destination = os.path.join(CURRENT_TEST_DIR, f"{TEST_FILE}-concurrent")
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(
+                executor.map(
+                    lambda _: link_file(self.test_sparse_file, link_destination),
+                    range(8),
+                )
+            )
+        self.assertTrue(all(results))
+        self.assertEqual(
+            load(link_destination, mode="rb"), load(self.test_sparse_file, mode="rb")
+        )
+        self.assertFalse(
+            [name for name in os.listdir(CURRENT_TEST_DIR) if name.endswith(".tmp")]
+        )
+
+    def test_link_file_non_existing(self):
+        link_destination = os.path.join(CURRENT_TEST_DIR, f"{TEST_FILE}-missing-link")
+        self.assertFalse(link_file("non_existing_file", link_destination))
+        self.assertFalse(exists(link_destination))
@@ -0,0 +1,242 @@
+# Copyright (C) 2024  The publishing-tools Project by the Science HPC Center at UCPH
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import asyncio
+import contextvars
+import os
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from publish.utils.io import makedirs, exists, remove, load
+from publish.utils.job import (
+    ASYNC_STREAM_LIMIT,
+    run,
+    run_async,
+    collect_resources,
+    ResourceCollector,
+)
+from tests.common import TMP_TEST_PATH
+
+TEST_NAME = os.path.basename(__file__).split(".")[0]
+CURRENT_TEST_DIR = os.path.join(TMP_TEST_PATH, TEST_NAME)
+
+
+def pid_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+class TestRunAsync(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        if not exists(CURRENT_TEST_DIR):
+            assert makedirs(CURRENT_TEST_DIR) is True
+
+    @classmethod
+    def tearDownClass(cls):
+        assert remove(CURRENT_TEST_DIR, recursive=True) is True
+        assert not exists(CURRENT_TEST_DIR)
+
+    def test_run_async_same_results_as_run(self):
+        for cmd in (["echo", "test"], ["sh", "-c", "echo error >&2; exit 3"]):
+            self.assertEqual(asyncio.run(run_async(cmd)), run(cmd))
+
+    def test_run_async_command_not_found(self):
+        success, result = asyncio.run(run_async(["non_existing_command"]))
+        self.assertFalse(success)
+        self.assertIn("non_existing_command", result["error"])
+
+    def test_run_async_line_callbacks(self):
+        output_lines, error_lines = [], []
+        success, result = asyncio.run(
+            run_async(
+                ["sh", "-c", "echo first; echo second; echo error >&2"],
+                stdout_callback=output_lines.append,
+                stderr_callback=error_lines.append,
+            )
+        )
+        self.assertTrue(success)
+        self.assertEqual(output_lines, ["first\n", "second\n"])
+        self.assertEqual(error_lines, ["error\n"])
+        self.assertEqual(result["output"], "first\nsecond\n")
+
+    def test_run_async_timeout_kills_process_group(self):
+        pid_file = os.path.join(CURRENT_TEST_DIR, "background.pid")
+        start = time.perf_counter()
+        success, result = asyncio.run(
+            run_async(
+                ["sh", "-c", f"sleep 30 & echo $! > {pid_file}; wait"],
+                timeout=1,
+            )
+        )
+        self.assertLess(time.perf_counter() - start, 10)
+        self.assertFalse(success)
+        self.assertIn("timed out", result["error"])
+        # The background child of the command is killed as well
+        background_pid = int(load(pid_file))
+        for _ in range(50):
+            if not pid_exists(background_pid):
+                break
+            time.sleep(0.1)
+        self.assertFalse(pid_exists(background_pid))
+
+    def test_run_async_line_too_long(self):
+        start = time.perf_counter()
+        success, result = asyncio.run(
+            run_async(
+                [
+                    "python3",
+                    "-c",
+                    f"import time; print('x' * {ASYNC_STREAM_LIMIT + 1}, flush=True); time.sleep(30)",
+                ]
+            )
+        )
+        self.assertFalse(success)
+        self.assertIn("Failed to run command", result["error"])
+        # The command is killed instead of being waited for
+        self.assertLess(time.perf_counter() - start, 10)
+
+    def test_run_async_semaphore(self):
+        events_file = os.path.join(CURRENT_TEST_DIR, "events")
+        cmd = [
+            "sh",
+            "-c",
+            f"echo start >> {events_file}; sleep 0.3; echo end >> {events_file}",
+        ]
+
+        async def run_concurrently():
+            semaphore = asyncio.Semaphore(2)
+            return await asyncio.gather(
+                *[run_async(cmd, semaphore=semaphore) for _ in range(6)]
+            )
+
+        results = asyncio.run(run_concurrently())
+        self.assertTrue(all(success for success, _ in results))
+        # At most two of the commands ran at the same time
+        running, max_running = 0, 0
+        for event in load(events_file, readlines=True):
+            running += 1 if event.strip() == "start" else -1
+            max_running = max(max_running, running)
+        self.assertEqual(max_running, 2)
+
+
+class TestRunResources(unittest.TestCase):
+    def test_run_without_resources(self):
+        success, result = run(["echo", "test"])
+        self.assertTrue(success)
+        self.assertNotIn("resources", result)
+
+    def test_run_with_resources_same_results_as_run(self):
+        for cmd in (["echo", "test"], ["sh", "-c", "echo error >&2; exit 3"]):
+            success, result = run(cmd, with_resources=True)
+            expected_success, expected_result = run(cmd)
+            self.assertEqual(success, expected_success)
+            self.assertEqual(result["output"], expected_result["output"])
+            self.assertEqual(result["error"], expected_result["error"])
+
+    def test_run_with_resources(self):
+        success, result = run(
+            ["python3", "-c", "x = bytearray(64 * 1024 * 1024)"],
+            label="allocate",
+            with_resources=True,
+        )
+        self.assertTrue(success)
+        resources = result["resources"]
+        self.assertEqual(resources["label"], "allocate")
+        self.assertGreater(resources["wall_time"], 0)
+        self.assertGreaterEqual(resources["user_time"], 0)
+        self.assertGreaterEqual(resources["system_time"], 0)
+        self.assertGreaterEqual(resources["max_rss"], 64 * 1024 * 1024)
+
+    def test_run_with_resources_input(self):
+        success, result = run(["cat"], input=b"test", with_resources=True)
+        self.assertTrue(success)
+        self.assertEqual(result["output"], "test")
+        self.assertEqual(result["resources"]["label"], "cat")
+
+    def test_collect_resources(self):
+        collector = ResourceCollector()
+        with collect_resources(collector):
+            for _ in range(3):
+                self.assertTrue(run(["echo", "test"], label="echo")[0])
+            self.assertTrue(run(["true"], label="true")[0])
+        # Commands outside of the context are not collected
+        self.assertTrue(run(["echo", "test"], label="echo")[0])
+
+        summary = collector.summary()
+        self.assertEqual(sorted(summary), ["echo", "true"])
+        self.assertEqual(summary["echo"]["count"], 3)
+        self.assertEqual(summary["true"]["count"], 1)
+        for usage in summary.values():
+            self.assertGreater(usage["wall_time"], 0)
+            self.assertGreater(usage["max_rss"], 0)
+
+        collector.clear()
+        self.assertEqual(collector.summary(), {})
+
+    def test_run_with_resources_run_kwargs(self):
+        # The keyword arguments of subprocess.run are also accepted with resources
+        for cmd in (["echo", "test"], ["sh", "-c", "exit 3"]):
+            success, result = run(
+                cmd, with_resources=True, timeout=10, check=True, capture_output=True
+            )
+            expected_success, expected_result = run(cmd, timeout=10, check=True)
+            self.assertEqual(success, expected_success)
+            self.assertEqual(result["output"], expected_result["output"])
+
+    def test_run_with_resources_timeout(self):
+        start = time.perf_counter()
+        success, result = run(["sleep", "10"], with_resources=True, timeout=0.5)
+        self.assertFalse(success)
+        self.assertIn("timed out", result["error"])
+        self.assertLess(time.perf_counter() - start, 5)
+
+    @unittest.skipUnless(hasattr(os, "waitid"), "os.waitid is not available")
+    def test_run_with_resources_without_waitid(self):
+        # Platforms without os.waitid, e.g. macOS, fall back to os.wait4
+        waitid = os.waitid
+        del os.waitid
+        try:
+            success, result = run(["echo", "test"], with_resources=True, timeout=10)
+            self.assertTrue(success)
+            self.assertEqual(result["output"], "test\n")
+            success, result = run(["sleep", "10"], with_resources=True, timeout=0.5)
+            self.assertFalse(success)
+            self.assertIn("timed out", result["error"])
+        finally:
+            os.waitid = waitid
+
+    def test_collect_resources_in_threads(self):
+        # The collector is only active in the context it was set in and copies of it
+        with collect_resources() as collector:
+            context = contextvars.copy_context()
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                results = list(
+                    executor.map(
+                        lambda _: context.copy().run(run, ["true"], label="true"),
+                        range(4),
+                    )
+                )
+                self.assertTrue(
+                    executor.submit(run, ["true"], label="other").result()[0]
+                )
+        self.assertTrue(all(success for success, _ in results))
+        self.assertEqual(list(collector.summary()), ["true"])
+        self.assertEqual(collector.summary()["true"]["count"], 4)
@@ -18,9 +18,15 @@ import os
 import unittest
 
 from publish.signature import SignatureTypes, SignatureSources, gen_key
-from publish.utils.io import makedirs, exists, remove, write, hashsum
-from publish.publish import publish, PublishTypes, ChecksumTypes
-from tests.common import TMP_TEST_PATH
+from publish.utils.io import makedirs, exists, remove, write, hashsum, load
+from publish.publish import (
+    publish,
+    publish_many,
+    PublishTypes,
+    PublishStages,
+    ChecksumTypes,
+)
+from tests.common import TMP_TEST_PATH, kill_gpg_agents
 
 TEST_NAME = os.path.basename(__file__).split(".")[0]
 CURRENT_TEST_DIR = os.path.join(TMP_TEST_PATH, TEST_NAME)
@@ -68,6 +74,8 @@ class TestPublishFile(unittest.TestCase):
 
     @classmethod
     def tearDownClass(cls):
+        # Stop the gpg-agents before their sockets are removed
+        kill_gpg_agents(CURRENT_TEST_DIR)
         # Remove the temporary directory and its contents
         assert remove(CURRENT_TEST_DIR, recursive=True) is True
         assert not exists(CURRENT_TEST_DIR)
@@ -81,6 +89,26 @@ class TestPublishFile(unittest.TestCase):
         )
         self.assertTrue(exists(publish_destination))
 
+    def test_publish_file_onto_itself(self):
+        # The source directory as the destination resolves to the source itself
+        self.assertFalse(
+            publish(self.publish_source, CURRENT_TEST_DIR, PublishTypes.FILE)
+        )
+        self.assertEqual(load(self.publish_source), TEST_FILE_CONTENT)
+
+    def test_publish_file_with_checksum_onto_itself(self):
+        self.assertFalse(
+            publish(
+                self.publish_source,
+                self.publish_source,
+                PublishTypes.FILE,
+                with_checksum=True,
+                checksum_algorithm=CHECKSUM_ALGORITHM,
+            )
+        )
+        self.assertEqual(load(self.publish_source), TEST_FILE_CONTENT)
+        self.assertFalse(exists(f"{self.publish_source}.{CHECKSUM_ALGORITHM}"))
+
     def test_file_checksum(self):
         # Get the checksum of the file
         checksum = hashsum(self.publish_source, algorithm=CHECKSUM_ALGORITHM)
@@ -104,6 +132,66 @@ class TestPublishFile(unittest.TestCase):
         self.assertTrue(exists(publish_destination))
         self.assertTrue(exists(publish_destination + f".{CHECKSUM_ALGORITHM}"))
 
+    def test_publish_file_with_multiple_checksums(self):
+        # Publish the file with every supported checksum algorithm
+        publish_destination = os.path.join(
+            self.publish_directory, f"{TEST_PUBLISH_FILE}-10"
+        )
+        checksum_algorithms = [checksum_type for checksum_type in ChecksumTypes]
+        self.assertTrue(
+            publish(
+                self.publish_source,
+                publish_destination,
+                PublishTypes.FILE,
+                with_checksum=True,
+                checksum_algorithm=checksum_algorithms,
+            )
+        )
+        self.assertTrue(exists(publish_destination))
+        for checksum_algorithm in checksum_algorithms:
+            checksum_file = f"{publish_destination}.{checksum_algorithm}"
+            self.assertTrue(exists(checksum_file))
+            self.assertEqual(
+                load(checksum_file),
+                hashsum(self.publish_source, algorithm=checksum_algorithm),
+            )
+
+    def test_publish_file_with_write_verification(self):
+        publish_destination = os.path.join(
+            self.publish_directory, f"{TEST_PUBLISH_FILE}-11"
+        )
+        self.assertTrue(
+            publish(
+                self.publish_source,
+                publish_destination,
+                PublishTypes.FILE,
+                with_checksum=True,
+                checksum_algorithm=CHECKSUM_ALGORITHM,
+                with_write_verification=True,
+            )
+        )
+        self.assertEqual(
+            load(f"{publish_destination}.{CHECKSUM_ALGORITHM}"), TEST_FILE_CHECKSUM
+        )
+
+    def test_publish_file_to_directory_with_checksum(self):
+        publish_directory = os.path.join(self.publish_directory, "directory")
+        self.assertTrue(makedirs(publish_directory))
+        self.assertTrue(
+            publish(
+                self.publish_source,
+                publish_directory,
+                PublishTypes.FILE,
+                with_checksum=True,
+                checksum_algorithm=CHECKSUM_ALGORITHM,
+            )
+        )
+        publish_destination = os.path.join(publish_directory, TEST_PUBLISH_FILE)
+        self.assertTrue(exists(publish_destination))
+        self.assertEqual(
+            load(f"{publish_destination}.{CHECKSUM_ALGORITHM}"), TEST_FILE_CHECKSUM
+        )
+
     def test_publish_file_with_signature(self):
         # Setup the key to sign the file with
         signature_key = f"{TEST_KEY_NAME}_1"
@@ -327,3 +415,62 @@ class TestPublishFile(unittest.TestCase):
         output_checksum_file = f"{publish_destination}.{CHECKSUM_ALGORITHM}"
         self.assertTrue(exists(output_checksum_file))
         self.assertTrue(exists(output_checksum_file + f".{SignatureTypes.GPG}"))
+
+    def test_publish_many(self):
+        # Setup the key to sign the files with
+        signature_key = f"{TEST_KEY_NAME}_many"
+        self.assertTrue(
+            gen_key(
+                signature_key,
+                key_generator=SignatureTypes.GPG,
+                key_args=GPG_GEN_KEY_ARGS,
+            )
+        )
+
+        jobs = []
+        for index in range(4):
+            jobs.append(
+                {
+                    "source": self.publish_source,
+                    "destination": os.path.join(
+                        self.publish_directory, f"{TEST_PUBLISH_FILE}-many-{index}"
+                    ),
+                    "publish_type": PublishTypes.FILE,
+                    "with_checksum": True,
+                    "checksum_algorithm": CHECKSUM_ALGORITHM,
+                    "with_signature": True,
+                    "signature_source": SignatureSources.GENERATED_CHECKSUM_FILE,
+                    "signature_key": signature_key,
+                    "signauture_args": GPG_DETACH_SIGN_ARGS,
+                }
+            )
+        # A job whose source does not exist fails in the publish stage
+        jobs.append(
+            {
+                "source": os.path.join(CURRENT_TEST_DIR, "non_existing_file"),
+                "destination": os.path.join(
+                    self.publish_directory, f"{TEST_PUBLISH_FILE}-many-missing"
+                ),
+                "publish_type": PublishTypes.FILE,
+                "with_checksum": True,
+            }
+        )
+
+        results = publish_many(
+            jobs, workers=2, stage_workers={PublishStages.SIGNATURE: 1}
+        )
+        self.assertEqual(len(results), len(jobs))
+        for job, result in zip(jobs[:-1], results[:-1]):
+            self.assertTrue(result["success"])
+            self.assertIsNone(result["failed_stage"])
+            self.assertEqual(result["output"], job["destination"])
+            self.assertEqual(
+                result["digests"], {CHECKSUM_ALGORITHM: TEST_FILE_CHECKSUM}
+            )
+            output_checksum_file = f"{job['destination']}.{CHECKSUM_ALGORITHM}"
+            self.assertEqual(load(output_checksum_file), TEST_FILE_CHECKSUM)
+            self.assertTrue(exists(output_checksum_file + f".{SignatureTypes.GPG}"))
+
+        self.assertFalse(results[-1]["success"])
+        self.assertEqual(results[-1]["failed_stage"], PublishStages.PUBLISH)
+        self.assertFalse(exists(jobs[-1]["destination"]))
@@ -14,13 +14,20 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
+import gzip
+import hashlib
 import unittest
 import os
 
 from publish.utils.io import exists, makedirs, remove, write, load, hashsum
 from publish.signature import gen_key, SignatureTypes, SignatureSources
 from publish.publish_container import build_image, remove_image
-from publish.cli.return_codes import SUCCESS, FILE_NOT_FOUND, IMAGE_NOT_FOUND
+from publish.cli.return_codes import (
+    SUCCESS,
+    FILE_NOT_FOUND,
+    IMAGE_NOT_FOUND,
+    PUBLISH_FAILURE,
+)
 from publish.cli.publish import main, ChecksumTypes, PublishTypes
 from tests.common import (
     TMP_TEST_PATH,
@@ -33,6 +40,7 @@ from tests.common import (
     NON_EXISTING_DESTINATION,
     ARCHIVE_EXTENSION,
     TEST_CONTENT,
+    kill_gpg_agents,
 )
 
 TEST_NAME = os.path.basename(__file__).split(".")[0]
@@ -101,6 +109,8 @@ class TestPublishCLI(unittest.TestCase):
 
     @classmethod
     def tearDownClass(cls):
+        # Stop the gpg-agents before their sockets are removed
+        kill_gpg_agents(CURRENT_TEST_DIR)
         assert remove(CURRENT_TEST_DIR, recursive=True) is True
         assert not exists(CURRENT_TEST_DIR)
         assert remove_image(LOCAL_IMAGE_NAME) is True
@@ -192,6 +202,58 @@ class TestPublishCLI(unittest.TestCase):
                 load(publish_checksum_destination),
             )
 
+    def test_publish_file_with_multiple_checksums(self):
+        publish_destination = (
+            f"{TEST_PUBLISH_INPUT}{PUBLISH_TYPE_EXTENSION[PublishTypes.FILE]}-2"
+        )
+        checksum_algorithms = [checksum_type.value for checksum_type in ChecksumTypes]
+        self.assertEqual(
+            main(
+                [
+                    PUBLISH_TYPE_SOURCE[PublishTypes.FILE],
+                    publish_destination,
+                    "--publish-type",
+                    PublishTypes.FILE,
+                    "--with-checksum",
+                ]
+                + [
+                    argument
+                    for checksum_algorithm in checksum_algorithms
+                    for argument in ("--checksum-algorithm", checksum_algorithm)
+                ]
+            ),
+            SUCCESS,
+        )
+        self.assertTrue(exists(publish_destination))
+        for checksum_algorithm in checksum_algorithms:
+            publish_checksum_destination = f"{publish_destination}.{checksum_algorithm}"
+            self.assertTrue(exists(publish_checksum_destination))
+            self.assertEqual(
+                hashsum(publish_destination, algorithm=checksum_algorithm),
+                load(publish_checksum_destination),
+            )
+
+    def test_publish_file_with_checksum_algorithm_before_positionals(self):
+        publish_destination = (
+            f"{TEST_PUBLISH_INPUT}{PUBLISH_TYPE_EXTENSION[PublishTypes.FILE]}-ca-first"
+        )
+        self.assertEqual(
+            main(
+                [
+                    "-wc",
+                    "-ca",
+                    ChecksumTypes.SHA512.value,
+                    PUBLISH_TYPE_SOURCE[PublishTypes.FILE],
+                    publish_destination,
+                ]
+            ),
+            SUCCESS,
+        )
+        self.assertEqual(
+            hashsum(publish_destination, algorithm=ChecksumTypes.SHA512),
+            load(f"{publish_destination}.{ChecksumTypes.SHA512}"),
+        )
+
     def test_publish_image_with_checksum(self):
         publish_destination = f"{TEST_PUBLISH_INPUT}{PUBLISH_TYPE_EXTENSION[PublishTypes.CONTAINER_IMAGE_ARCHIVE]}-1"
         for checksum_type in ChecksumTypes:
@@ -219,6 +281,55 @@ class TestPublishCLI(unittest.TestCase):
                 load(publish_checksum_destination),
             )
 
+    def test_publish_file_with_compression(self):
+        publish_destination = (
+            f"{TEST_PUBLISH_INPUT}{PUBLISH_TYPE_EXTENSION[PublishTypes.FILE]}-gz"
+        )
+        self.assertEqual(
+            main(
+                [
+                    PUBLISH_TYPE_SOURCE[PublishTypes.FILE],
+                    publish_destination,
+                    "--publish-type",
+                    PublishTypes.FILE,
+                    "--compression",
+                    "gzip",
+                ]
+            ),
+            PUBLISH_FAILURE,
+        )
+        self.assertFalse(exists(publish_destination))
+
+    def test_publish_image_with_compression(self):
+        uncompressed_destination = f"{TEST_PUBLISH_INPUT}{PUBLISH_TYPE_EXTENSION[PublishTypes.CONTAINER_IMAGE_ARCHIVE]}-compressed"
+        publish_destination = f"{uncompressed_destination}.gz"
+        self.assertEqual(
+            main(
+                [
+                    PUBLISH_TYPE_SOURCE[PublishTypes.CONTAINER_IMAGE_ARCHIVE],
+                    publish_destination,
+                    "--publish-type",
+                    PublishTypes.CONTAINER_IMAGE_ARCHIVE,
+                    "--compression",
+                    "gzip",
+                    "--with-checksum",
+                    "--with-uncompressed-checksum",
+                ]
+            ),
+            SUCCESS,
+        )
+        self.assertEqual(
+            hashsum(publish_destination, algorithm=ChecksumTypes.SHA256),
+            load(f"{publish_destination}.{ChecksumTypes.SHA256}"),
+        )
+        # The uncompressed archive is not written, only its checksum
+        self.assertFalse(exists(uncompressed_destination))
+        with gzip.open(publish_destination, "rb") as fh:
+            self.assertEqual(
+                hashlib.sha256(fh.read()).hexdigest(),
+                load(f"{uncompressed_destination}.{ChecksumTypes.SHA256}"),
+            )
+
     def test_publish_file_with_signature(self):
         # Setup the key to sign the file with
         signature_key = f"{TEST_KEY_NAME}_1"
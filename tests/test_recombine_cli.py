@@ -0,0 +1,75 @@
+# Copyright (C) 2024  The publishing-tools Project by the Science HPC Center at UCPH
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import os
+import unittest
+
+from publish.archive import write_delta_archive
+from publish.utils.io import exists, makedirs, remove, write
+from publish.cli.return_codes import SUCCESS, FILE_NOT_FOUND, ARCHIVE_FAILURE
+from publish.cli.recombine import main
+from tests.common import TMP_TEST_PATH, NON_EXISTING_FILE, docker_archive, chunks
+
+TEST_NAME = os.path.basename(__file__).split(".")[0]
+CURRENT_TEST_DIR = os.path.join(TMP_TEST_PATH, TEST_NAME)
+
+
+class TestRecombineCLI(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        if not exists(CURRENT_TEST_DIR):
+            assert makedirs(CURRENT_TEST_DIR) is True
+        base_layer, top_layer = b"b" * 5000, b"t" * 100
+        tag = "localhost/test/nightly:latest"
+        cls.baseline = os.path.join(CURRENT_TEST_DIR, "baseline.tar")
+        assert write(cls.baseline, docker_archive([base_layer], tag), mode="wb")
+        cls.delta = os.path.join(CURRENT_TEST_DIR, "delta.tar")
+        assert write_delta_archive(
+            chunks(docker_archive([base_layer, top_layer], tag)),
+            cls.delta,
+            cls.baseline,
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        assert remove(CURRENT_TEST_DIR, recursive=True) is True
+        assert not exists(CURRENT_TEST_DIR)
+
+    def test_help_msg(self):
+        return_code = None
+        try:
+            _ = main(["-h"])
+        except SystemExit as e:
+            return_code = e.code
+        self.assertEqual(return_code, SUCCESS)
+
+    def test_recombine_missing_delta(self):
+        destination = os.path.join(CURRENT_TEST_DIR, "missing.tar")
+        return_code = main([NON_EXISTING_FILE, self.baseline, destination])
+        self.assertEqual(return_code, FILE_NOT_FOUND)
+        self.assertFalse(exists(destination))
+
+    def test_recombine_wrong_baseline(self):
+        destination = os.path.join(CURRENT_TEST_DIR, "wrong.tar")
+        return_code = main([self.delta, self.delta, destination])
+        self.assertEqual(return_code, ARCHIVE_FAILURE)
+        self.assertFalse(exists(destination))
+
+    def test_recombine(self):
+        destination = os.path.join(CURRENT_TEST_DIR, "recombined.tar")
+        return_code = main([self.delta, self.baseline, destination])
+        self.assertEqual(return_code, SUCCESS)
+        self.assertTrue(exists(destination))
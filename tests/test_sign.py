@@ -19,15 +19,26 @@ import unittest
 
 from publish.signature import (
     sign_file,
+    sign_files,
     gen_key,
     delete_key,
     get_key_fingerprint,
     SignatureTypes,
+    SignatureFormats,
     export_signature_key,
     write_signature_key_file,
+    gpg_keyring_args,
+    KeyringIndex,
 )
 from publish.utils.io import makedirs, exists, remove, write, load
-from tests.common import TMP_TEST_PATH, TEST_FILE, TEST_CONTENT, NON_EXISTING_FILE
+from publish.utils.job import collect_resources
+from tests.common import (
+    TMP_TEST_PATH,
+    TEST_FILE,
+    TEST_CONTENT,
+    NON_EXISTING_FILE,
+    kill_gpg_agents,
+)
 
 TEST_NAME = os.path.basename(__file__).split(".")[0]
 CURRENT_TEST_DIR = os.path.join(TMP_TEST_PATH, TEST_NAME)
@@ -95,6 +106,8 @@ class TestGpGSignFile(unittest.TestCase):
             )
             is True
         )
+        # Stop the gpg-agents before their sockets are removed
+        kill_gpg_agents(CURRENT_TEST_DIR)
         # Remove the temporary directory and its contents
         assert remove(CURRENT_TEST_DIR, recursive=True) is True
         assert not exists(CURRENT_TEST_DIR)
@@ -177,6 +190,202 @@ class TestGpGSignFile(unittest.TestCase):
         self.assertTrue(exists(test_file_path))
         self.assertTrue(exists(test_detached_signed_file_ouput))
 
+    def test_sign_signature_formats(self):
+        # Create a temporary file to sign
+        test_file_path = os.path.join(CURRENT_TEST_DIR, f"{TEST_FILE}-3")
+        self.assertTrue(write(test_file_path, TEST_CONTENT))
+
+        expected_outputs = {
+            SignatureFormats.INLINE: f"{test_file_path}.{SignatureTypes.GPG}",
+            SignatureFormats.DETACHED: f"{test_file_path}.sig",
+            SignatureFormats.CLEARSIGN: f"{test_file_path}.{SignatureTypes.GPG}",
+        }
+        for signature_format, expected_output in expected_outputs.items():
+            # The format replaces the --sign option in the arguments
+            self.assertTrue(
+                sign_file(
+                    test_file_path,
+                    TEST_KEY_NAME,
+                    sign_command=SignatureTypes.GPG,
+                    sign_args=GPG_SIGN_ARGS + ["--yes"],
+                    signature_format=signature_format,
+                )
+            )
+            self.assertTrue(exists(expected_output))
+            signature = load(expected_output, mode="rb")
+            if signature_format == SignatureFormats.DETACHED:
+                # A detached signature does not contain the signed content
+                self.assertNotIn(TEST_CONTENT.encode(), signature)
+            if signature_format == SignatureFormats.CLEARSIGN:
+                self.assertIn(TEST_CONTENT.encode(), signature)
+            self.assertTrue(remove(expected_output))
+
+    def test_sign_files(self):
+        test_files = []
+        for index in range(6):
+            test_file_path = os.path.join(CURRENT_TEST_DIR, f"{TEST_FILE}-many-{index}")
+            self.assertTrue(write(test_file_path, f"{TEST_CONTENT}{index}"))
+            test_files.append(test_file_path)
+
+        results = sign_files(
+            test_files,
+            TEST_KEY_NAME,
+            jobs=4,
+            sign_command=SignatureTypes.GPG,
+            sign_args=GPG_SIGN_ARGS,
+            signature_format=SignatureFormats.DETACHED,
+        )
+        self.assertEqual(list(results), test_files)
+        for test_file_path, result in results.items():
+            self.assertTrue(result["signed"])
+            self.assertEqual(result["output"], f"{test_file_path}.sig")
+            self.assertTrue(exists(result["output"]))
+            self.assertGreater(result["latency"], 0)
+
+    def test_sign_retry_transient_error(self):
+        # A signature generator that fails with a lock contention error on its first run
+        attempts_file = os.path.join(CURRENT_TEST_DIR, "sign-attempts")
+        sign_command = os.path.join(CURRENT_TEST_DIR, "transient-sign")
+        self.assertTrue(
+            write(
+                sign_command,
+                "#!/bin/sh\n"
+                f"echo attempt >> {attempts_file}\n"
+                f"if [ $(wc -l < {attempts_file}) -lt 2 ]; then\n"
+                "    echo 'gpg: waiting for lock' >&2\n"
+                "    exit 2\n"
+                "fi\n",
+            )
+        )
+        os.chmod(sign_command, 0o755)
+        test_file_path = os.path.join(CURRENT_TEST_DIR, f"{TEST_FILE}-retry")
+        self.assertTrue(write(test_file_path, TEST_CONTENT))
+
+        self.assertFalse(
+            sign_file(test_file_path, TEST_KEY_NAME, sign_command=sign_command)
+        )
+        self.assertTrue(
+            sign_file(
+                test_file_path,
+                TEST_KEY_NAME,
+                sign_command=sign_command,
+                retries=1,
+                retry_delay=0,
+            )
+        )
+        self.assertEqual(len(load(attempts_file, readlines=True)), 2)
+
+    def test_sign_and_export_resources(self):
+        test_file_path = os.path.join(CURRENT_TEST_DIR, f"{TEST_FILE}-resources")
+        self.assertTrue(write(test_file_path, TEST_CONTENT))
+
+        with collect_resources() as collector:
+            self.assertTrue(
+                sign_file(
+                    test_file_path,
+                    TEST_KEY_NAME,
+                    sign_command=SignatureTypes.GPG,
+                    sign_args=GPG_SIGN_ARGS,
+                )
+            )
+            self.assertIsNotNone(
+                export_signature_key(
+                    TEST_KEY_NAME,
+                    sign_command=SignatureTypes.GPG,
+                    sign_args=GPG_SIGN_COMMON_ARGS,
+                )
+            )
+        summary = collector.summary()
+        self.assertEqual(summary["sign"]["count"], 1)
+        self.assertEqual(summary["export"]["count"], 1)
+        self.assertGreater(summary["sign"]["wall_time"], 0)
+
+    def new_keyring_index(self, name):
+        return KeyringIndex(
+            homedir=CURRENT_TEST_DIR,
+            keyring_args=gpg_keyring_args(GPG_SIGN_COMMON_ARGS),
+            path=os.path.join(CURRENT_TEST_DIR, f"{name}.json"),
+        )
+
+    def test_keyring_index_lookup(self):
+        keyring_index = self.new_keyring_index("keyring_index_lookup")
+        self.assertEqual(keyring_index.lookup(TEST_KEY_NAME), self.key_fingerprint)
+        self.assertEqual(
+            keyring_index.lookup(self.key_fingerprint[-16:]), self.key_fingerprint
+        )
+        self.assertIsNone(keyring_index.lookup("non_existing_key"))
+
+        # Once the index is built, lookups don't run gpg
+        with collect_resources() as collector:
+            self.assertEqual(
+                get_key_fingerprint(
+                    TEST_KEY_NAME,
+                    key_generator=SignatureTypes.GPG,
+                    key_args=GPG_GET_FINGERPRINT_ARGS,
+                    keyring_index=keyring_index,
+                ),
+                self.key_fingerprint,
+            )
+        self.assertEqual(collector.summary(), {})
+        self.assertEqual(keyring_index.stats()["refreshes"], 1)
+
+    def test_keyring_index_export(self):
+        signature_key = export_signature_key(
+            TEST_KEY_NAME,
+            sign_command=SignatureTypes.GPG,
+            sign_args=GPG_SIGN_COMMON_ARGS,
+        )
+        keyring_index = self.new_keyring_index("keyring_index_export")
+        for _ in range(2):
+            self.assertEqual(
+                export_signature_key(
+                    TEST_KEY_NAME,
+                    sign_command=SignatureTypes.GPG,
+                    sign_args=GPG_SIGN_COMMON_ARGS,
+                    keyring_index=keyring_index,
+                ),
+                signature_key,
+            )
+
+        # The persisted index is reused by a new index of the same keyring
+        with collect_resources() as collector:
+            self.assertEqual(
+                export_signature_key(
+                    self.key_fingerprint,
+                    sign_command=SignatureTypes.GPG,
+                    sign_args=GPG_SIGN_COMMON_ARGS,
+                    keyring_index=self.new_keyring_index("keyring_index_export"),
+                ),
+                signature_key,
+            )
+        self.assertEqual(collector.summary(), {})
+
+    def test_keyring_index_invalidation(self):
+        keyring_index = self.new_keyring_index("keyring_index_invalidation")
+        key_name = f"{TEST_KEY_NAME}_invalidation"
+        self.assertIsNone(keyring_index.lookup(key_name))
+
+        self.assertTrue(
+            gen_key(
+                key_name,
+                key_generator=SignatureTypes.GPG,
+                key_args=GPG_GEN_KEY_ARGS,
+            )
+        )
+        key_fingerprint = keyring_index.lookup(key_name)
+        self.assertIsNotNone(key_fingerprint)
+        self.assertNotEqual(key_fingerprint, self.key_fingerprint)
+
+        self.assertTrue(
+            delete_key(
+                key_fingerprint,
+                delete_command=SignatureTypes.GPG,
+                delete_args=GPG_DELETE_ARGS,
+            )
+        )
+        self.assertIsNone(keyring_index.lookup(key_name))
+        self.assertEqual(keyring_index.lookup(TEST_KEY_NAME), self.key_fingerprint)
+
     def test_export_sign_key_output(self):
         # Export the signature key
         signature_key = export_signature_key(
@@ -22,6 +22,7 @@ from publish.signature import (
     delete_key,
     get_key_fingerprint,
     SignatureTypes,
+    SignatureFormats,
 )
 from publish.utils.io import exists, makedirs, remove, write
 from publish.cli.return_codes import SUCCESS, FILE_NOT_FOUND, SIGN_FAILURE
@@ -32,6 +33,7 @@ from tests.common import (
     TEST_FILE,
     NON_EXISTING_FILE,
     NON_EXISTING_KEY,
+    kill_gpg_agents,
 )
 
 TEST_NAME = os.path.basename(__file__).split(".")[0]
@@ -100,6 +102,8 @@ class TestSignCLI(unittest.TestCase):
             )
             is True
         )
+        # Stop the gpg-agents before their sockets are removed
+        kill_gpg_agents(CURRENT_TEST_DIR)
         # Remove the temporary directory and its contents
         assert remove(CURRENT_TEST_DIR, recursive=True) is True
         assert not exists(CURRENT_TEST_DIR)
@@ -176,6 +180,50 @@ class TestSignCLI(unittest.TestCase):
         self.assertTrue(exists(test_sign_file))
         self.assertTrue(exists(test_sign_file_output))
 
+    def test_sign_detached_signature_format(self):
+        test_sign_file = os.path.join(CURRENT_TEST_DIR, f"{TEST_FILE}-5")
+        self.assertTrue(write(test_sign_file, TEST_CONTENT))
+        self.assertTrue(exists(test_sign_file))
+
+        self.assertEqual(
+            main(
+                [
+                    test_sign_file,
+                    TEST_KEY_NAME,
+                    "--signature-args",
+                    GPG_SIGN_ARGS,
+                    "--signature-format",
+                    SignatureFormats.DETACHED.value,
+                ]
+            ),
+            SUCCESS,
+        )
+        self.assertTrue(exists(f"{test_sign_file}.sig"))
+        self.assertFalse(exists(f"{test_sign_file}.{SignatureTypes.GPG}"))
+
+    def test_sign_multiple_files(self):
+        test_sign_files = []
+        for index in range(4):
+            test_sign_file = os.path.join(CURRENT_TEST_DIR, f"{TEST_FILE}-many-{index}")
+            self.assertTrue(write(test_sign_file, f"{TEST_CONTENT}{index}"))
+            test_sign_files.append(test_sign_file)
+
+        self.assertEqual(
+            main(
+                test_sign_files
+                + [
+                    TEST_KEY_NAME,
+                    "--signature-args",
+                    GPG_SIGN_ARGS,
+                    "--jobs",
+                    "2",
+                ]
+            ),
+            SUCCESS,
+        )
+        for test_sign_file in test_sign_files:
+            self.assertTrue(exists(f"{test_sign_file}.{SignatureTypes.GPG}"))
+
     def test_sign_key_file_output(self):
         # Create a temporary file to sign
         test_sign_file = os.path.join(CURRENT_TEST_DIR, f"{TEST_FILE}-5")
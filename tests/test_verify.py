@@ -22,11 +22,17 @@ from publish.signature import (
     delete_key,
     get_key_fingerprint,
     verify_file,
+    verify_files,
+    verify_file_status,
     sign_file,
     SignatureTypes,
+    SignatureFormats,
+    KeyMatches,
 )
+from publish.cache import VerificationCache
 from publish.utils.io import makedirs, exists, remove, write
-from tests.common import TMP_TEST_PATH, TEST_CONTENT
+from publish.utils.job import collect_resources
+from tests.common import TMP_TEST_PATH, TEST_CONTENT, kill_gpg_agents
 
 TEST_NAME = os.path.basename(__file__).split(".")[0]
 CURRENT_TEST_DIR = os.path.join(TMP_TEST_PATH, TEST_NAME)
@@ -121,6 +127,8 @@ class TestGpGVerifyFile(unittest.TestCase):
             )
             is True
         )
+        # Stop the gpg-agents before their sockets are removed
+        kill_gpg_agents(CURRENT_TEST_DIR)
         # Remove the temporary directory and its contents
         assert remove(CURRENT_TEST_DIR, recursive=True) is True
         assert exists(CURRENT_TEST_DIR) is False
@@ -249,3 +257,261 @@ class TestGpGVerifyFile(unittest.TestCase):
             )
         )
         self.assertTrue(remove(output_signed_file))
+
+    def test_verify_detached_signature_pairing(self):
+        # Sign the file with a detached signature in the default .sig output
+        self.assertTrue(
+            sign_file(
+                TEST_VERIFY_FILE,
+                TEST_KEY_NAME,
+                sign_command=SignatureTypes.GPG,
+                sign_args=GPG_SIGN_ARGS,
+                signature_format=SignatureFormats.DETACHED,
+            )
+        )
+        output_signed_file = f"{TEST_VERIFY_FILE}.sig"
+        self.assertTrue(exists(output_signed_file))
+        # The data file is found next to the signature
+        self.assertTrue(
+            verify_file(
+                output_signed_file,
+                TEST_KEY_NAME,
+                verify_command=SignatureTypes.GPG,
+                verify_args=GPG_VERIFY_ARGS,
+            )
+        )
+        self.assertTrue(remove(output_signed_file))
+
+    def test_verify_files(self):
+        signed_files = []
+        for index in range(3):
+            test_file = f"{TEST_VERIFY_FILE}-batch-{index}"
+            self.assertTrue(write(test_file, f"{TEST_CONTENT}{index}"))
+            self.assertTrue(
+                sign_file(
+                    test_file,
+                    TEST_KEY_NAME,
+                    sign_command=SignatureTypes.GPG,
+                    sign_args=GPG_SIGN_ARGS,
+                )
+            )
+            signed_files.append(f"{test_file}.{SignatureTypes.GPG}")
+        # A detached signature is verified against its data file
+        detached_file = f"{TEST_VERIFY_FILE}-batch-detached"
+        self.assertTrue(write(detached_file, TEST_CONTENT))
+        self.assertTrue(
+            sign_file(
+                detached_file,
+                TEST_KEY_NAME,
+                sign_command=SignatureTypes.GPG,
+                sign_args=GPG_SIGN_ARGS,
+                signature_format=SignatureFormats.DETACHED,
+            )
+        )
+        signed_files.append(f"{detached_file}.sig")
+
+        # Two files per gpg invocation
+        results = verify_files(
+            signed_files,
+            TEST_KEY_NAME,
+            verify_command=SignatureTypes.GPG,
+            verify_args=GPG_VERIFY_ARGS,
+            chunk_size=2,
+        )
+        self.assertEqual(list(results), signed_files)
+        for result in results.values():
+            self.assertTrue(result["verified"])
+            self.assertEqual(len(result["signatures"]), 1)
+            self.assertEqual(result["signatures"][0]["status"], "GOODSIG")
+            self.assertEqual(result["signatures"][0]["uid"], TEST_KEY_NAME)
+            self.assertIsNotNone(result["signatures"][0]["fingerprint"])
+
+        # Tamper with the detached data and remove a signed file
+        self.assertTrue(write(detached_file, "tampered"))
+        self.assertTrue(remove(signed_files[1]))
+        results = verify_files(
+            signed_files,
+            TEST_KEY_NAME,
+            verify_command=SignatureTypes.GPG,
+            verify_args=GPG_VERIFY_ARGS,
+        )
+        self.assertTrue(results[signed_files[0]]["verified"])
+        self.assertFalse(results[signed_files[1]]["verified"])
+        self.assertTrue(results[signed_files[2]]["verified"])
+        self.assertFalse(results[signed_files[3]]["verified"])
+        self.assertEqual(results[signed_files[3]]["signatures"][0]["status"], "BADSIG")
+
+    def test_verify_verification_cache(self):
+        test_file = f"{TEST_VERIFY_FILE}-cache"
+        self.assertTrue(write(test_file, TEST_CONTENT))
+        self.assertTrue(
+            sign_file(
+                test_file,
+                TEST_KEY_NAME,
+                sign_command=SignatureTypes.GPG,
+                sign_args=GPG_SIGN_ARGS,
+                signature_format=SignatureFormats.DETACHED,
+            )
+        )
+        signature_file = f"{test_file}.sig"
+        verification_cache = VerificationCache(
+            path=os.path.join(CURRENT_TEST_DIR, "verify_file_cache.sqlite")
+        )
+        self.assertTrue(
+            verify_file(
+                signature_file,
+                TEST_KEY_NAME,
+                verify_command=SignatureTypes.GPG,
+                verify_args=GPG_VERIFY_ARGS,
+                verification_cache=verification_cache,
+            )
+        )
+        # The unchanged signature is verified without running gpg
+        with collect_resources() as collector:
+            self.assertTrue(
+                verify_file(
+                    signature_file,
+                    TEST_KEY_NAME,
+                    verify_command=SignatureTypes.GPG,
+                    verify_args=GPG_VERIFY_ARGS,
+                    verification_cache=verification_cache,
+                )
+            )
+        self.assertEqual(collector.summary(), {})
+        self.assertEqual(verification_cache.stats(), {"hits": 1, "misses": 1})
+
+        # Changing the signed data invalidates the cached verification
+        self.assertTrue(write(test_file, "tampered"))
+        for _ in range(2):
+            self.assertFalse(
+                verify_file(
+                    signature_file,
+                    TEST_KEY_NAME,
+                    verify_command=SignatureTypes.GPG,
+                    verify_args=GPG_VERIFY_ARGS,
+                    verification_cache=verification_cache,
+                )
+            )
+        self.assertEqual(verification_cache.stats(), {"hits": 1, "misses": 3})
+        verification_cache.close()
+
+    def test_verify_files_verification_cache(self):
+        signed_files = []
+        for index in range(2):
+            test_file = f"{TEST_VERIFY_FILE}-batch-cache-{index}"
+            self.assertTrue(write(test_file, f"{TEST_CONTENT}{index}"))
+            self.assertTrue(
+                sign_file(
+                    test_file,
+                    TEST_KEY_NAME,
+                    sign_command=SignatureTypes.GPG,
+                    sign_args=GPG_SIGN_ARGS,
+                )
+            )
+            signed_files.append(f"{test_file}.{SignatureTypes.GPG}")
+        verification_cache = VerificationCache(
+            path=os.path.join(CURRENT_TEST_DIR, "verify_files_cache.sqlite")
+        )
+        results = verify_files(
+            signed_files,
+            TEST_KEY_NAME,
+            verify_command=SignatureTypes.GPG,
+            verify_args=GPG_VERIFY_ARGS,
+            verification_cache=verification_cache,
+        )
+        with collect_resources() as collector:
+            cached_results = verify_files(
+                signed_files,
+                TEST_KEY_NAME,
+                verify_command=SignatureTypes.GPG,
+                verify_args=GPG_VERIFY_ARGS,
+                verification_cache=verification_cache,
+            )
+        self.assertEqual(collector.summary(), {})
+        self.assertEqual(cached_results, results)
+        for result in cached_results.values():
+            self.assertTrue(result["verified"])
+        verification_cache.close()
+
+    def test_verification_cache_expiry_and_eviction(self):
+        verification_cache = VerificationCache(
+            path=os.path.join(CURRENT_TEST_DIR, "verification_cache.sqlite"),
+            max_entries=2,
+        )
+        result = {"verified": True, "signatures": [], "error": None}
+        for key in (b"first", b"second", b"third"):
+            self.assertTrue(verification_cache.set(key, result))
+        # The least recently used verification is evicted
+        self.assertIsNone(verification_cache.get(b"first"))
+        self.assertEqual(verification_cache.get(b"second"), result)
+        self.assertEqual(verification_cache.get(b"third"), result)
+
+        verification_cache.ttl = -1
+        self.assertIsNone(verification_cache.get(b"second"))
+        self.assertTrue(verification_cache.clear())
+        verification_cache.close()
+
+    def test_verify_required_keys(self):
+        second_key_name = f"{TEST_KEY_NAME}-second"
+        self.assertTrue(
+            gen_key(
+                second_key_name,
+                key_generator=SignatureTypes.GPG,
+                key_args=GPG_GEN_KEY_ARGS,
+            )
+        )
+        second_key_fingerprint = get_key_fingerprint(
+            second_key_name,
+            key_generator=SignatureTypes.GPG,
+            key_args=GPG_GET_FINTERPRINT_ARGS,
+        )
+        self.assertIsNotNone(second_key_fingerprint)
+
+        # Sign with both keys in a single pass
+        self.assertTrue(
+            sign_file(
+                TEST_VERIFY_FILE,
+                [TEST_KEY_NAME, second_key_name],
+                sign_command=SignatureTypes.GPG,
+                sign_args=GPG_SIGN_ARGS,
+                signature_format=SignatureFormats.DETACHED,
+            )
+        )
+        output_signed_file = f"{TEST_VERIFY_FILE}.sig"
+        result = verify_file_status(
+            output_signed_file,
+            TEST_KEY_NAME,
+            verify_command=SignatureTypes.GPG,
+            verify_args=GPG_VERIFY_ARGS,
+        )
+        self.assertTrue(result["verified"])
+        self.assertEqual(len(result["signatures"]), 2)
+
+        # The keys can be required by user id, which is matched case-insensitively,
+        # or fingerprint
+        for required_keys, match, expected in [
+            ([TEST_KEY_NAME, second_key_fingerprint], KeyMatches.ALL, True),
+            ([TEST_KEY_NAME.upper()], KeyMatches.ALL, True),
+            ([TEST_KEY_NAME, "non_existing_key"], KeyMatches.ALL, False),
+            ([TEST_KEY_NAME, "non_existing_key"], KeyMatches.ANY, True),
+            (["non_existing_key"], KeyMatches.ANY, False),
+        ]:
+            self.assertEqual(
+                verify_file(
+                    output_signed_file,
+                    TEST_KEY_NAME,
+                    verify_command=SignatureTypes.GPG,
+                    verify_args=GPG_VERIFY_ARGS,
+                    required_keys=required_keys,
+                    required_keys_match=match,
+                ),
+                expected,
+            )
+        self.assertTrue(remove(output_signed_file))
+        self.assertTrue(
+            delete_key(
+                second_key_fingerprint,
+                delete_command=SignatureTypes.GPG,
+                delete_args=GPG_DELETE_ARGS,
+            )
+        )
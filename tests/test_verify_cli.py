@@ -32,9 +32,9 @@ from tests.common import (
     TEST_CONTENT,
     NON_EXISTING_KEY,
     NON_EXISTING_FILE,
+    kill_gpg_agents,
 )
 
-
 TEST_NAME = os.path.basename(__file__).split(".")[0]
 CURRENT_TEST_DIR = os.path.join(TMP_TEST_PATH, TEST_NAME)
 TEST_KEY_NAME = f"{TEST_NAME}_key"
@@ -87,6 +87,8 @@ class TestVerifyCLI(unittest.TestCase):
 
     @classmethod
     def tearDownClass(cls):
+        # Stop the gpg-agents before their sockets are removed
+        kill_gpg_agents(CURRENT_TEST_DIR)
         assert remove(CURRENT_TEST_DIR, recursive=True) is True
         assert not exists(CURRENT_TEST_DIR)
 
@@ -158,6 +160,34 @@ class TestVerifyCLI(unittest.TestCase):
             SUCCESS,
         )
 
+    def test_verify_success_with_tree_checksum(self):
+        test_verify_file = f"{TEST_VERIFY_FILE}-tree"
+        self.assertTrue(write(test_verify_file, TEST_CONTENT))
+        self.assertTrue(
+            sign_file(test_verify_file, TEST_KEY_NAME, sign_args=GPG_SIGN_ARGS)
+        )
+        self.assertTrue(
+            write_checksum_file(test_verify_file, algorithm=ChecksumTypes.SHA256_TREE)
+        )
+        checksum_file = f"{test_verify_file}.{ChecksumTypes.SHA256_TREE}"
+        self.assertTrue(exists(checksum_file))
+
+        test_signed_file = f"{test_verify_file}.{SignatureTypes.GPG}"
+        self.assertEqual(
+            main(
+                [
+                    test_signed_file,
+                    TEST_KEY_NAME,
+                    "--verify-args",
+                    GPG_VERIFY_ARGS,
+                    "--with-checksum",
+                    "--checksum-algorithm",
+                    ChecksumTypes.SHA256_TREE,
+                ]
+            ),
+            SUCCESS,
+        )
+
     def test_verify_checksum_failure(self):
         test_verify_file = f"{TEST_VERIFY_FILE}-5"
         self.assertTrue(write(test_verify_file, TEST_CONTENT))
@@ -271,3 +301,67 @@ class TestVerifyCLI(unittest.TestCase):
         self.assertFalse(exists(test_verify_file))
         self.assertTrue(remove(test_signed_file))
         self.assertFalse(exists(test_signed_file))
+
+    def test_verify_multiple_files(self):
+        signed_files = []
+        for index in range(3):
+            test_verify_file = f"{TEST_VERIFY_FILE}-batch-{index}"
+            self.assertTrue(write(test_verify_file, f"{TEST_CONTENT}{index}"))
+            self.assertTrue(
+                sign_file(test_verify_file, TEST_KEY_NAME, sign_args=GPG_SIGN_ARGS)
+            )
+            signed_files.append(f"{test_verify_file}.{SignatureTypes.GPG}")
+
+        self.assertEqual(
+            main(
+                signed_files
+                + [
+                    TEST_KEY_NAME,
+                    "--verify-args",
+                    GPG_VERIFY_ARGS,
+                    "--batch-size",
+                    "2",
+                ]
+            ),
+            SUCCESS,
+        )
+
+        # A file that is not signed fails the batch
+        self.assertEqual(
+            main(
+                signed_files
+                + [f"{TEST_VERIFY_FILE}-batch-0", TEST_KEY_NAME]
+                + ["--verify-args", GPG_VERIFY_ARGS]
+            ),
+            VERIFY_FAILURE,
+        )
+
+    def test_verify_required_key(self):
+        test_verify_file = f"{TEST_VERIFY_FILE}-required-key"
+        self.assertTrue(write(test_verify_file, TEST_CONTENT))
+        self.assertTrue(
+            sign_file(test_verify_file, TEST_KEY_NAME, sign_args=GPG_SIGN_ARGS)
+        )
+        test_signed_file = f"{test_verify_file}.{SignatureTypes.GPG}"
+
+        verify_args = [
+            test_signed_file,
+            TEST_KEY_NAME,
+            "--verify-args",
+            GPG_VERIFY_ARGS,
+        ]
+        self.assertEqual(main(verify_args + ["--required-key", TEST_KEY_NAME]), SUCCESS)
+        self.assertEqual(
+            main(
+                verify_args
+                + ["--required-key", TEST_KEY_NAME, "--required-key", NON_EXISTING_KEY]
+            ),
+            VERIFY_FAILURE,
+        )
+        self.assertEqual(
+            main(
+                verify_args
+                + ["-rk", TEST_KEY_NAME, "-rk", NON_EXISTING_KEY, "-rkm", "any"]
+            ),
+            SUCCESS,
+        )